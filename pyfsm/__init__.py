@@ -1,3 +1,14 @@
 from .pyfsm import *
+from .pyfsmasync import *
+from .pyfsmdispatch import *
+from .pyfsmsession import *
+from .pyfsmshard import *
+from .pyfsmtrace import *
+from .pyfsmreplay import *
+from .pyfsmjournal import *
+from .pyfsmmetrics import *
+from .pyfsmshm import *
+from .pyfsmstats import *
+from .pyfsmprofile import *
 from .pyfsmgraph import *
 from .pyfsmview import *
@@ -57,10 +57,20 @@ try:
     import numpy as np 
     import warnings
     import re 
+    import hashlib
+    import itertools
+    import random
+    import time
+    import math
+    import functools
+    import bisect
+    import types
+    import inspect
     import pandas as pd
     from collections import deque
     from dataclasses import dataclass
     from dataclasses import field
+    import dataclasses
     from typing import Any
     from typing import List
     from typing import Union, Callable
@@ -69,8 +79,18 @@ try:
     from typing import Set
     from typing import Tuple
     from typing import Dict
+    from typing import NamedTuple
+    from typing import Iterable
+    from typing import Iterator
+    from typing import AsyncIterator
     from queue import Queue
     from threading import Event
+    from threading import Lock
+    from threading import Condition
+    from concurrent.futures import Executor
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import wait
+    from concurrent.futures import TimeoutError as FutureTimeoutError
 except Exception as e: 
     logging.error(e)
     raise e
@@ -146,6 +166,15 @@ class FSMSysMgs:
     def error_non_disjoint_transitions(state:str, transitions:str)->str:
        return f"Non-disjoint transitions at: {state}\n{transitions}\n"
     
+    @staticmethod
+    def warning_overlapping_transitions(state:str, transitions:str, inputs:str)->str:
+        return f"Overlapping transitions at: {state}\n{transitions} with inputs {inputs}\n"
+
+    @staticmethod
+    def error_certificate_mismatch(expected:str, found:str)->str:
+        return ("Disjointness certificate does not belong to this machine definition.\n"
+                f"Expected fingerprint {expected}, found {found}\n")
+
     @staticmethod
     def error_transition_eval_error(state: str, transition: str, eval_fcnexp : str = '')->str:
         msg = 'Runtime error evaluating transition function\n'+\
@@ -188,6 +217,25 @@ class FSMSysMgs:
     def warning_on_state_action(state:str)->str:
         return f'Warning: Undefined states on state action {state}'
 
+    @staticmethod
+    def warning_time_budget_overrun(kind:str, name:str, state:str, transition:Optional[str], 
+                                    elapsed:float, budget:float)->str:
+        return f'Time budget overrun: {kind} {name} on state {state} ' +\
+            (f'transition {transition} ' if transition else '') +\
+            f'took {elapsed*1000:.3f} ms, budget {budget*1000:.3f} ms'
+
+    @staticmethod
+    def error_action_timeout(prefix:str, budget:float)->str:
+        return f'{prefix} timeout, not finished after {budget*1000:.3f} ms'
+
+    @staticmethod
+    def error_session_callable(kind:str, name:str, reason:str)->str:
+        return f'{kind} {name} can not run on sessions: {reason}'
+
+    @staticmethod
+    def warning_state_migration(state:str, new_state:str)->str:
+        return f'State {state} does not exist on new definition, migrated to {new_state}'
+
     @staticmethod
     def warning_on_transition_action(t:str)->str:
         return f'Warning: undefined transitions on transition action {t}'
@@ -240,6 +288,745 @@ class FSMUnknownState(FSMInvalidSyntax):
 class FSMUnknownTransition(FSMInvalidSyntax):
     pass 
 
+class FSMInvalidCertificate(FSMException):
+    pass
+
+@dataclass
+class fsm_disjoint_certificate:
+    """
+    Result of fsm.certify_disjoint(). A machine holding an exhaustive 
+    certificate without overlaps is allowed to run with first-match semantics 
+    on step(). Sampled certificates only report overlaps found.
+
+    :ivar fingerprint: Fingerprint of the machine definition that was verified.
+    :ivar exhaustive: True if the whole input domain was enumerated, False if randomly sampled.
+    :ivar samples: Number of input assignments evaluated on each state.
+    :ivar overlaps: List of (state, transitions, inputs) found true at the same time.
+    """
+    fingerprint : str
+    exhaustive : bool
+    samples : int
+    overlaps : List[Tuple[str, Tuple[str, ...], Dict[str, Any]]] = field(default_factory=list)
+
+    @property
+    def certified(self)->bool:
+        return self.exhaustive and len(self.overlaps) == 0
+
+@dataclass
+class fsm_step_context:
+    """
+    Evaluation context of one step() call. Holds the result of every named 
+    condition and shared sub-terms already evaluated during current step, 
+    so each of them is computed at most once per step. It is cleared at the
+    end of every step, once all evaluations of the step are finished.
+
+    :ivar conditions: Results of evaluated conditions by name.
+    :ivar terms: Values of evaluated shared sub-terms by name.
+    """
+    conditions : Dict[str, bool] = field(default_factory=dict)
+    terms : Dict[str, Any] = field(default_factory=dict)
+
+    def clear(self)->None:
+        self.conditions.clear()
+        self.terms.clear()
+
+@dataclass
+class fsm_condition_cache:
+    """
+    Caching policy and cached result of one condition.
+    Cached value is reused while it is younger than ttl seconds and
+    max_age_steps steps. If both are None, it is reused until invalidated.
+
+    :ivar ttl: Time to live of cached value in seconds.
+    :ivar max_age_steps: Maximum age of cached value in steps.
+    :ivar value: Cached value, None if not cached.
+    :ivar timestamp: Time when value was evaluated.
+    :ivar step: Step when value was evaluated.
+    :ivar hits: Number of evaluations served from cache.
+    :ivar misses: Number of evaluations of the condition.
+    :ivar invalidations: Number of explicit invalidations.
+    """
+    ttl : Optional[float] = None
+    max_age_steps : Optional[int] = None
+    value : Optional[bool] = None
+    timestamp : float = 0.0
+    step : int = 0
+    hits : int = 0
+    misses : int = 0
+    invalidations : int = 0
+
+    def valid(self, now:float, step:int)->bool:
+        return self.value is not None and \
+            (self.ttl is None or now - self.timestamp < self.ttl) and \
+            (self.max_age_steps is None or step - self.step < self.max_age_steps)
+
+    def store(self, value:bool, now:float, step:int)->None:
+        self.value = value
+        self.timestamp = now
+        self.step = step
+        self.misses += 1
+
+    def invalidate(self)->None:
+        self.value = None
+        self.invalidations += 1
+
+    def discard(self)->None:
+        self.value = None
+
+@dataclass
+class fsm_time_budget:
+    """
+    Time budget of a condition or action, see fsm.set_time_budget().
+
+    :ivar budget: Seconds the callable is expected to last at most.
+    :ivar offload: If True (actions only), it runs on fsm.action_executor and 
+                   is abandoned when the budget expires.
+    :ivar overruns: Number of overruns.
+    """
+    budget : float
+    offload : bool = False
+    overruns : int = 0
+
+@dataclass(frozen=True)
+class fsm_overrun:
+    """
+    Report of a condition or action exceeding its time budget.
+
+    :ivar kind: 'condition', 'on_state', 'on_entry', 'on_exit' or 'on_transition'.
+    :ivar name: Transition or state name the callable belongs to.
+    :ivar state: Current state name when it was called.
+    :ivar transition: Transition being performed, None for conditions and on_state actions.
+    :ivar step: Step number.
+    :ivar elapsed: Measured seconds, the budget for abandoned (timed out) actions.
+    :ivar budget: Budget in seconds.
+    :ivar timeout: True if the action was offloaded and abandoned.
+    """
+    kind : str
+    name : str
+    state : str
+    transition : Optional[str]
+    step : int
+    elapsed : float
+    budget : float
+    timeout : bool = False
+
+class fsm_snapshot(NamedTuple):
+    """
+    Immutable view of a machine at the end of a step (see fsm.snapshot).
+
+    :ivar state: Current state name.
+    :ivar transition: Name of the transition performed on the step, None if none.
+    :ivar step: Value of step_count.
+    :ivar timestamp: Clock time (monotonic) of the transition, of the read if 
+                     no transition was performed on the step.
+    """
+    state : Optional[str]
+    transition : Optional[str]
+    step : int
+    timestamp : float
+
+class fsm_transition(NamedTuple):
+    """
+    Transition yielded by fsm.iter_transitions().
+
+    :ivar step: Index of the input record (row) that produced it.
+    :ivar origin: Origin state name.
+    :ivar transition: Transition name.
+    :ivar dest: Destination state name.
+    """
+    step : int
+    origin : str
+    transition : str
+    dest : str
+
+@dataclass
+class fsm_run:
+    """
+    Result of fsm.run_over(): state sequence and transition log as arrays.
+
+    :ivar states: State index after every input row.
+    :ivar steps: Row of every transition.
+    :ivar transitions: Transition id of every transition (see fsm.transition_ids).
+    :ivar origins: Origin state index of every transition.
+    :ivar dests: Destination state index of every transition.
+    :ivar state_names: Names of state indexes.
+    :ivar transition_names: Names of transition ids.
+    """
+    states : np.ndarray
+    steps : np.ndarray
+    transitions : np.ndarray
+    origins : np.ndarray
+    dests : np.ndarray
+    state_names : List[str]
+    transition_names : List[str]
+
+    def states_frame(self)->pd.DataFrame:
+        """
+        State sequence as a DataFrame with a categorical state column.
+
+        """
+        return pd.DataFrame({'state': pd.Categorical.from_codes(self.states, categories=self.state_names)})
+
+    def transitions_frame(self)->pd.DataFrame:
+        """
+        Transition log as a DataFrame: step, and origin, dest, transition as categoricals.
+
+        """
+        return pd.DataFrame({
+            'step': self.steps,
+            'origin': pd.Categorical.from_codes(self.origins, categories=self.state_names),
+            'dest': pd.Categorical.from_codes(self.dests, categories=self.state_names),
+            'transition': pd.Categorical.from_codes(self.transitions, categories=self.transition_names)})
+
+class fsm_columns:
+    """
+    Input columns seen as `self` by conditions evaluated column-wise (see 
+    fsm.truth_table()). Every column is a NumPy array with one value per step.
+    Other attributes are read from the machine, and term() evaluates shared 
+    sub-terms column-wise.
+    """
+    def __init__(self, owner:'fsm', columns:Any) -> None:
+        if isinstance(columns, np.ndarray) and columns.dtype.names is not None:
+            columns = {name: columns[name] for name in columns.dtype.names}
+        self.__dict__.update({name: np.asarray(col) for name, col in columns.items()})
+        lengths = {len(col) for col in self.__dict__.values()}
+        if len(lengths) != 1:
+            raise FSMException('Input columns must have the same length')
+        self._owner = owner
+        self._terms : Dict[str, Any] = {}
+        self._length = lengths.pop()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getattr__(self, name:str) -> Any:
+        return getattr(self.__dict__['_owner'], name)
+
+    def term(self, name:str) -> Any:
+        if name not in self._terms:
+            fterm = self._owner.terms[name]
+            if not isinstance(fterm, str):
+                raise FSMTransitionEvalError(f'Sub-term {name} can not be evaluated on columns')
+            self._terms[name] = eval(fterm, globals(), {'self': self})
+        return self._terms[name]
+
+class fsm_timer:
+    """
+    Timer scheduled on a timing_wheel.
+
+    :ivar deadline: Expiration time.
+    :ivar tick: Expiration tick.
+    :ivar callback: Function called without arguments on expiration.
+    :ivar active: True while scheduled.
+    """
+    __slots__ = ('deadline', 'tick', 'callback', 'active', 'level', 'slot')
+
+    def __init__(self, deadline:float, tick:int, callback:Callable[[], Any]) -> None:
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.active = True
+        self.level = 0
+        self.slot = 0
+
+class timing_wheel:
+    """
+    Hierarchical timing wheel. Schedules and cancels timers in O(1), and 
+    fires expired timers when advanced to current time. Time is divided into
+    ticks of resolution seconds; every level has 2**slot_bits slots and 
+    covers 2**slot_bits times the span of the previous one. Timers beyond the 
+    last level wait on an overflow bucket. Empty spans are skipped, so 
+    advancing over idle time costs O(levels).
+
+    It is thread safe, callbacks are called outside the lock by the thread 
+    calling advance().
+
+    :ivar resolution: Tick length in seconds.
+    :ivar levels: Number of levels.
+    :ivar slot_bits: Log2 of slots per level.
+    :ivar clock: Function returning current time in seconds.
+    """
+
+    def __init__(self, resolution:float=0.001, levels:int=4, slot_bits:int=8,
+                 clock:Optional[Callable[[], float]]=None) -> None:
+        self.resolution = resolution
+        self.levels = levels
+        self.slot_bits = slot_bits
+        self.clock = clock if clock is not None else time.monotonic
+        self._mask = (1 << slot_bits) - 1
+        self._slots : List[List[Dict[fsm_timer, None]]] = \
+            [[{} for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._counts = [0]*levels
+        self._overflow : Dict[fsm_timer, None] = {}
+        self._len = 0
+        self._lock = Lock()
+        self._current = math.floor(self.clock()/resolution)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _place(self, timer:fsm_timer) -> None:
+        tick, current, bits = timer.tick, self._current, self.slot_bits
+        for level in range(self.levels):
+            shift = bits*(level+1)
+            if (tick >> shift) == (current >> shift):
+                timer.level = level
+                timer.slot = (tick >> (bits*level)) & self._mask
+                self._slots[level][timer.slot][timer] = None
+                self._counts[level] += 1
+                return
+        timer.level = self.levels
+        self._overflow[timer] = None
+
+    def schedule(self, deadline:float, callback:Callable[[], Any]) -> fsm_timer:
+        """
+        Schedules callback at absolute time deadline.
+
+        :param deadline: Expiration time, same time base as clock.
+        :type deadline: float
+        :param callback: Function called without arguments on expiration.
+        :type callback: Callable[[], Any]
+        :return: Timer, needed to cancel it.
+        :rtype: fsm_timer
+
+        """
+        with self._lock:
+            tick = max(math.ceil(deadline/self.resolution), self._current + 1)
+            timer = fsm_timer(deadline, tick, callback)
+            self._place(timer)
+            self._len += 1
+        return timer
+
+    def schedule_after(self, delay:float, callback:Callable[[], Any]) -> fsm_timer:
+        """
+        Schedules callback delay seconds after current clock time.
+
+        """
+        return self.schedule(self.clock() + delay, callback)
+
+    def cancel(self, timer:fsm_timer) -> None:
+        """
+        Cancels a scheduled timer. Nothing is done if it already expired.
+
+        :param timer: Timer returned by schedule().
+        :type timer: fsm_timer
+        :return: None
+        :rtype: None
+
+        """
+        with self._lock:
+            if not timer.active:
+                return
+            if timer.level < self.levels:
+                del self._slots[timer.level][timer.slot][timer]
+                self._counts[timer.level] -= 1
+            else:
+                del self._overflow[timer]
+            timer.active = False
+            self._len -= 1
+
+    def advance(self, now:Optional[float]=None) -> int:
+        """
+        Advances the wheel to time now and calls callbacks of expired timers.
+
+        :param now: Current time, clock() if None.
+        :type now: None or float
+        :return: Number of expired timers
+        :rtype: int
+
+        """
+        if now is None:
+            now = self.clock()
+        target = math.floor(now/self.resolution + 1e-9)
+        bits = self.slot_bits
+        expired = []
+        with self._lock:
+            while self._current < target:
+                if self._len == 0:
+                    self._current = target
+                    break
+                # Skip spans where lower levels are empty, up to next boundary of the first busy level
+                nxt = self._current + 1
+                for level in range(self.levels):
+                    if self._counts[level]:
+                        break
+                    shift = bits*(level+1)
+                    nxt = ((self._current >> shift) + 1) << shift
+                self._current = current = min(nxt, target)
+                # Cascade timers of upper levels reaching their window
+                if self._overflow and current & ((1 << (bits*self.levels)) - 1) == 0:
+                    timers = list(self._overflow)
+                    self._overflow.clear()
+                    for timer in timers:
+                        self._place(timer)
+                for level in range(self.levels-1, 0, -1):
+                    if current & ((1 << (bits*level)) - 1) == 0:
+                        bucket = self._slots[level][(current >> (bits*level)) & self._mask]
+                        if bucket:
+                            timers = list(bucket)
+                            bucket.clear()
+                            self._counts[level] -= len(timers)
+                            for timer in timers:
+                                self._place(timer)
+                bucket = self._slots[0][current & self._mask]
+                if bucket:
+                    expired.extend(bucket)
+                    self._counts[0] -= len(bucket)
+                    self._len -= len(bucket)
+                    bucket.clear()
+            for timer in expired:
+                timer.active = False
+        for timer in expired:
+            timer.callback()
+        return len(expired)
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Gets the time at which next timer expires: its deadline rounded up 
+        to wheel resolution.
+
+        :return: Expiration time or None if there are no timers.
+        :rtype: None or float
+
+        """
+        with self._lock:
+            if self._len == 0:
+                return None
+            ticks = [t.tick for t in self._overflow]
+            for level in range(self.levels):
+                if self._counts[level] == 0:
+                    continue
+                first = ((self._current >> (self.slot_bits*level)) & self._mask) + (level == 0)
+                for bucket in self._slots[level][first:]:
+                    if bucket:
+                        ticks.append(min(t.tick for t in bucket))
+                        break
+            return min(ticks)*self.resolution
+
+class fsm_clock:
+    """
+    Wall clock, time source of the runtime: run loops, timed transitions,
+    condition caches and history timestamps.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds:float) -> None:
+        time.sleep(seconds)
+
+class virtual_clock(fsm_clock):
+    """
+    Discrete-event virtual clock for faster than real time simulations. 
+    Time only moves when sleep(), advance_to() or run() are called, and it 
+    jumps straight to the next due timer of its own timing wheel, so 
+    simulations are fast and deterministic.
+
+    :ivar now: Current virtual time in seconds.
+    :ivar epoch: Wall time (time.time() like) at virtual time 0.
+    :ivar wheel: Timing wheel running on virtual time.
+
+    Example:
+
+        clock = virtual_clock()
+        f.set_clock(clock)
+        clock.run([f], until=24*3600, period=1.0)  # a day, stepping every second
+
+    """
+
+    def __init__(self, start:float = 0.0, epoch:float = 0.0, resolution:float = 0.001) -> None:
+        self.now = start
+        self.epoch = epoch
+        self.wheel = timing_wheel(resolution=resolution, clock=self.monotonic)
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.epoch + self.now
+
+    def sleep(self, seconds:float) -> None:
+        self.advance_to(self.now + seconds)
+
+    def advance_to(self, t:float) -> None:
+        """
+        Moves virtual time to t, expiring due timers of wheel in order at 
+        their own expiration time.
+
+        :param t: New virtual time.
+        :type t: float
+        :return: None
+        :rtype: None
+
+        """
+        while (deadline := self.wheel.next_deadline()) is not None and deadline <= t:
+            self.now = max(self.now, deadline)
+            self.wheel.advance(self.now)
+        self.now = max(self.now, t)
+
+    def run(self, machines:List['fsm'], until:float, period:Optional[float] = None) -> int:
+        """
+        Runs a discrete-event simulation until virtual time until: jumps to 
+        the next event, which is either the next due timer or the next 
+        periodic tick, and executes one step on every machine. Machines 
+        also step once at current time, when the simulation starts.
+
+        :param machines: Machines to step, their clock should be this one.
+        :type machines: List[fsm]
+        :param until: Virtual time to stop at.
+        :type until: float
+        :param period: Step period, if None machines only step on timer expiration.
+        :type period: None or float
+        :return: Number of steps executed
+        :rtype: int
+
+        """
+        steps = 0
+        next_tick = self.now if period is not None else None
+        if next_tick is None:
+            for f in machines:
+                f.step()
+            steps += len(machines)
+        while True:
+            events = [e for e in (self.wheel.next_deadline(), next_tick) if e is not None]
+            if len(events) == 0 or (t := min(events)) > until:
+                break
+            self.advance_to(t)
+            for f in machines:
+                f.step()
+            steps += len(machines)
+            if next_tick is not None and t >= next_tick:
+                next_tick += period
+        self.advance_to(until)
+        return steps
+
+class fixed_rate_scheduler:
+    """
+    Drift-compensated fixed-rate tick scheduler. Ticks target absolute 
+    deadlines start + k*period, so step duration and sleep jitter do not 
+    accumulate. When a tick is late by more than one period (overrun):
+
+        - 'skip' policy drops missed ticks and realigns to the deadline grid.
+        - 'catch_up' policy runs missed ticks back to back without sleeping.
+
+    :ivar period: Tick period in seconds.
+    :ivar clock: Time source.
+    :ivar policy: Overrun policy, 'skip' or 'catch_up'.
+    :ivar ticks: Number of ticks.
+    :ivar overruns: Number of ticks started after the next deadline was due.
+    :ivar missed: Number of ticks dropped by 'skip' policy.
+    :ivar lateness_max: Maximum delay of a tick from its deadline.
+
+    Example:
+
+        scheduler = fixed_rate_scheduler(0.01)
+        while running:
+            f.step()
+            scheduler.wait()
+
+    """
+    SKIP : str = 'skip'
+    CATCH_UP : str = 'catch_up'
+
+    def __init__(self, period:float, clock:Optional[fsm_clock] = None, policy:str = 'skip') -> None:
+        if policy not in (self.SKIP, self.CATCH_UP):
+            raise ValueError(f'Unknown overrun policy {policy}')
+        self.period = period
+        self.clock = clock if clock is not None else default_clock
+        self.policy = policy
+        self.restart()
+
+    def restart(self, period:Optional[float] = None) -> None:
+        """
+        Restarts the deadline grid from current time and clears statistics.
+
+        :param period: New period, unchanged if None.
+        :type period: None or float
+        :return: None
+        :rtype: None
+
+        """
+        if period is not None:
+            self.period = period
+        self._next = self.clock.monotonic() + self.period
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.lateness_max = 0.0
+        self._lateness_mean = 0.0
+        self._lateness_m2 = 0.0
+
+    def wait(self) -> int:
+        """
+        Waits until the deadline of next tick.
+
+        :return: Number of ticks dropped before this one ('skip' policy).
+        :rtype: int
+
+        """
+        if (remaining := self.remaining()) > 0:
+            self.clock.sleep(remaining)
+        return self.tick()
+
+    def remaining(self) -> float:
+        """
+        Gets time left to the deadline of next tick, negative if overdue.
+        Useful to wait by other means than clock.sleep(), then call tick().
+
+        """
+        return self._next - self.clock.monotonic()
+
+    def tick(self) -> int:
+        """
+        Starts next tick: updates statistics and the deadline grid.
+
+        :return: Number of ticks dropped before this one ('skip' policy).
+        :rtype: int
+
+        """
+        now = self.clock.monotonic()
+        dropped = 0
+        if now - self._next >= self.period:
+            self.overruns += 1
+            if self.policy == self.SKIP:
+                dropped = int((now - self._next) // self.period)
+                self.missed += dropped
+                self._next += dropped*self.period
+        lateness = max(now - self._next, 0.0)
+        self.ticks += 1
+        self.lateness_max = max(self.lateness_max, lateness)
+        delta = lateness - self._lateness_mean
+        self._lateness_mean += delta/self.ticks
+        self._lateness_m2 += delta*(lateness - self._lateness_mean)
+        self._next += self.period
+        return dropped
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Gets scheduling statistics.
+
+        :return: ticks, overruns, missed, lateness mean, max and standard deviation (jitter) in seconds.
+        :rtype: Dict[str, float]
+
+        """
+        jitter = math.sqrt(self._lateness_m2/(self.ticks - 1)) if self.ticks > 1 else 0.0
+        return {'ticks': self.ticks, 'overruns': self.overruns, 'missed': self.missed,
+                'lateness_mean': self._lateness_mean, 'lateness_max': self.lateness_max,
+                'jitter': jitter}
+
+default_clock = fsm_clock()
+default_timing_wheel = timing_wheel(clock=default_clock.monotonic)
+
+class fsm_timeout:
+    """
+    Condition of a timed transition, see fsm.add_timeout(). It is true once 
+    its timer expired while the machine stays on the state it was armed.
+    """
+    __slots__ = ('owner', 'name')
+
+    def __init__(self, owner:'fsm', name:str) -> None:
+        self.owner = owner
+        self.name = name
+
+    def __call__(self) -> bool:
+        return self.name in self.owner.expired_timeouts
+
+def _hash_code(h:Any, code:types.CodeType)->None:
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(h, const)
+        else:
+            h.update(repr(const).encode('utf-8'))
+
+def _hash_callable(h:Any, value:Any)->None:
+    """
+    Feeds hash h with what a condition or sub-term computes: expression text,
+    or qualified name, bytecode and constants of functions.
+
+    """
+    if isinstance(value, str):
+        h.update(value.encode('utf-8'))
+    elif isinstance(value, fsm_timeout):
+        h.update(f'timeout:{value.name}'.encode('utf-8'))
+    elif isinstance(value, functools.partial):
+        _hash_callable(h, value.func)
+        h.update(repr((value.args, value.keywords)).encode('utf-8'))
+    else:
+        func = getattr(value, '__func__', value)
+        if not hasattr(func, '__code__'):
+            func = getattr(type(value), '__call__', func)
+        h.update((getattr(func, '__qualname__', None) or type(value).__qualname__).encode('utf-8'))
+        if (code := getattr(func, '__code__', None)) is not None:
+            _hash_code(h, code)
+
+def write_frame(frame:pd.DataFrame, path:str, format:Optional[str] = None)->None:
+    """
+    Writes a DataFrame exported by pyfsm (history, traces, statistics) to a
+    Parquet or Feather file, keeping categorical columns as dictionaries. 
+    Requires pyarrow.
+
+    :param frame: Table to write.
+    :type frame: pd.DataFrame
+    :param path: File name.
+    :type path: str
+    :param format: 'parquet' or 'feather', from path extension if None.
+    :type format: None or str
+    :return: None
+    :rtype: None
+
+    """
+    if format is None:
+        format = 'feather' if path.endswith(('.feather', '.arrow')) else 'parquet'
+    try:
+        if format == 'parquet':
+            frame.to_parquet(path, index=False)
+        elif format == 'feather':
+            frame.reset_index(drop=True).to_feather(path)
+        else:
+            raise FSMUnknownException(f'Unknown format {format}, use parquet or feather')
+    except ImportError as e:
+        logger.error(e)
+        raise FSMUnknownException(f'Writing {format} files requires pyarrow: {e}')
+
+async def _as_async_iterable(items:Iterable[Any])->AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+def _action_error(kind:str, name:str)->Tuple[str, type]:
+    """
+    Gets error message prefix and exception class of an action, given its
+    kind ('on_state', 'on_entry', 'on_exit', 'on_transition') and name.
+
+    """
+    if kind == 'on_state':
+        return (f"On State {name}", FSMOnEntryActionError)
+    elif kind == 'on_transition':
+        return (f'{name}:', FSMOnTransitionActionError)
+    elif kind == 'on_exit':
+        return (f'{name}:', FSMOnExitActionError)
+    return (f'{name}:', FSMOnEntryActionError)
+
+class fsm_wakeup_event(Event):
+    """
+    threading.Event calling its listeners when set, so code waiting on 
+    something else (fsm_bindings.wait_command(), an event loop) wakes up.
+
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.listeners : List[Callable[[], Any]] = []
+
+    def set(self) -> None:
+        super().set()
+        for listener in list(self.listeners):
+            listener()
+
 @dataclass 
 class fsm_bindings:
 
@@ -253,19 +1040,28 @@ class fsm_bindings:
     CMD_GET_TRIGGER : str = 'get_trigger' # get trigger type event or sleep
     CMD_SET_SLEEP : str = 'set_sleep' # change sleep time
     CMD_GET_SLEEP : str = 'get_sleep' # get sleep time
+    CMD_SWAP : str = 'swap' # applies definition scheduled by fsm.hot_swap()
 
     MSG_TRIGGER_TIME : str = 'sleep_trigger'
     MSG_TRIGGER_EVENT : str = 'event_trigger'
 
     q_input : Queue = field(default_factory=Queue)
     q_output : Queue = field(default_factory=Queue)
+    q_command : Queue = field(default_factory=Queue) # (CMD_*, value) to FSM running thread
+    q_reply : Queue = field(default_factory=Queue) # replies to CMD_GET_* commands
+    cv_wakeup : Condition = field(default_factory=Condition)
     ev_running : Event = field(default_factory = Event)
-    ev_loop_flag : Event = field(default_factory = Event)
+    ev_loop_flag : Event = field(default_factory = fsm_wakeup_event)
     ev_async_flag : Event = field(default_factory = Event)
     sleep_time : float = 0.5
     sleep_async : float = 0.5
+    overrun_policy : str = 'skip'
+    wakeup_callbacks : List[Callable[[], Any]] = field(default_factory=list) # called by wakeup()
 
-    def __post__init__(self) -> None: 
+    def __post_init__(self) -> None: 
+        # Setting the loop flag directly (legacy callers) wakes up the running loop too
+        if isinstance(self.ev_loop_flag, fsm_wakeup_event):
+            self.ev_loop_flag.listeners.append(self.wakeup)
         self._inmutable__fields_ : Set = set()
         #Declare here non mutable fields by set comprehension 
         # Where looking for the fields which contains CMD and MSG at begining
@@ -281,6 +1077,55 @@ class fsm_bindings:
         else:
             super().__setattr__(name,value)
 
+    def send(self, cmd: str, value: Any = None) -> None:
+        """
+        Sends a command to FSM running thread and wakes it up immediately.
+
+        :param cmd: One of CMD_* commands.
+        :type cmd: str
+        :param value: Command argument (e.g. seconds for CMD_SET_SLEEP).
+        :type value: Any
+        :return: None
+        :rtype: None
+
+        """
+        with self.cv_wakeup:
+            self.q_command.put((cmd, value))
+        self.wakeup()
+
+    def wakeup(self) -> None:
+        """
+        Wakes up FSM running thread (see wait_command()) and calls 
+        wakeup_callbacks, e.g. to wake up an event loop.
+
+        :return: None
+        :rtype: None
+
+        """
+        with self.cv_wakeup:
+            self.cv_wakeup.notify_all()
+        for callback in list(self.wakeup_callbacks):
+            callback()
+
+    def wait_command(self, timeout: Optional[float] = None, loop_flag: bool = False) -> bool:
+        """
+        Blocks until a command is received, ev_loop_flag is set (if loop_flag)
+        or timeout expires. Both are checked under cv_wakeup, so a wakeup 
+        sent right before waiting is not lost.
+
+        :param timeout: Seconds to wait, forever if None.
+        :type timeout: None or float
+        :param loop_flag: Return as well when ev_loop_flag is set.
+        :type loop_flag: bool
+        :return: True if there are commands pending.
+        :rtype: bool
+
+        """
+        with self.cv_wakeup:
+            self.cv_wakeup.wait_for(lambda: not self.q_command.empty() or 
+                                    (loop_flag and self.ev_loop_flag.is_set()), timeout)
+            return not self.q_command.empty()
+
 class fsm:
     """
     Represents a finite state machine (FSM). This class allows you to define states and transitions of an FSM,
@@ -294,13 +1139,37 @@ class fsm:
     :ivar true_transitions_name: vector containing names of transition conditions that are True for debug purposes
     :ivar entry-point: Initial state. 
     :ivar conditions: Dictionary that contains expressions or funcions of named transitions.
+    :ivar terms: Dictionary that contains expressions or functions of shared sub-terms, see term().
+    :ivar condition_cache: Caching policies of conditions, see add_condition().
+    :ivar step_count: Number of step() calls since compile() or reset().
+    :ivar snapshot: fsm_snapshot of the last step, replaced as a whole on 
+                    transitions, coherent to read from other threads without locks.
+    :ivar transition_ids: Transition name to transition id (declaration order), set by compile().
+    :ivar transition_edges: (origin, dest) state indexes of every transition id, set by compile().
+    :ivar transition_listeners: Callables f(fsm, origin, dest, transition_id, timestamp) called on every transition.
+    :ivar step_listeners: Callables f(fsm) called at the end of every step.
+    :ivar swap_listeners: Callables f(fsm) called after a definition swap, see hot_swap().
+    :ivar reset_listeners: Callables f(fsm) called after reset().
+    :ivar guard_executor: If set, outgoing conditions of current state are evaluated concurrently on it.
+    :ivar time_budgets: Time budgets by (kind, name), see set_time_budget().
+    :ivar overrun_callback: Called with a fsm_overrun on every time budget overrun.
+    :ivar action_executor: Executor running offloaded actions.
+    :ivar action_dispatcher: If set, transition, exit and entry actions are queued to it 
+                             instead of running inside step() (see fsm_action_dispatcher).
+    :ivar timeouts: Delay in seconds of timed transitions, see add_timeout().
+    :ivar timer_wheel: Timing wheel driving timed transitions, shared by all instances by default.
+    :ivar expired_timeouts: Timed transitions of current state whose timer expired.
+    :ivar step_context: Per step cache of evaluated conditions and sub-terms.
     :ivar state: Current state. 
     :ivar states: Defined name of number-coded states.
     :ivar dead_states: List of states that aren't never reachable from entry point or initial state.
     :ivar state_history: A list of present and previous states in order. 
+    :ivar state_history_time: Clock time when every state of state_history was entered.
+    :ivar clock: Time source, fsm_clock (wall) by default or virtual_clock, see set_clock().
     :ivar check_cycles: If True check for cycles provoqued by external conditions that are considered abnormal.
     :ivar tsymbol: Current transition symbol, it can be ->, => or a comma. Once defined on first expression it can't be replaced.
     :ivar check_disjoint: If True check for disjoint transitions on defined state, if not, throws an error FSMNondisjoinctTransitions
+    :ivar disjoint_certificate: Certificate produced by certify_disjoint(). If certified, step() uses first-match semantics.
     :ivar warnings: If true, prints the warnings.
     :ivar debug: If true prints debug messages.
 
@@ -325,14 +1194,43 @@ class fsm:
         self.true_transitions_name : List = []
         self.entry_point : Optional[str] = None
         self.conditions = dict()
+        self.terms : Dict[str, Union[str, Callable[...,Any]]] = {}
+        self.step_context : fsm_step_context = fsm_step_context()
+        self._cache_lock : Lock = Lock()
+        self.condition_cache : Dict[str, fsm_condition_cache] = {}
+        self.step_count : int = 0
+        self._snapshot : fsm_snapshot = fsm_snapshot(None, None, 0, 0.0)
+        self._step_transition : Optional[str] = None
+        self._step_transition_time : float = 0.0
+        self.transition_ids : Dict[str, int] = {}
+        self.transition_edges : List[Tuple[int, int]] = []
+        self.transition_listeners : List[Callable[['fsm', int, int, int, float], Any]] = []
+        self.step_listeners : List[Callable[['fsm'], Any]] = []
+        self.swap_listeners : List[Callable[['fsm'], Any]] = []
+        self.reset_listeners : List[Callable[['fsm'], Any]] = []
+        self._pending_swap : Optional[Tuple['fsm', Optional[Callable[[str, 'fsm'], str]]]] = None
+        self.guard_executor : Optional[Executor] = None
+        self.time_budgets : Dict[Tuple[str, str], fsm_time_budget] = {}
+        self.overrun_callback : Optional[Callable[[fsm_overrun], Any]] = None
+        self.action_executor : Optional[Executor] = None
+        self.action_dispatcher : Optional[Any] = None
+        # Timed transitions
+        self.timeouts : Dict[str, float] = {}
+        self.timer_wheel : timing_wheel = default_timing_wheel
+        self.expired_timeouts : Set[str] = set()
+        self._armed_timers : List[fsm_timer] = []
+        self._state_timeouts : List[List[str]] = []
         self.state : Optional[int] = None
         self.states : List[str] = []
         self.dead_states = []
         self.state_history : Deque[Optional[int]]= deque([None]*history_len, maxlen = history_len) 
+        self.state_history_time : Deque[Optional[float]]= deque([None]*history_len, maxlen = history_len) 
+        self.clock : fsm_clock = default_clock
         self.history_len = history_len
         self.check_cycles = False
         self.tsymbol = None
         self.check_disjoint = True 
+        self.disjoint_certificate : Optional[fsm_disjoint_certificate] = None
         self.warnings = False 
         self.debug = False 
         # Class bindings 
@@ -354,9 +1252,18 @@ class fsm:
         """
         self.true_transitions.clear() 
         self.state_history = deque([None]*self.history_len, maxlen = self.history_len) 
+        self.step_count = 0
+        # Not an explicit invalidation: statistics are left untouched
+        for cache in self.condition_cache.values():
+            cache.discard()
         self.state = self.index_dict[self.entry_point]
         self.state_history.clear()
-        self.state_history.append(self.state)
+        self.state_history_time.clear()
+        self._append_history()
+        self._arm_timeouts()
+        self._take_snapshot()
+        for listener in self.reset_listeners:
+            listener(self)
 
     def add_transition(self, s:str)->None:
         """
@@ -419,6 +1326,7 @@ class fsm:
         """
         if (transition_match := self.parse_state.match(s)):
             self.machine_trasitions.append(s)
+            self.disjoint_certificate = None
         else:
             logger.error(FSMSysMgs.error_expresion_match())
             raise FSMInvalidSyntax
@@ -437,7 +1345,9 @@ class fsm:
         else: 
             return ''
 
-    def add_condition(self,t:str, fcond:Union[str,Callable[...,bool]])->None:
+    def add_condition(self,t:str, fcond:Union[str,Callable[...,bool]],
+                      ttl:Optional[float]=None, max_age_steps:Optional[int]=None, 
+                      cached:bool=False)->None:
         """
         Adds function/expression evaluate named condition. 
 
@@ -447,6 +1357,12 @@ class fsm:
         :param fcond: function returning bool or string expression to evaluate 
                         which results on a boolean type
         :type fcond: str, Callable[...,bool]  
+        :param ttl: If set, result is cached and reused during ttl seconds.
+        :type ttl: None or float
+        :param max_age_steps: If set, result is cached and reused during max_age_steps steps.
+        :type max_age_steps: None or int
+        :param cached: If True, result is cached until invalidate_condition() is called.
+        :type cached: bool
         :return: None
         :rtype: None
 
@@ -457,6 +1373,7 @@ class fsm:
 
                 f.add_condition('t0', 'a%10 == 0')  # Expression: evaluates a%10 == 0
                 f.add_condition('t1', test_fcn)     # Function: evaluates a%7 == 0
+                f.add_condition('t2', read_sensor, ttl=0.5) # Function: evaluated at most every 0.5 s
 
         Note: Conditions must be unique for each transition, if one transition name is 
                 repeated, this will throw FSMRedundantCondition exception.
@@ -467,6 +1384,9 @@ class fsm:
         """
         if not t in self.conditions.keys():
             self.conditions[t] = fcond
+            self.disjoint_certificate = None
+            if cached or ttl is not None or max_age_steps is not None:
+                self.condition_cache[t] = fsm_condition_cache(ttl=ttl, max_age_steps=max_age_steps)
         else:
             logger.error(FSMSysMgs.error_redundant_condition())
             raise FSMRedundantCondition
@@ -482,6 +1402,37 @@ class fsm:
 
         """
         del self.conditions[cond]
+        self.condition_cache.pop(cond, None)
+        self.timeouts.pop(cond, None)
+        self.disjoint_certificate = None
+
+    def invalidate_condition(self, cond:Optional[str]=None)->None:
+        """
+        Invalidates cached result of a condition.
+
+        :param cond: Existing condition, if None all cached conditions are invalidated.
+        :type cond: None or str
+        :return: None
+        :rtype: None
+
+        """
+        if cond is None:
+            for cache in self.condition_cache.values():
+                cache.invalidate()
+        elif (cache := self.condition_cache.get(cond)) is not None:
+            cache.invalidate()
+
+    def condition_cache_stats(self)->Dict[str, Dict[str, Any]]:
+        """
+        Gets statistics of cached conditions.
+
+        :return: Dictionary of condition name : {hits, misses, invalidations, ttl, max_age_steps}
+        :rtype: Dict[str, Dict[str, Any]]
+
+        """
+        return {t: {'hits': c.hits, 'misses': c.misses, 'invalidations': c.invalidations,
+                    'ttl': c.ttl, 'max_age_steps': c.max_age_steps} 
+                for t, c in self.condition_cache.items()}
 
     def compile(self)->None:
         """
@@ -519,7 +1470,10 @@ class fsm:
 
         N = len(self.states)
         self.tmatrix = np.full((N,N), None, dtype=object)
+        self.disjoint_certificate = None
         self.index_dict = {ss:k for k,ss in enumerate(self.states)}
+        self.transition_ids = {}
+        self.transition_edges = []
         remaining_transitions = set(self.conditions.keys())
         try: 
             for k,m in enumerate(self.machine_trasitions): 
@@ -528,7 +1482,8 @@ class fsm:
                     self.tsymbol = dd['tsymbol']
                     self.entry_point = dd['origin'] # Automatic initial state determination. 
                     self.state = self.index_dict[self.entry_point]
-                    self.state_history.append(self.state)
+                    self._append_history()
+                    self.step_count = 0
                 elif self.tsymbol != dd['tsymbol']:
                     errmsg = FSMSysMgs.error_inconsistent_transition(
                         tsymbol1=self.tsymbol, 
@@ -539,6 +1494,8 @@ class fsm:
 
 
                 self.tmatrix[self.index_dict[dd['origin']],self.index_dict[dd['dest']]] = dd['transition']
+                self.transition_ids[dd['transition']] = k
+                self.transition_edges.append((self.index_dict[dd['origin']], self.index_dict[dd['dest']]))
                 if dd['transition'] in self.conditions.keys():
                     remaining_transitions.remove(dd['transition'])
                 else: 
@@ -591,6 +1548,13 @@ class fsm:
             if self.warnings: 
                 warnings.warn(warnmsg)
 
+        self._state_timeouts = []
+        if len(self.timeouts) > 0:
+            self._state_timeouts = [[t for t in row if isinstance(t, str) and t in self.timeouts]
+                                    for row in self.tmatrix]
+        self._arm_timeouts()
+        self._take_snapshot()
+
     def verify_deadStates(self)->bool:
         """
         Verifies if there are unreachable 
@@ -696,8 +1660,91 @@ class fsm:
         self.entry_point = ep
         self.state = self.index_dict[ep]
         self.state_history.clear()
-        self.state_history.append(self.state)
+        self.state_history_time.clear()
+        self._append_history()
+        self._arm_timeouts()
+        self._take_snapshot()
     
+    def _append_history(self, now:Optional[float] = None)->None:
+        self.state_history.append(self.state)
+        self.state_history_time.append(self.clock.monotonic() if now is None else now)
+
+    def add_transition_listener(self, listener:Callable[['fsm', int, int, int, float], Any])->None:
+        """
+        Adds a callable called on every transition, after the state changes and
+        before transition actions run, as listener(fsm, origin, dest, transition_id, timestamp).
+        States are indexes of self.states, transition_id indexes machine_trasitions
+        (see transition_ids) and timestamp is clock.monotonic() on entry to dest.
+
+        :param listener: Callable to add.
+        :type listener: Callable
+        :return: None
+        :rtype: None
+
+        """
+        self.transition_listeners.append(listener)
+
+    def del_transition_listener(self, listener:Callable[['fsm', int, int, int, float], Any])->None:
+        """
+        Removes a transition listener.
+
+        :param listener: Callable to remove.
+        :type listener: Callable
+        :return: None
+        :rtype: None
+
+        """
+        self.transition_listeners.remove(listener)
+
+    def add_step_listener(self, listener:Callable[['fsm'], Any])->None:
+        """
+        Adds a callable called at the end of every step, even if it failed,
+        as listener(fsm), once step_count has been incremented.
+
+        :param listener: Callable to add.
+        :type listener: Callable
+        :return: None
+        :rtype: None
+
+        """
+        self.step_listeners.append(listener)
+
+    def del_step_listener(self, listener:Callable[['fsm'], Any])->None:
+        """
+        Removes a step listener.
+
+        :param listener: Callable to remove.
+        :type listener: Callable
+        :return: None
+        :rtype: None
+
+        """
+        self.step_listeners.remove(listener)
+
+    def set_clock(self, clock:fsm_clock, wheel:Optional[timing_wheel] = None)->None:
+        """
+        Changes the time source of the machine. Timed transitions move to 
+        wheel, or to the wheel of the clock for a virtual_clock.
+
+        :param clock: New time source.
+        :type clock: fsm_clock
+        :param wheel: Timing wheel for timed transitions, chosen from clock if None.
+        :type wheel: None or timing_wheel
+        :return: None
+        :rtype: None
+
+        """
+        if wheel is None:
+            wheel = clock.wheel if isinstance(clock, virtual_clock) else default_timing_wheel
+        for timer in self._armed_timers:
+            self.timer_wheel.cancel(timer)
+        self._armed_timers.clear()
+        self.clock = clock
+        self.timer_wheel = wheel
+        if len(self.state_history_time) > 0:
+            self.state_history_time[-1] = clock.monotonic()
+        self._arm_timeouts()
+
     def printable_history(self)->str:
         """
         Creates a printable history of states.
@@ -706,10 +1753,25 @@ class fsm:
         :rtype : str
 
         """
-        ptrbl = StringIO()
-        print([self.states[x] for x in self.state_history if x is not None],\
-              file=ptrbl)
-        return ptrbl.getvalue()
+        return f'{[self.states[x] for x in self.state_history if x is not None]}\n'
+
+    def history_frame(self)->pd.DataFrame:
+        """
+        Exports state_history and state_history_time as a DataFrame, oldest 
+        first, converted to arrays without looping over states in Python.
+
+        :return: Columns state (categorical of all states), code (state index) 
+                 and time (clock time when the state was entered).
+        :rtype: pd.DataFrame
+
+        """
+        # None (unused history slots) becomes NaN on conversion
+        codes = np.array(self.state_history, dtype=np.float64)
+        times = np.array(self.state_history_time, dtype=np.float64)
+        valid = ~np.isnan(codes)
+        codes = codes[valid].astype(np.int32)
+        return pd.DataFrame({'state': pd.Categorical.from_codes(codes, categories=self.states),
+                             'code': codes, 'time': times[valid]})
 
     def step(self)-> None:
         """
@@ -719,94 +1781,1067 @@ class fsm:
         :rtype: NoneType
 
         """
-        if (f := self.actions_on_state[self.get_state()]) is not None:
-            try: 
-                if isinstance(f, str): 
-                    eval(f)
-                else: 
-                    f()
-            except Exception as e:
-                msg = f"On State {self.get_state()} {e}"
-                logger.error(msg)
-                raise FSMOnEntryActionError(msg)
+        try:
+            self._step()
+        finally:
+            self._end_step()
 
-        self.true_transitions.clear()
-        self.true_transitions_name.clear()
+    def _end_step(self)->None:
+        """
+        Closes current step: clears step context and counts the step.
+        Snapshot is only replaced if the step performed a transition.
+
+        """
+        ctx = self.step_context
+        if ctx.conditions or ctx.terms:
+            ctx.clear()
+        if self._step_transition is not None:
+            # Published before step_count, see snapshot
+            self._snapshot = fsm_snapshot(self.states[self.state], self._step_transition,
+                                          self.step_count + 1, self._step_transition_time)
+            self._step_transition = None
+        self.step_count += 1
+        if self.step_listeners:
+            for listener in self.step_listeners:
+                listener(self)
+
+    @property
+    def snapshot(self)->fsm_snapshot:
+        """
+        Immutable view of the machine at the end of last step. Steps without
+        transition do not replace it, the tuple is built here when read.
+
+        :return: State, transition, step and timestamp.
+        :rtype: fsm_snapshot
+
+        """
+        # step_count is read before the tuple and written after it, so a 
+        # reader thread never pairs an old tuple with a newer step count
+        step = self.step_count
+        snap = self._snapshot
+        if snap.step >= step:
+            return snap
+        return fsm_snapshot(snap.state, None, step, self.clock.monotonic())
+
+    @snapshot.setter
+    def snapshot(self, snap:fsm_snapshot)->None:
+        self._snapshot = snap
+
+    def _take_snapshot(self, transition:Optional[str] = None)->None:
+        # A single attribute assignment: readers see the old or the new tuple, never a mix
+        self._snapshot = fsm_snapshot(self.states[self.state], transition, 
+                                      self.step_count, self.clock.monotonic())
+
+    def _step(self)-> None:
+        """
+        Body of step(), runs inside the step evaluation context.
+
+        """
+        if self._pending_swap is not None:
+            self.apply_swap()
+        self._run_action(self.actions_on_state.get(self.get_state()), 
+                         'on_state', self.get_state())
+
+        first_match = self._begin_guards()
         t = ''
         try: 
-            for k,t in enumerate(self.tmatrix[self.state,:]):
-                tcond = False
-                if isinstance(t,str):
-                    if isinstance(self.conditions[t], str):
-                        tcond = eval(self.conditions[t])
-                    elif callable(self.conditions[t]):
-                        tcond = self.conditions[t]()
-
-                if tcond: 
-                    self.true_transitions.append(k)
-                    self.true_transitions_name.append(t)
+            if self.guard_executor is not None:
+                self._eval_conditions_concurrently(first_match)
+            else:
+                for k,t in enumerate(self.tmatrix[self.state,:]):
+                    if isinstance(t,str) and self._eval_condition(t): 
+                        self.true_transitions.append(k)
+                        self.true_transitions_name.append(t)
 
-                    if not self.check_disjoint:
-                        break
+                        if first_match:
+                            break
 
+        except FSMTransitionEvalError:
+            raise
         except Exception as e: 
-                errmsg = FSMSysMgs.error_transition_eval_error(
-                        state = self.get_state(), transition = t,
-                        eval_fcnexp=self.conditions[t])
-                errmsg = str(e) +'\n'+errmsg
-                logger.error(errmsg)
-                raise FSMTransitionEvalError(errmsg) 
+            self._raise_eval_error(t, e)
 
+        if not self._end_guards():
+            return 
+
+        actions = self._commit_transition()
+        if self.action_dispatcher is not None:
+            self.action_dispatcher.dispatch(self, actions)
+        else:
+            for f, kind, name in actions:
+                self._run_action(f, kind, name)
+
+        self._debug_transition()
+
+    def _run_action(self, f:Optional[Union[str,Callable[...,Any]]], kind:str, 
+                    name:str, transition:Optional[str] = None)->Any:
+        """
+        Runs an action (expression or function) mapping its errors to the 
+        exception class of its kind.
+
+        :param f: Action to run, if None nothing is done.
+        :param kind: 'on_state', 'on_entry', 'on_exit' or 'on_transition'.
+        :param name: State name, transition name for on transition actions.
+        :param transition: Transition the action belongs to, current one if None.
+        :return: Result of action.
+
+        """
+        if f is None:
+            return None
+        if self.time_budgets and \
+                (budget := self.time_budgets.get((kind, name))) is not None:
+            return self._run_budgeted_action(f, kind, name, budget, transition)
+        try: 
+            result = self._call_action(f)
+        except Exception as e:
+            raise self._action_failure(kind, name, e)
+        return result
+
+    def _call_action(self, f:Union[str,Callable[...,Any]])->Any:
+        return eval(f) if isinstance(f, str) else f()
+
+    def _action_failure(self, kind:str, name:str, e:Exception)->Exception:
+        """
+        Logs error e of an action and builds the exception to raise.
+
+        """
+        prefix, excpt = _action_error(kind, name)
+        msg = f"{prefix} {e}"
+        logger.error(msg)
+        return excpt(msg)
+
+    def _run_budgeted_action(self, f:Union[str,Callable[...,Any]], kind:str, 
+                             name:str, budget:fsm_time_budget, 
+                             transition:Optional[str] = None)->Any:
+        """
+        Runs an action with time budget: measured inline, or offloaded to 
+        action_executor and abandoned with an error when the budget expires.
+
+        """
+        if budget.offload:
+            if self.action_executor is None:
+                self.set_action_executor()
+            return self._offload_action(f, kind, name, budget, transition)
+        t0 = time.perf_counter()
+        try:
+            result = self._call_action(f)
+        except Exception as e:
+            self._check_budget(kind, name, t0, budget, transition)
+            raise self._action_failure(kind, name, e)
+        self._check_budget(kind, name, t0, budget, transition)
+        return result
+
+    def _offload_action(self, f:Union[str,Callable[...,Any]], kind:str, 
+                        name:str, budget:fsm_time_budget, 
+                        transition:Optional[str] = None)->Any:
+        """
+        Runs an action on action_executor waiting at most its budget.
+
+        """
+        future = self.action_executor.submit(self._call_action, f)
+        try:
+            return future.result(timeout=budget.budget)
+        except FutureTimeoutError:
+            future.cancel()
+            raise self._action_timeout(kind, name, budget, transition)
+        except Exception as e:
+            raise self._action_failure(kind, name, e)
+
+    def _action_timeout(self, kind:str, name:str, budget:fsm_time_budget, 
+                        transition:Optional[str] = None)->Exception:
+        """
+        Reports an abandoned action and builds the exception to raise.
+
+        """
+        self._report_overrun(kind, name, budget.budget, budget, timeout=True, 
+                             transition=transition)
+        prefix, excpt = _action_error(kind, name)
+        msg = FSMSysMgs.error_action_timeout(prefix, budget.budget)
+        logger.error(msg)
+        return excpt(msg)
+
+    def _check_budget(self, kind:str, name:str, t0:float, budget:fsm_time_budget, 
+                      transition:Optional[str] = None)->None:
+        if (elapsed := time.perf_counter() - t0) > budget.budget:
+            self._report_overrun(kind, name, elapsed, budget, transition=transition)
+
+    def _report_overrun(self, kind:str, name:str, elapsed:float, budget:fsm_time_budget,
+                        timeout:bool = False, transition:Optional[str] = None)->None:
+        """
+        Logs a time budget overrun and reports it to overrun_callback.
+        Actions run by a dispatcher pass the transition they belong to, 
+        the machine may be past it already.
+
+        """
+        budget.overruns += 1
+        if transition is None and kind in ('on_entry', 'on_exit', 'on_transition') \
+                and self.true_transitions_name:
+            transition = self.true_transitions_name[0]
+        overrun = fsm_overrun(kind=kind, name=name, state=self.get_state(), 
+                              transition=transition, step=self.step_count, 
+                              elapsed=elapsed, budget=budget.budget, timeout=timeout)
+        warnmsg = FSMSysMgs.warning_time_budget_overrun(kind, name, overrun.state, 
+                                                        transition, elapsed, budget.budget)
+        logger.warning(warnmsg)
+        if self.warnings:
+            warnings.warn(warnmsg)
+        if self.overrun_callback is not None:
+            self.overrun_callback(overrun)
+
+    def set_time_budget(self, kind:str, name:str, budget:Optional[float], 
+                        offload:bool=False)->None:
+        """
+        Sets the time budget of a condition or action. Overruns are logged 
+        with state and transition context and reported to overrun_callback. 
+        Offloaded actions run on action_executor with budget as hard timeout:
+        when it expires the step goes on raising FSMOnEntryActionError, 
+        FSMOnExitActionError, FSMOnTransitionActionError (or the exception of
+        on state actions), while the abandoned call finishes in background.
+
+        :param kind: 'condition', 'on_state', 'on_entry', 'on_exit' or 'on_transition'.
+        :type kind: str
+        :param name: Transition name for conditions and on transition actions, state name otherwise.
+        :type name: str
+        :param budget: Budget in seconds, None removes it.
+        :type budget: None or float
+        :param offload: If True, action runs on action_executor (not allowed for conditions).
+        :type offload: bool
+        :return: None
+        :rtype: None
+
+        Example:
+
+            f.set_time_budget('condition', 't0', 0.002)
+            f.set_time_budget('on_entry', 'UPLOAD', 0.5, offload=True)
+            f.overrun_callback = lambda o: metrics.append(o)
+
+        """
+        if kind not in ('condition', 'on_state', 'on_entry', 'on_exit', 'on_transition'):
+            raise FSMUnknownException(f'Unknown callable kind {kind}')
+        if offload and kind == 'condition':
+            raise FSMUnknownException('Conditions can not be offloaded, see set_guard_executor()')
+        if budget is None:
+            self.time_budgets.pop((kind, name), None)
+        else:
+            self.time_budgets[(kind, name)] = fsm_time_budget(budget=budget, offload=offload)
+
+    def set_action_executor(self, executor:Optional[Executor]=None, 
+                            max_workers:Optional[int]=None)->None:
+        """
+        Sets the executor running offloaded actions (see set_time_budget()).
+        Abandoned actions keep a worker busy until they finish.
+
+        :param executor: Executor to run actions on. If None, a ThreadPoolExecutor
+                         with max_workers threads is created. 
+        :type executor: None or Executor
+        :param max_workers: Number of threads of created ThreadPoolExecutor.
+        :type max_workers: None or int
+        :return: None
+        :rtype: None
+
+        """
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, 
+                                          thread_name_prefix='pyfsm-action')
+        self.action_executor = executor
+
+    def clear_action_executor(self, shutdown:bool=True)->None:
+        """
+        Removes the executor of offloaded actions.
+
+        :param shutdown: If True shuts down the executor without waiting abandoned actions.
+        :type shutdown: bool
+        :return: None
+        :rtype: None
+
+        """
+        if self.action_executor is not None and shutdown:
+            self.action_executor.shutdown(wait=False)
+        self.action_executor = None
+
+    def _begin_guards(self)->bool:
+        """
+        Prepares evaluation of outgoing conditions of current state.
+
+        :return: True if first-match semantics apply (check_disjoint disabled or certified machine)
+        :rtype: bool
+
+        """
+        if self._armed_timers:
+            self.timer_wheel.advance()
+        self.true_transitions.clear()
+        self.true_transitions_name.clear()
+        return not self.check_disjoint or \
+            (self.disjoint_certificate is not None and self.disjoint_certificate.certified)
+
+    def _raise_eval_error(self, t:str, e:Exception)->None:
+        """
+        Raises FSMTransitionEvalError for condition t failing with exception e.
+
+        """
+        fcond = self.conditions.get(t)
+        errmsg = FSMSysMgs.error_transition_eval_error(
+                state = self.get_state(), transition = t,
+                eval_fcnexp=fcond if isinstance(fcond, str) else '')
+        errmsg = str(e) +'\n'+errmsg
+        logger.error(errmsg)
+        raise FSMTransitionEvalError(errmsg) 
+
+    def _end_guards(self)->bool:
+        """
+        Checks evaluated conditions.
+
+        Exceptions: 
+        -----------
+            FSMNondisjoinctTransitions : If more than one condition is true.
+
+        :return: True if there is a transition to perform.
+        :rtype: bool
+
+        """
         if len(self.true_transitions) > 1:
             errmsg = FSMSysMgs.error_non_disjoint_transitions(self.get_state(),
                       transitions=str(self.true_transitions_name))
             logger.error(errmsg)
             raise FSMNondisjoinctTransitions(errmsg)
+        return len(self.true_transitions) == 1
 
-        elif len(self.true_transitions) == 0: 
-            return 
-        else:
-            state_prev = self.get_state() # get previous state name
-            self.state = self.true_transitions[0] # change state 
-            self.state_history.append(self.state) # get new state name
-            state_new = self.get_state()
-
-            # Iterate over 3-tuple containing : 
-            # field : transition name, previous state, new state 
-            # alist : Action List: On Transition (from old to new state), 
-            #         On Exit (from old), On Entry (to new) 
-            # except: Exception type 
-            #       -FSMOnTransitionActionError: Exception call when transition
-            #       -FSMOnExitActionError: Exception call when exits state
-            #       -FSMOnEntryActionError: Exception call when enters state
-            for field, alist, excpt in zip(
-                (self.true_transitions_name[0], state_prev, state_new), 
-                (self.actions_on_transition, self.actions_on_exit, 
-                 self.actions_on_entry),
-                (FSMOnTransitionActionError, FSMOnExitActionError, 
-                 FSMOnEntryActionError)):
+    def _commit_transition(self)->List[Tuple[Union[str,Callable[...,Any]], str, str]]:
+        """
+        Changes current state to the destination of the true transition. 
+
+        :return: Actions to run in order, as (action, kind, name):
+                 On Transition (from old to new state), On Exit (from old), On Entry (to new).
+        :rtype: List[Tuple]
+
+        """
+        origin = self.state
+        state_prev = self.get_state() # get previous state name
+        self.state = self.true_transitions[0] # change state 
+        now = self.clock.monotonic()
+        self._append_history(now) # get new state name
+        self._step_transition = self.true_transitions_name[0]
+        self._step_transition_time = now
+        state_new = self.get_state()
+        if self._state_timeouts or self._armed_timers:
+            self._arm_timeouts()
+        if self.transition_listeners:
+            tid = self.transition_ids[self.true_transitions_name[0]]
+            for listener in self.transition_listeners:
+                listener(self, origin, self.state, tid, now)
+
+        # Iterate over 3-tuple containing : 
+        # field : transition name, previous state, new state 
+        # alist : Action List: On Transition (from old to new state), 
+        #         On Exit (from old), On Entry (to new) 
+        # kind  : Action kind, selects the exception raised on error (see _action_error)
+        actions = []
+        for field, alist, kind in zip(
+            (self.true_transitions_name[0], state_prev, state_new), 
+            (self.actions_on_transition, self.actions_on_exit, 
+             self.actions_on_entry),
+            ('on_transition', 'on_exit', 'on_entry')):
+            # Check if action is registered
+            if (f:= alist.get(field)) is not None:
+                actions.append((f, kind, field))
+        return actions
+
+    def _debug_transition(self)->None:
+        debugmsg = FSMSysMgs.debug_machine_transition(
+                            self.states[self.state_history[-2]], 
+                            self.tsymbol, 
+                            self.states[self.state_history[-1]], 
+                            self.true_transitions_name[0])
+        logger.debug(debugmsg)
+        if self.debug: 
+            print(debugmsg)
+
+    def add_timeout(self, t:str, after:float)->None:
+        """
+        Adds a timed transition: condition t becomes true after seconds since
+        the machine entered the origin state of t. Timers are armed on entry 
+        to the state, cancelled on exit, and driven by timer_wheel, which is
+        advanced on every step() while a timer is armed.
+
+        :param t: Transition name described on state machine.
+        :type t: str
+        :param after: Delay in seconds.
+        :type after: float
+        :return: None
+        :rtype: None
+
+        Examples:
+
+                f.add_transition('WAIT => ERROR : timeout')
+                f.add_timeout('timeout', after=5.0)
+
+        Note: As any condition, it must be unique. Use del_condition() to remove it.
+
+        """
+        self.add_condition(t, fsm_timeout(self, t))
+        self.timeouts[t] = after
+
+    def _arm_timeouts(self)->None:
+        """
+        Cancels timers of previous state and arms the ones of current state.
+
+        """
+        for timer in self._armed_timers:
+            self.timer_wheel.cancel(timer)
+        self._armed_timers.clear()
+        self.expired_timeouts.clear()
+        if not self._state_timeouts or self.state is None:
+            return
+        now = self.timer_wheel.clock()
+        for t in self._state_timeouts[self.state]:
+            self._armed_timers.append(
+                self.timer_wheel.schedule(now + self.timeouts[t],
+                                          functools.partial(self.expired_timeouts.add, t)))
+
+    def set_guard_executor(self, executor:Optional[Executor]=None, 
+                           max_workers:Optional[int]=None)->None:
+        """
+        Enables concurrent evaluation of the outgoing conditions of current
+        state. Useful when conditions are slow and I/O bound: step() latency 
+        becomes the one of the slowest condition instead of the sum of all.
+        Disjointness check and FSMTransitionEvalError are preserved.
+
+        :param executor: Executor to run conditions on. If None, a ThreadPoolExecutor
+                         with max_workers threads is created. 
+        :type executor: None or Executor
+        :param max_workers: Number of threads of created ThreadPoolExecutor.
+        :type max_workers: None or int
+        :return: None
+        :rtype: None
 
+        """
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, 
+                                          thread_name_prefix='pyfsm-guard')
+        self.guard_executor = executor
+
+    def clear_guard_executor(self, shutdown:bool=True)->None:
+        """
+        Disables concurrent evaluation of conditions.
+
+        :param shutdown: If True shuts down the executor.
+        :type shutdown: bool
+        :return: None
+        :rtype: None
+
+        """
+        if self.guard_executor is not None and shutdown:
+            self.guard_executor.shutdown(wait=True)
+        self.guard_executor = None
+
+    def _eval_conditions_concurrently(self, first_match:bool)->None:
+        """
+        Evaluates outgoing conditions of current state on guard_executor and
+        fills true_transitions in column order.
+
+        """
+        outgoing = [(k,t) for k,t in enumerate(self.tmatrix[self.state,:]) if isinstance(t,str)]
+        if len(outgoing) == 1:
+            futures = [(*outgoing[0], None)]
+        else:
+            ctx = self.step_context
+            futures = [(k, t, self.guard_executor.submit(self._eval_condition, t, ctx)) 
+                       for k,t in outgoing]
+        try:
+            for k, t, future in futures:
                 try:
-                    # Check if action is registered
-                    if (f:= alist.get(field)) is not None:
-                        if isinstance(f, str):
-                            eval(f)
-                        else: 
-                            f()
-                # Manage exception if fails
-                except Exception as e: 
-                    msg = f'{field}: {e}'
-                    logger.error(msg)
-                    raise excpt(msg)
-
-            debugmsg = FSMSysMgs.debug_machine_transition(
-                                self.states[self.state_history[-2]], 
-                                self.tsymbol, 
-                                self.states[self.state_history[-1]], 
-                                self.true_transitions_name[0])
-            logger.debug(debugmsg)
-            if self.debug: 
-                print(debugmsg)
+                    tcond = self._eval_condition(t) if future is None else future.result()
+                except Exception as e:
+                    self._raise_eval_error(t, e)
+                if tcond:
+                    self.true_transitions.append(k)
+                    self.true_transitions_name.append(t)
+                    if first_match:
+                        break
+        finally:
+            # No evaluation may outlive the step: pending ones are cancelled,
+            # running ones are waited for
+            pending = [future for _, _, future in futures if future is not None and not future.cancel()]
+            if pending:
+                wait(pending)
+
+    def _eval_condition(self, t:str, ctx:Optional[fsm_step_context]=None)->bool:
+        """
+        Evaluates named condition t (expression or function).
+
+        :param t: Transition condition name.
+        :type t: str
+        :param ctx: Step context to use, current one if None.
+        :type ctx: None or fsm_step_context
+        :return: Result of condition
+        :rtype: bool
+
+        """
+        if (tcond := self._lookup_condition(t, ctx)) is not None:
+            return tcond
+        tcond = self._call_condition(t)
+        self._store_condition(t, tcond, ctx)
+        return tcond
+
+    def _lookup_condition(self, t:str, ctx:Optional[fsm_step_context]=None)->Optional[bool]:
+        """
+        Looks for a result of condition t on step context and condition cache.
+
+        :param t: Transition condition name.
+        :type t: str
+        :param ctx: Step context to use, current one if None.
+        :type ctx: None or fsm_step_context
+        :return: Result of condition or None if it must be evaluated.
+        :rtype: None or bool
+
+        """
+        results = (ctx or self.step_context).conditions
+        if (tcond := results.get(t)) is not None:
+            return tcond
+        if (cache := self.condition_cache.get(t)) is not None:
+            # Guard executor threads share the caches
+            with self._cache_lock:
+                if cache.valid(self.clock.monotonic(), self.step_count):
+                    cache.hits += 1
+                    results[t] = cache.value
+                    return cache.value
+        return None
+
+    def _store_condition(self, t:str, tcond:bool, ctx:Optional[fsm_step_context]=None)->None:
+        """
+        Stores result of condition t on step context and condition cache.
+
+        """
+        if (cache := self.condition_cache.get(t)) is not None:
+            with self._cache_lock:
+                cache.store(tcond, self.clock.monotonic(), self.step_count)
+        (ctx or self.step_context).conditions[t] = tcond
+
+    def _call_condition(self, t:str)->bool:
+        """
+        Evaluates named condition t bypassing step context and caches. 
+        It is only timed if the condition has a time budget.
+
+        :param t: Transition condition name.
+        :type t: str
+        :return: Result of condition
+        :rtype: bool
+
+        """
+        if self.time_budgets and \
+                (budget := self.time_budgets.get(('condition', t))) is not None:
+            t0 = time.perf_counter()
+            try:
+                return bool(self._eval_condition_function(t))
+            finally:
+                self._check_budget('condition', t, t0, budget)
+        return bool(self._eval_condition_function(t))
+
+    def _eval_condition_function(self, t:str)->Any:
+        fcond = self.conditions[t]
+        if isinstance(fcond, str):
+            return eval(fcond)
+        elif callable(fcond):
+            return fcond()
+        return False
+
+    def truth_table(self, columns:Any)->np.ndarray:
+        """
+        Evaluates all conditions at once over columns of inputs, one value per
+        step. Conditions must be string expressions valid on NumPy arrays 
+        (use &, |, ~ instead of and, or, not) reading inputs as self.<column>.
+
+        Exceptions: 
+        -----------
+            FSMTransitionEvalError : If a condition can not be evaluated column-wise 
+            (function, timed transition, scalar-only expression).
+
+        :param columns: Dictionary of column name to array-like, DataFrame or structured array.
+        :type columns: Any
+        :return: Boolean matrix, row k is the condition of transition id k on every step.
+        :rtype: np.ndarray
+
+        Example:
+
+            T = f.truth_table({'a': np.arange(1000)})
+
+        """
+        ns = columns if isinstance(columns, fsm_columns) else fsm_columns(self, columns)
+        n = len(ns)
+        T = np.zeros((len(self.transition_ids), n), dtype=bool)
+        # Conditions with the same expression are evaluated once
+        evaluated : Dict[str, int] = {}
+        for t, k in self.transition_ids.items():
+            fcond = self.conditions[t]
+            if not isinstance(fcond, str):
+                raise FSMTransitionEvalError(f'Condition {t} can not be evaluated on columns')
+            if (j := evaluated.get(fcond)) is not None:
+                T[k] = T[j]
+                continue
+            evaluated[fcond] = k
+            try:
+                T[k] = np.broadcast_to(np.asarray(eval(fcond, globals(), {'self': ns}), dtype=bool), (n,))
+            except FSMTransitionEvalError:
+                raise
+            except Exception as e:
+                errmsg = str(e) +'\n'+FSMSysMgs.error_transition_eval_error(
+                        state = '*', transition = t, eval_fcnexp = fcond)
+                logger.error(errmsg)
+                raise FSMTransitionEvalError(errmsg)
+        return T
+
+    def walk(self, truth:np.ndarray, state:Optional[int]=None, 
+             start:int=0, block:int=1 << 16)->Tuple[np.ndarray, np.ndarray]:
+        """
+        Follows the machine over a truth table (see truth_table()) without
+        running actions. Columns are processed in blocks: for every state 
+        visited in a block, steps where any of its outgoing conditions is true
+        are found at once, so steps without transition cost almost nothing.
+
+        If check_disjoint applies and several conditions are true on a step,
+        the walk stops there and the step is returned with transition id -1.
+
+        :param truth: Boolean matrix (transitions x steps).
+        :type truth: np.ndarray
+        :param state: Initial state index, current state if None.
+        :type state: None or int
+        :param start: First step (column) to walk.
+        :type start: int
+        :param block: Number of columns processed at once.
+        :type block: int
+        :return: Steps (columns) with a transition and their transition ids.
+        :rtype: Tuple[np.ndarray, np.ndarray]
+
+        """
+        state = self.state if state is None else state
+        first_match = not self.check_disjoint or \
+            (self.disjoint_certificate is not None and self.disjoint_certificate.certified)
+        # Outgoing transition ids of every state, in step() evaluation order (destination index)
+        outgoing = [[] for _ in self.states]
+        for tid, (o, d) in sorted(enumerate(self.transition_edges), key=lambda x: x[1]):
+            outgoing[o].append(tid)
+        outgoing = [np.array(o, dtype=np.intp) for o in outgoing]
+        dest = [d for _, d in self.transition_edges]
+        n = truth.shape[1]
+        steps, tids = [], []
+        k = start
+        while k < n:
+            b0 = k
+            b1 = min(b0 + block, n)
+            events = {}
+            while k < b1:
+                if (ev := events.get(state)) is None:
+                    out = outgoing[state]
+                    if len(out) == 0:
+                        return np.array(steps, dtype=np.int64), np.array(tids, dtype=np.int64)
+                    sub = truth[out, b0:b1]
+                    hits = np.flatnonzero(sub.any(axis=0))
+                    sub = sub[:, hits]
+                    ev = events[state] = (hits.tolist(), out[sub.argmax(axis=0)].tolist(), 
+                                          sub.sum(axis=0).tolist())
+                hits, first, count = ev
+                i = bisect.bisect_left(hits, k - b0)
+                if i == len(hits):
+                    k = b1
+                    break
+                k = b0 + hits[i]
+                steps.append(k)
+                if count[i] > 1 and not first_match:
+                    tids.append(-1)
+                    return np.array(steps, dtype=np.int64), np.array(tids, dtype=np.int64)
+                tids.append(first[i])
+                state = dest[first[i]]
+                k += 1
+        return np.array(steps, dtype=np.int64), np.array(tids, dtype=np.int64)
+
+    def run_over(self, frame:Any, state:Optional[int]=None, chunk:int=1 << 22)->fsm_run:
+        """
+        Runs the machine as a transducer over a table of inputs, one row per
+        step, as if every row were set as attributes before step(). Rows are 
+        processed in chunks: conditions are evaluated column-wise on the 
+        chunk (see truth_table()) and the machine is walked over it (see 
+        walk()), so cost grows with transitions rather than rows and memory 
+        with chunk. Actions are not run and the machine state is not changed.
+
+        Exceptions: 
+        -----------
+            FSMTransitionEvalError : If a condition can not be evaluated column-wise.
+            FSMNondisjoinctTransitions : If several conditions are true on a row and check_disjoint applies.
+
+        :param frame: Dictionary of column name to array-like, DataFrame or structured array.
+        :type frame: Any
+        :param state: Initial state index, current state if None.
+        :type state: None or int
+        :param chunk: Rows evaluated at once.
+        :type chunk: int
+        :return: State after every row and transition log.
+        :rtype: fsm_run
+
+        Example:
+
+            run = f.run_over(telemetry)           # DataFrame with columns speed, temp
+            telemetry['state'] = run.states_frame()['state']
+            log = run.transitions_frame()
+
+        """
+        if isinstance(frame, np.ndarray) and frame.dtype.names is not None:
+            frame = {name: frame[name] for name in frame.dtype.names}
+        columns = {name: np.asarray(col) for name, col in frame.items()}
+        n = len(fsm_columns(self, columns))
+        state = self.state if state is None else state
+        initial = state
+        dest = np.array([d for _, d in self.transition_edges], dtype=np.int64)
+        all_steps, all_tids = [], []
+        for c0 in range(0, n, chunk):
+            c1 = min(c0 + chunk, n)
+            truth = self.truth_table({name: col[c0:c1] for name, col in columns.items()})
+            steps, tids = self.walk(truth, state=state)
+            if len(tids) > 0 and tids[-1] == -1:
+                at = dest[tids[-2]] if len(tids) > 1 else state
+                true = [t for t, k in self.transition_ids.items()
+                        if self.transition_edges[k][0] == at and truth[k, steps[-1]]]
+                errmsg = FSMSysMgs.error_non_disjoint_transitions(self.states[at], transitions=str(true)) +\
+                         f'at row {c0 + int(steps[-1])}'
+                logger.error(errmsg)
+                raise FSMNondisjoinctTransitions(errmsg)
+            if len(tids) > 0:
+                state = int(dest[tids[-1]])
+            all_steps.append(steps + c0)
+            all_tids.append(tids)
+        steps = np.concatenate(all_steps) if all_steps else np.empty(0, dtype=np.int64)
+        tids = np.concatenate(all_tids) if all_tids else np.empty(0, dtype=np.int64)
+        dests = dest[tids]
+        origins = np.concatenate(([initial], dests[:-1])) if len(dests) > 0 else dests
+        # State after every row: initial state up to the first transition row, then 
+        # destination of every transition from its row up to the next one
+        bounds = np.concatenate(([0], steps, [n]))
+        states = np.repeat(np.concatenate(([initial], dests)).astype(np.int32), np.diff(bounds))
+        return fsm_run(states=states, steps=steps, transitions=tids, origins=origins, dests=dests,
+                       state_names=list(self.states),
+                       transition_names=sorted(self.transition_ids, key=self.transition_ids.get))
+
+    def iter_transitions(self, inputs:Any, batched:bool=False)->Union[Iterator[fsm_transition], 
+                                                                       AsyncIterator[fsm_transition]]:
+        """
+        Streams input records through the machine lazily, yielding every 
+        transition as fsm_transition. Only one record (or batch) is held at
+        a time.
+
+        Records are dictionaries, named tuples or objects whose fields are 
+        set as machine attributes before step(). With batched, every item is
+        a table of records (dictionary of arrays, DataFrame or structured
+        array) run at once as in run_over(): per row overhead is amortized, 
+        but actions are not run and listeners are not called; the machine
+        ends the batch in its last state.
+
+        An async iterable (or an async_fsm) gives an async generator.
+
+        :param inputs: Iterable or async iterable of records, or of tables if batched.
+        :type inputs: Any
+        :param batched: If True every item is a table of records.
+        :type batched: bool
+        :return: Generator of transitions.
+        :rtype: Iterator[fsm_transition] or AsyncIterator[fsm_transition]
+
+        Example:
+
+            for t in f.iter_transitions(rows):             # rows: iterable of dicts
+                print(t.step, t.origin, t.transition, t.dest)
+
+            async for t in f.iter_transitions(queue_reader()):
+                ...
+
+        """
+        if hasattr(inputs, '__aiter__') or inspect.iscoroutinefunction(self.step):
+            return self._aiter_steps(inputs, batched, states=False)
+        return self._iter_steps(inputs, batched, states=False)
+
+    def map_states(self, inputs:Any, batched:bool=False)->Union[Iterator[Any], AsyncIterator[Any]]:
+        """
+        Streams input records through the machine lazily (see 
+        iter_transitions()), yielding the state name after every record. 
+        With batched, it yields once per table the array of state indexes 
+        after every row.
+
+        :param inputs: Iterable or async iterable of records, or of tables if batched.
+        :type inputs: Any
+        :param batched: If True every item is a table of records.
+        :type batched: bool
+        :return: Generator of state names, or of state index arrays if batched.
+        :rtype: Iterator or AsyncIterator
+
+        Example:
+
+            for state in f.map_states(rows):
+                ...
+            for states in f.map_states(pd.read_csv('log.csv', chunksize=100000), batched=True):
+                ...
+
+        """
+        if hasattr(inputs, '__aiter__') or inspect.iscoroutinefunction(self.step):
+            return self._aiter_steps(inputs, batched, states=True)
+        return self._iter_steps(inputs, batched, states=True)
+
+    def _set_inputs(self, record:Any)->None:
+        if isinstance(record, dict):
+            fields = record
+        elif hasattr(record, '_asdict'):
+            fields = record._asdict()
+        else:
+            fields = vars(record)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def _iter_steps(self, inputs:Iterable[Any], batched:bool, states:bool)->Iterator[Any]:
+        row = 0
+        for item in inputs:
+            if batched:
+                run = self._run_batch(item)
+                yield from (run.states,) if states else self._batch_transitions(run, row)
+                row += len(run.states)
+                continue
+            self._set_inputs(item)
+            origin = self.state
+            self.step()
+            if states:
+                yield self.states[self.state]
+            elif (t := self.snapshot.transition) is not None:
+                yield fsm_transition(row, self.states[origin], t, self.states[self.state])
+            row += 1
+
+    async def _aiter_steps(self, inputs:Any, batched:bool, states:bool)->AsyncIterator[Any]:
+        row = 0
+        if not hasattr(inputs, '__aiter__'):
+            inputs = _as_async_iterable(inputs)
+        async for item in inputs:
+            if batched:
+                run = self._run_batch(item)
+                for value in (run.states,) if states else self._batch_transitions(run, row):
+                    yield value
+                row += len(run.states)
+                continue
+            self._set_inputs(item)
+            origin = self.state
+            if inspect.isawaitable(result := self.step()):
+                await result
+            if states:
+                yield self.states[self.state]
+            elif (t := self.snapshot.transition) is not None:
+                yield fsm_transition(row, self.states[origin], t, self.states[self.state])
+            row += 1
+
+    def _run_batch(self, table:Any)->fsm_run:
+        """
+        Runs a table with run_over() and leaves the machine in its last state.
+
+        """
+        run = self.run_over(table)
+        n = len(run.states)
+        self.step_count += n
+        if len(run.steps) > 0:
+            # Cached results are stale, as on reset() statistics are left untouched
+            for cache in self.condition_cache.values():
+                cache.discard()
+            self.state = int(run.dests[-1])
+            now = self.clock.monotonic()
+            for d in run.dests[-self.history_len:].tolist() if self.history_len else []:
+                self.state = d
+                self._append_history(now)
+            self._arm_timeouts()
+            self._take_snapshot(run.transition_names[int(run.transitions[-1])])
+        elif n > 0:
+            self._take_snapshot()
+        return run
+
+    def _batch_transitions(self, run:fsm_run, row:int)->Iterator[fsm_transition]:
+        names, tnames = run.state_names, run.transition_names
+        for k, o, t, d in zip(run.steps.tolist(), run.origins.tolist(), 
+                              run.transitions.tolist(), run.dests.tolist()):
+            yield fsm_transition(row + k, names[o], tnames[t], names[d])
+
+    def add_term(self, name:str, fterm:Union[str,Callable[...,Any]])->None:
+        """
+        Adds a shared sub-term: a function or expression used by several 
+        conditions. Its value is computed lazily the first time term() is 
+        called on a step, and discarded at the end of the step.
+
+        :param name: Name of the sub-term.
+        :type name: str
+        :param fterm: function or string expression to evaluate.
+        :type fterm: str, Callable[...,Any]
+        :return: None
+        :rtype: None
+
+        Examples:
+
+                f.add_term('v', f.read_voltage)
+                f.add_condition('t0', 'self.term("v") > 4.2')
+                f.add_condition('t1', 'self.term("v") < 3.0')
+
+        """
+        self.terms[name] = fterm
+
+    def del_term(self, name:str)->None:
+        """
+        Deletes existing sub-term.
+
+        :param name: Existing sub-term to delete.
+        :type name: str
+        :return: None
+        :rtype: None
+
+        """
+        del self.terms[name]
+
+    def term(self, name:str)->Any:
+        """
+        Gets the value of a shared sub-term on current step, evaluating it 
+        only once per step.
+
+        :param name: Name of the sub-term.
+        :type name: str
+        :return: Value of the sub-term
+        :rtype: Any
+
+        """
+        values = self.step_context.terms
+        if name in values:
+            return values[name]
+        fterm = self.terms[name]
+        value = eval(fterm) if isinstance(fterm, str) else fterm()
+        # Conditions evaluated concurrently may race: the first value stored wins
+        with self._cache_lock:
+            return values.setdefault(name, value)
+
+    def fingerprint(self)->str:
+        """
+        Calculates a fingerprint of the machine definition: transitions, 
+        conditions and shared sub-terms (expressions, or bytecode and constants 
+        of functions, so lambdas with different bodies differ).
+
+        :return: Hex digest
+        :rtype: str
+
+        """
+        h = hashlib.sha1()
+        for m in self.machine_trasitions:
+            h.update(m.encode('utf-8')+b'\n')
+        for prefix, items in (('', self.conditions), ('term:', self.terms)):
+            for key in sorted(items.keys()):
+                h.update(f'{prefix}{key}::'.encode('utf-8'))
+                _hash_callable(h, items[key])
+                h.update(b'\n')
+        return h.hexdigest()
+
+    def certify_disjoint(self, domain:Dict[str, List[Any]], samples:Optional[int]=None,
+                         seed:Optional[int]=None)->fsm_disjoint_certificate:
+        """
+        Verifies offline that outgoing transitions of every state are mutually 
+        exclusive over a declared input domain. Every input assignment is set 
+        as instance attribute, then all the outgoing conditions of each state 
+        are evaluated. Original attribute values are restored afterwards.
+
+        The certificate is stored on self.disjoint_certificate. If no overlaps 
+        are found on an exhaustive enumeration, step() runs with first-match 
+        semantics as if check_disjoint were False; sampled certificates do not.
+        The certificate is dropped when the definition changes.
+
+        :param domain: Attribute name and the list of values it may take.
+        :type domain: Dict[str, List[Any]]
+        :param samples: If None the domain is enumerated exhaustively (cartesian 
+                        product), otherwise number of random assignments per state.
+        :type samples: None or int
+        :param seed: Seed for random sampling.
+        :type seed: None or int
+        :return: Disjointness certificate
+        :rtype: fsm_disjoint_certificate
+
+        Example: 
+
+            f.certify_disjoint({'counter': range(100), 'increment': [1, 2]})
+
+        """
+        names = list(domain.keys())
+        # Sequences such as range() are used as they are, never listed
+        values = [v if isinstance(v, (range, list, tuple)) else list(v) 
+                  for v in (domain[n] for n in names)]
+        rng = random.Random(seed)
+
+        def assignments()->Iterator[Tuple[Any, ...]]:
+            # Assignments are generated lazily, again for every state
+            if samples is None:
+                return itertools.product(*values)
+            return (tuple(rng.choice(v) for v in values) for _ in range(samples))
+
+        _missing = object()
+        saved = {n: getattr(self, n, _missing) for n in names}
+        overlaps = []
+        found = set()
+        try:
+            for s, row in enumerate(self.tmatrix):
+                outgoing = [t for t in row if isinstance(t, str)]
+                if len(outgoing) < 2: 
+                    continue
+                for assignment in assignments():
+                    for n, v in zip(names, assignment):
+                        setattr(self, n, v)
+                    self.step_context.clear()
+                    true_names = ()
+                    t = ''
+                    try:
+                        for t in outgoing:
+                            if self._call_condition(t):
+                                true_names += (t,)
+                    except Exception as e:
+                        errmsg = FSMSysMgs.error_transition_eval_error(
+                                state = self.states[s], transition = t)
+                        errmsg = str(e) +'\n'+errmsg
+                        logger.error(errmsg)
+                        raise FSMTransitionEvalError(errmsg)
+                    if len(true_names) > 1 and (s, true_names) not in found: 
+                        found.add((s, true_names))
+                        inputs = dict(zip(names, assignment))
+                        overlaps.append((self.states[s], true_names, inputs))
+                        warnmsg = FSMSysMgs.warning_overlapping_transitions(
+                            self.states[s], str(list(true_names)), str(inputs))
+                        logger.warning(warnmsg)
+                        if self.warnings:
+                            warnings.warn(warnmsg)
+        finally:
+            self.step_context.clear()
+            for n, v in saved.items():
+                if v is _missing:
+                    delattr(self, n)
+                else:
+                    setattr(self, n, v)
+
+        self.disjoint_certificate = fsm_disjoint_certificate(
+            fingerprint = self.fingerprint(), 
+            exhaustive = samples is None, 
+            samples = math.prod(len(v) for v in values) if samples is None else samples,
+            overlaps = overlaps)
+        return self.disjoint_certificate
+
+    def apply_certificate(self, cert:fsm_disjoint_certificate)->None:
+        """
+        Attaches a certificate computed elsewhere (e.g. stored offline) to this 
+        machine. 
+
+        Exceptions: 
+        -----------
+            FSMInvalidCertificate : If the certificate does not match the machine definition.
+
+        :param cert: Certificate returned by certify_disjoint()
+        :type cert: fsm_disjoint_certificate
+        :return: None
+        :rtype: None
+
+        """
+        if cert.fingerprint != (fp := self.fingerprint()):
+            errmsg = FSMSysMgs.error_certificate_mismatch(fp, cert.fingerprint)
+            logger.error(errmsg)
+            raise FSMInvalidCertificate(errmsg)
+        self.disjoint_certificate = cert
 
     def add_action_on_entry(self, state:str, f:Union[str,Callable[...,Any]])->None:
         self.actions_on_entry[state] = f
@@ -820,6 +2855,97 @@ class fsm:
     def add_action_on_state(self,state:str, f:Union[str,Callable[...,Any]])->None:
         self.actions_on_state[state] = f
 
+    # Attributes making up the definition, replaced by hot_swap()
+    _definition_attributes = ('machine_trasitions', 'conditions', 'terms', 'condition_cache',
+                              'timeouts', '_state_timeouts', 'tmatrix', 'states', 'index_dict',
+                              'transition_ids', 'transition_edges', 'entry_point', 'tsymbol',
+                              'dead_states', 'check_disjoint', 'disjoint_certificate',
+                              'actions_on_state', 'actions_on_entry', 'actions_on_exit',
+                              'actions_on_transition', 'invalid_actions')
+
+    def hot_swap(self, new:'fsm', migrate:Optional[Callable[[str, 'fsm'], str]] = None)->None:
+        """
+        Schedules the replacement of the definition of this machine by the one
+        of new, a compiled fsm built meanwhile (e.g. on another thread). The 
+        swap is applied between steps, at the beginning of next step() on the 
+        thread running the machine, or by apply_swap().
+
+        Runtime state is kept: current state and history are mapped by name,
+        step counter, clock, listeners, bindings and user attributes remain.
+        Conditions and actions that are methods of new are bound to this machine.
+
+        :param new: Compiled machine with the new definition.
+        :type new: fsm
+        :param migrate: Called as migrate(state_name, new) when current state does 
+                        not exist on new definition, returns the new state name. 
+                        Entry point of new definition if None.
+        :type migrate: None or Callable[[str, fsm], str]
+        :return: None
+        :rtype: None
+
+        """
+        if new.tmatrix is None:
+            raise FSMUnknownException('New definition must be compiled')
+        self._pending_swap = (new, migrate)
+        if self.binding is not None:
+            self.binding.send(self.binding.CMD_SWAP)
+
+    def apply_swap(self)->bool:
+        """
+        Applies the definition scheduled by hot_swap(), if any. Must be called 
+        from the thread running step().
+
+        :return: True if the definition was replaced.
+        :rtype: bool
+
+        """
+        if (pending := self._pending_swap) is None:
+            return False
+        self._pending_swap = None
+        new, migrate = pending
+        old_states = self.states
+        name = old_states[self.state]
+        if name not in new.index_dict:
+            new_name = new.entry_point if migrate is None else migrate(name, new)
+            warnmsg = FSMSysMgs.warning_state_migration(name, new_name)
+            logger.warning(warnmsg)
+            if self.warnings:
+                warnings.warn(warnmsg)
+            name = new_name
+        state = new.index_dict[name]
+
+        def rebind(f):
+            if isinstance(f, types.MethodType) and f.__self__ is new:
+                return types.MethodType(f.__func__, self)
+            return f
+
+        for timer in self._armed_timers:
+            self.timer_wheel.cancel(timer)
+        self._armed_timers.clear()
+        for attr in self._definition_attributes:
+            value = getattr(new, attr)
+            if isinstance(value, dict):
+                value = {k: rebind(v) for k, v in value.items()}
+            setattr(self, attr, value)
+        self.condition_cache = {t: dataclasses.replace(c, value=None) 
+                                for t, c in new.condition_cache.items()}
+        self.conditions.update({t: fsm_timeout(self, t) for t in self.timeouts})
+        self.state = state
+        self.state_history = deque((new.index_dict.get(old_states[x]) if x is not None else None
+                                    for x in self.state_history), maxlen=self.history_len)
+        if len(self.state_history) > 0:
+            self.state_history[-1] = state
+        self.step_context.clear()
+        self.true_transitions.clear()
+        self.true_transitions_name.clear()
+        self.expired_timeouts.clear()
+        self._arm_timeouts()
+        self._take_snapshot()
+        for listener in self.swap_listeners:
+            listener(self)
+        logger.info(f'Definition swapped, state {self.get_state()}')
+        return True
+
     def __repr__(self) -> str:
         msg = f'<class {self.__class__.__name__} at {hex(id(self))}\n\n' 
         msg += 'Description: Finite state machine.\n\n' 
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmasync.py
+
+Module for running finite state machines on asyncio event loop as pyfsm module part.
+Conditions and actions can be coroutine functions, so thousands of I/O bound
+machines can share one event loop without threads.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import asyncio
+    import inspect
+    import time
+    from typing import Any
+    from typing import Awaitable
+    from typing import Callable
+    from typing import Optional
+    from typing import Union
+    from pyfsm import fsm
+    from pyfsm import fsm_step_context
+    from pyfsm import fsm_time_budget
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+class async_fsm(fsm):
+    """
+    Finite state machine with awaitable step(). It is defined and compiled as
+    fsm, but conditions and actions (on state, on entry, on exit, on transition)
+    may also be coroutine functions or expressions returning awaitables.
+
+    Outgoing conditions of current state are evaluated concurrently with
+    asyncio.gather(), on the guard executor if set (see set_guard_executor()).
+    Disjointness check, condition caches, step context, time budgets, 
+    profiling and exceptions behave as in fsm: conditions and actions go 
+    through the same methods, and awaitable results are awaited.
+
+    Example:
+
+        f = async_fsm()
+        f.add_transition('A => B : t0')
+        f.add_transition('B => A : t1')
+        f.add_condition('t0', f.poll_device)   # async def poll_device(self)->bool
+        f.add_condition('t1', 'True')
+        f.compile()
+
+        await f.step()
+
+    """
+
+    async def step(self)-> None:
+        """
+        Executes one step on FSM
+
+        :return: Coroutine object
+        :rtype: Coroutine
+
+        """
+        try:
+            await self._astep()
+        finally:
+            self._end_step()
+
+    async def _astep(self)-> None:
+        """
+        Body of step(), runs inside the step evaluation context.
+
+        """
+        if self._pending_swap is not None:
+            self.apply_swap()
+        await self._arun_action(self.actions_on_state.get(self.get_state()),
+                                'on_state', self.get_state())
+
+        first_match = self._begin_guards()
+        ctx = self.step_context
+        outgoing = [(k,t) for k,t in enumerate(self.tmatrix[self.state,:]) if isinstance(t,str)]
+        results = await asyncio.gather(*(self._aeval_condition(t, ctx) for _,t in outgoing),
+                                       return_exceptions=True)
+        for (k,t), tcond in zip(outgoing, results):
+            if isinstance(tcond, Exception):
+                self._raise_eval_error(t, tcond)
+            elif isinstance(tcond, BaseException):
+                raise tcond
+            if tcond:
+                self.true_transitions.append(k)
+                self.true_transitions_name.append(t)
+                if first_match:
+                    break
+
+        if not self._end_guards():
+            return
+
+        actions = self._commit_transition()
+        if self.action_dispatcher is not None:
+            await self.action_dispatcher.dispatch(self, actions)
+        else:
+            for f, kind, name in actions:
+                await self._arun_action(f, kind, name)
+
+        self._debug_transition()
+
+    async def _aeval_condition(self, t:str, ctx:Optional[fsm_step_context]=None)->bool:
+        """
+        Evaluates named condition t as _eval_condition(), on the guard 
+        executor if set, awaiting it if needed.
+
+        :param t: Transition condition name.
+        :type t: str
+        :param ctx: Step context to use, current one if None.
+        :type ctx: None or fsm_step_context
+        :return: Result of condition
+        :rtype: bool
+
+        """
+        if (tcond := self._lookup_condition(t, ctx)) is not None:
+            return tcond
+        if self.guard_executor is not None:
+            tcond = await asyncio.get_running_loop().run_in_executor(
+                self.guard_executor, self._call_condition, t)
+        else:
+            tcond = self._call_condition(t)
+        if inspect.isawaitable(tcond):
+            tcond = await tcond
+        self._store_condition(t, tcond, ctx)
+        return tcond
+
+    async def _arun_action(self, f:Optional[Union[str,Callable[...,Any]]], kind:str,
+                           name:str, transition:Optional[str] = None)->Any:
+        """
+        Runs an action (expression, function or coroutine function) with
+        _run_action(), awaiting its result if needed.
+
+        :param f: Action to run, if None nothing is done.
+        :param kind: 'on_state', 'on_entry', 'on_exit' or 'on_transition'.
+        :param name: State name, transition name for on transition actions.
+        :param transition: Transition the action belongs to, current one if None.
+        :return: Result of action.
+
+        """
+        result = self._run_action(f, kind, name, transition)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def _call_condition(self, t:str)->Union[bool, Awaitable[bool]]:
+        """
+        Evaluates named condition t as fsm does. If the condition returns an
+        awaitable, an awaitable of its result is returned.
+
+        """
+        budget = self.time_budgets.get(('condition', t)) if self.time_budgets else None
+        t0 = time.perf_counter() if budget is not None else 0.0
+        try:
+            result = self._eval_condition_function(t)
+        except Exception:
+            if budget is not None:
+                self._check_budget('condition', t, t0, budget)
+            raise
+        if inspect.isawaitable(result):
+            return self._await_condition(result, t, t0, budget)
+        if budget is not None:
+            self._check_budget('condition', t, t0, budget)
+        return bool(result)
+
+    async def _await_condition(self, result:Awaitable[Any], t:str, t0:float,
+                               budget:Optional[fsm_time_budget])->bool:
+        try:
+            return bool(await result)
+        finally:
+            if budget is not None:
+                self._check_budget('condition', t, t0, budget)
+
+    def _run_action(self, f:Optional[Union[str,Callable[...,Any]]], kind:str,
+                    name:str, transition:Optional[str] = None)->Any:
+        """
+        Runs an action as fsm does. If the action returns an awaitable, an
+        awaitable doing the same on completion is returned.
+
+        """
+        if f is None:
+            return None
+        if self.time_budgets and \
+                (budget := self.time_budgets.get((kind, name))) is not None:
+            return self._run_budgeted_action(f, kind, name, budget, transition)
+        try:
+            result = self._call_action(f)
+        except Exception as e:
+            raise self._action_failure(kind, name, e)
+        if inspect.isawaitable(result):
+            return self._await_action(result, kind, name)
+        return result
+
+    def _run_budgeted_action(self, f:Union[str,Callable[...,Any]], kind:str,
+                             name:str, budget:fsm_time_budget,
+                             transition:Optional[str] = None)->Any:
+        if budget.offload:
+            return super()._run_budgeted_action(f, kind, name, budget, transition)
+        t0 = time.perf_counter()
+        try:
+            result = self._call_action(f)
+        except Exception as e:
+            self._check_budget(kind, name, t0, budget, transition)
+            raise self._action_failure(kind, name, e)
+        if inspect.isawaitable(result):
+            return self._await_action(result, kind, name, t0, budget, transition)
+        self._check_budget(kind, name, t0, budget, transition)
+        return result
+
+    async def _await_action(self, result:Awaitable[Any], kind:str, name:str,
+                            t0:Optional[float] = None,
+                            budget:Optional[fsm_time_budget] = None,
+                            transition:Optional[str] = None)->Any:
+        """
+        Awaits the result of an action, mapping its errors and checking its
+        time budget (measured since t0) as _run_action() does.
+
+        """
+        try:
+            return await result
+        except Exception as e:
+            raise self._action_failure(kind, name, e)
+        finally:
+            if budget is not None:
+                self._check_budget(kind, name, t0, budget, transition)
+
+    def _offload_action(self, f:Union[str,Callable[...,Any]], kind:str,
+                        name:str, budget:fsm_time_budget,
+                        transition:Optional[str] = None)->Awaitable[Any]:
+        """
+        Runs an action on action_executor without blocking the event loop, 
+        waiting at most its budget (awaitable results included).
+
+        """
+        return self._aoffload_action(f, kind, name, budget, transition)
+
+    async def _aoffload_action(self, f:Union[str,Callable[...,Any]], kind:str,
+                               name:str, budget:fsm_time_budget,
+                               transition:Optional[str] = None)->Any:
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.action_executor, self._call_action, f), budget.budget)
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, max(budget.budget - (loop.time() - t0), 0.0))
+            return result
+        except asyncio.TimeoutError:
+            raise self._action_timeout(kind, name, budget, transition)
+        except Exception as e:
+            raise self._action_failure(kind, name, e)
+
+
+if __name__ == '__main__':
+
+    class device_fsm(async_fsm):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.counter = 0
+
+        async def ready(self)->bool:
+            await asyncio.sleep(0.01)
+            return self.counter % 3 == 0
+
+        async def on_entry_b(self)->None:
+            await asyncio.sleep(0.01)
+            self.counter += 1
+
+    def build()->device_fsm:
+        f = device_fsm()
+        f.add_transition('A => B : t0')
+        f.add_transition('B => A : t1')
+        f.add_condition('t0', f.ready)
+        f.add_condition('t1', 'True')
+        f.add_action_on_entry('B', f.on_entry_b)
+        f.add_action_on_state('A', 'self.__setattr__("counter", self.counter + 1)')
+        f.compile()
+        return f
+
+    async def run(f:device_fsm, n:int)->None:
+        for _ in range(n):
+            await f.step()
+
+    async def main()->None:
+        machines = [build() for _ in range(1000)]
+        await asyncio.gather(*(run(f, 20) for f in machines))
+        print(machines[0].printable_history())
+
+    asyncio.run(main())
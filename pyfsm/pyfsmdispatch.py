@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmdispatch.py
+
+Module for running transition, exit and entry actions of finite state
+machines out of step() as pyfsm module part. Actions are queued to a worker
+pool (or to the asyncio event loop for async_fsm) and run in order per
+machine instance, with a backpressure limit and flush/drain.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import asyncio
+    import threading
+    from collections import deque
+    from concurrent.futures import Executor
+    from concurrent.futures import ThreadPoolExecutor
+    from typing import Any
+    from typing import Callable
+    from typing import Deque
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+    from pyfsm import fsm
+    from pyfsm import FSMRuntimeException
+    from pyfsmasync import async_fsm
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+class FSMActionBacklogError(FSMRuntimeException):
+    pass
+
+
+class _dispatcher_base:
+    """
+    Bookkeeping shared by synchronous and asyncio dispatchers: one queue of
+    action batches per machine instance, registered while a worker drains it.
+    Batches are (transition, actions) tuples.
+
+    """
+
+    _async : bool = False # runs actions of async_fsm instances
+
+    def __init__(self, max_pending:int, timeout:Optional[float],
+                 error_callback:Optional[Callable[[fsm, Exception], Any]]) -> None:
+        if max_pending < 1:
+            raise FSMActionBacklogError('max_pending must be greater than 0')
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.error_callback = error_callback
+        self.pending = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.errors : List[Tuple[fsm, Exception]] = []
+        self._queues : Dict[int, Deque[Tuple[Optional[str], List[Tuple[Any, str, str]]]]] = {}
+        self._closed = False
+        self._errors_lock = threading.Lock()
+
+    def attach(self, f:fsm) -> None:
+        """
+        Makes f queue its transition, exit and entry actions to this dispatcher.
+
+        :param f: Machine instance, async_fsm for async dispatchers only.
+        :type f: fsm
+        :return: None
+        :rtype: None
+
+        """
+        if isinstance(f, async_fsm) != self._async:
+            raise FSMRuntimeException(f'{type(self).__name__} can not run actions of '
+                                      f'{type(f).__name__} instances')
+        f.action_dispatcher = self
+
+    def _failed(self, f:fsm, e:Exception) -> None:
+        with self._errors_lock:
+            self.errors.append((f, e))
+        if self.error_callback is not None:
+            self.error_callback(f, e)
+
+    def _raise_errors(self, f:Optional[fsm]) -> None:
+        # Errors are raised on flush as step() would have raised them inline
+        with self._errors_lock:
+            found = [e for g, e in self.errors if f is None or g is f]
+            self.errors = [(g, e) for g, e in self.errors if not (f is None or g is f)]
+        if found:
+            raise found[0]
+
+    def _idle(self, f:Optional[fsm]) -> bool:
+        return not self._queues if f is None else id(f) not in self._queues
+
+
+class fsm_action_dispatcher(_dispatcher_base):
+    """
+    Runs transition, exit and entry actions of attached machines on a worker
+    pool, so step() returns as soon as the transition is committed. Batches
+    of one instance run one after another in step order, each one in the
+    order step() runs them (on transition, on exit, on entry); different
+    instances run concurrently.
+
+    At most max_pending batches are queued: dispatch() then waits timeout
+    seconds for room (forever if None) and raises FSMActionBacklogError; the
+    transition is already committed then, and its actions are not run.
+    Action errors do not stop the machine; they stop the rest of their batch,
+    are passed to error_callback and raised by flush().
+
+    Actions run while the machine keeps stepping, so they must not rely on
+    current state: use values captured at commit time instead.
+
+    Example:
+
+        dispatcher = fsm_action_dispatcher(max_workers=4, max_pending=256)
+        dispatcher.attach(f)
+        for _ in range(1000):
+            f.step()
+        dispatcher.flush(f)
+        dispatcher.close()
+
+    """
+
+    def __init__(self, executor:Optional[Executor] = None, max_workers:Optional[int] = None,
+                 max_pending:int = 1024, timeout:Optional[float] = None,
+                 error_callback:Optional[Callable[[fsm, Exception], Any]] = None) -> None:
+        """
+        Constructor:
+
+        :param executor: Executor running the actions. If None, a ThreadPoolExecutor with max_workers threads is created.
+        :type executor: None or Executor
+        :param max_workers: Number of threads of created ThreadPoolExecutor.
+        :type max_workers: None or int
+        :param max_pending: Maximum number of queued batches (one per transition).
+        :type max_pending: int
+        :param timeout: Seconds dispatch() waits for room in the queue, forever if None.
+        :type timeout: None or float
+        :param error_callback: Called with machine and exception when an action fails.
+        :type error_callback: None or Callable[[fsm, Exception], Any]
+
+        """
+        super().__init__(max_pending, timeout, error_callback)
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers,
+                                          thread_name_prefix='pyfsm-dispatch')
+        self.executor = executor
+        self._cv = threading.Condition()
+
+    def detach(self, f:fsm) -> None:
+        """
+        Runs pending actions of f, then f runs its actions inside step() again.
+
+        :param f: Machine instance.
+        :type f: fsm
+        :return: None
+        :rtype: None
+
+        """
+        try:
+            self.flush(f)
+        finally:
+            f.action_dispatcher = None
+
+    def dispatch(self, f:fsm, actions:List[Tuple[Any, str, str]]) -> None:
+        """
+        Queues the actions of a committed transition of f (called by step()).
+
+        :param f: Machine instance.
+        :type f: fsm
+        :param actions: (action, kind, name) in execution order.
+        :type actions: List[Tuple[Any, str, str]]
+        :return: None
+        :rtype: None
+
+        """
+        batch = [a for a in actions if a[0] is not None]
+        if not batch:
+            return
+        # Reports of actions name their own transition, not the current one
+        transition = f.true_transitions_name[0] if f.true_transitions_name else None
+        with self._cv:
+            if self._closed:
+                raise FSMActionBacklogError('Action dispatcher is closed')
+            if not self._cv.wait_for(lambda: self.pending < self.max_pending, self.timeout):
+                raise FSMActionBacklogError(f'{self.pending} action batches pending, '
+                                            f'no room after {self.timeout} s')
+            self.pending += 1
+            self.dispatched += 1
+            queue = self._queues.get(id(f))
+            start = queue is None
+            if start:
+                queue = self._queues[id(f)] = deque()
+            queue.append((transition, batch))
+        if start:
+            try:
+                self.executor.submit(self._drain, f, queue)
+            except Exception as e:
+                # Nobody drains the queue: forget it with its batches
+                with self._cv:
+                    del self._queues[id(f)]
+                    self.pending -= len(queue)
+                    self.dispatched -= len(queue)
+                    self._cv.notify_all()
+                raise FSMActionBacklogError(f'Action batch not submitted: {e}') from e
+
+    def _drain(self, f:fsm, queue:Deque[Tuple[Optional[str], List[Tuple[Any, str, str]]]]) -> None:
+        while True:
+            with self._cv:
+                if not queue:
+                    del self._queues[id(f)]
+                    self._cv.notify_all()
+                    return
+                transition, batch = queue.popleft()
+            try:
+                for action, kind, name in batch:
+                    f._run_action(action, kind, name, transition)
+            except Exception as e:
+                self._failed(f, e)
+            finally:
+                with self._cv:
+                    self.pending -= 1
+                    self.completed += 1
+                    self._cv.notify_all()
+
+    def flush(self, f:Optional[fsm] = None, timeout:Optional[float] = None) -> bool:
+        """
+        Waits until queued actions of f (all machines if None) have run, and
+        raises the first action error they produced.
+
+        :param f: Machine instance, all if None.
+        :type f: None or fsm
+        :param timeout: Seconds to wait, forever if None.
+        :type timeout: None or float
+        :return: False if timeout expired before.
+        :rtype: bool
+
+        """
+        with self._cv:
+            if not self._cv.wait_for(lambda: self._idle(f), timeout):
+                return False
+            self._raise_errors(f)
+        return True
+
+    def close(self, drain:bool = True) -> None:
+        """
+        Stops accepting actions and, if drain, waits for queued ones. Created
+        executor is shut down. Errors are left in errors.
+
+        :param drain: If True waits until queued actions have run.
+        :type drain: bool
+        :return: None
+        :rtype: None
+
+        """
+        with self._cv:
+            self._closed = True
+            if drain:
+                self._cv.wait_for(lambda: self._idle(None))
+        if self._own_executor:
+            self.executor.shutdown(wait=drain)
+
+    def __enter__(self) -> 'fsm_action_dispatcher':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class async_fsm_action_dispatcher(_dispatcher_base):
+    """
+    fsm_action_dispatcher for async_fsm: actions of every instance are run
+    by a task of the running event loop, in step order, and awaitable
+    actions are awaited. When max_pending batches are queued, step() waits
+    for room.
+
+    Example:
+
+        dispatcher = async_fsm_action_dispatcher(max_pending=64)
+        dispatcher.attach(f)
+        for _ in range(1000):
+            await f.step()
+        await dispatcher.flush(f)
+
+    """
+
+    _async : bool = True
+
+    def __init__(self, max_pending:int = 1024, timeout:Optional[float] = None,
+                 error_callback:Optional[Callable[[fsm, Exception], Any]] = None) -> None:
+        """
+        Constructor:
+
+        :param max_pending: Maximum number of queued batches (one per transition).
+        :type max_pending: int
+        :param timeout: Seconds dispatch() waits for room in the queue, forever if None.
+        :type timeout: None or float
+        :param error_callback: Called with machine and exception when an action fails.
+        :type error_callback: None or Callable[[fsm, Exception], Any]
+
+        """
+        super().__init__(max_pending, timeout, error_callback)
+        self._cv : Optional[asyncio.Condition] = None
+        self._tasks : Dict[int, asyncio.Task] = {}
+
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily, inside the event loop running the machines
+        if self._cv is None:
+            self._cv = asyncio.Condition()
+        return self._cv
+
+    async def detach(self, f:async_fsm) -> None:
+        """
+        Runs pending actions of f, then f runs its actions inside step() again.
+
+        :param f: Machine instance.
+        :type f: async_fsm
+        :return: None
+        :rtype: None
+
+        """
+        try:
+            await self.flush(f)
+        finally:
+            f.action_dispatcher = None
+
+    async def dispatch(self, f:async_fsm, actions:List[Tuple[Any, str, str]]) -> None:
+        """
+        Queues the actions of a committed transition of f (awaited by step()).
+
+        :param f: Machine instance.
+        :type f: async_fsm
+        :param actions: (action, kind, name) in execution order.
+        :type actions: List[Tuple[Any, str, str]]
+        :return: None
+        :rtype: None
+
+        """
+        batch = [a for a in actions if a[0] is not None]
+        if not batch:
+            return
+        # Reports of actions name their own transition, not the current one
+        transition = f.true_transitions_name[0] if f.true_transitions_name else None
+        cv = self._condition()
+        async with cv:
+            if self._closed:
+                raise FSMActionBacklogError('Action dispatcher is closed')
+            try:
+                await asyncio.wait_for(cv.wait_for(lambda: self.pending < self.max_pending),
+                                       self.timeout)
+            except asyncio.TimeoutError:
+                raise FSMActionBacklogError(f'{self.pending} action batches pending, '
+                                            f'no room after {self.timeout} s')
+            if self._closed:
+                raise FSMActionBacklogError('Action dispatcher is closed')
+            self.pending += 1
+            self.dispatched += 1
+            queue = self._queues.get(id(f))
+            if queue is None:
+                queue = self._queues[id(f)] = deque()
+                self._tasks[id(f)] = asyncio.get_running_loop().create_task(self._drain(f, queue))
+            queue.append((transition, batch))
+
+    async def _drain(self, f:async_fsm, queue:Deque[Tuple[Optional[str], List[Tuple[Any, str, str]]]]) -> None:
+        cv = self._condition()
+        while True:
+            async with cv:
+                if not queue:
+                    del self._queues[id(f)]
+                    del self._tasks[id(f)]
+                    cv.notify_all()
+                    return
+                transition, batch = queue.popleft()
+            try:
+                for action, kind, name in batch:
+                    await f._arun_action(action, kind, name, transition)
+            except Exception as e:
+                self._failed(f, e)
+            finally:
+                async with cv:
+                    self.pending -= 1
+                    self.completed += 1
+                    cv.notify_all()
+
+    async def flush(self, f:Optional[async_fsm] = None, timeout:Optional[float] = None) -> bool:
+        """
+        Waits until queued actions of f (all machines if None) have run, and
+        raises the first action error they produced.
+
+        :param f: Machine instance, all if None.
+        :type f: None or async_fsm
+        :param timeout: Seconds to wait, forever if None.
+        :type timeout: None or float
+        :return: False if timeout expired before.
+        :rtype: bool
+
+        """
+        cv = self._condition()
+        async with cv:
+            try:
+                await asyncio.wait_for(cv.wait_for(lambda: self._idle(f)), timeout)
+            except asyncio.TimeoutError:
+                return False
+            self._raise_errors(f)
+        return True
+
+    async def close(self, drain:bool = True) -> None:
+        """
+        Stops accepting actions and, if drain, waits for queued ones,
+        otherwise cancels running ones and discards queued ones. Errors are
+        left in errors.
+
+        :param drain: If True waits until queued actions have run.
+        :type drain: bool
+        :return: None
+        :rtype: None
+
+        """
+        self._closed = True
+        cv = self._condition()
+        if drain:
+            async with cv:
+                await cv.wait_for(lambda: self._idle(None))
+        else:
+            tasks = list(self._tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            async with cv:
+                self._queues.clear()
+                self._tasks.clear()
+                self.pending = 0
+                cv.notify_all()
+
+
+if __name__ == '__main__':
+    import time
+
+    class db_fsm(fsm):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.log : List[str] = []
+
+        def write(self, what:str) -> None:
+            time.sleep(0.002)
+            self.log.append(what)
+
+    def build() -> db_fsm:
+        f = db_fsm()
+        f.add_transition('A => B : t0')
+        f.add_transition('B => A : t1')
+        f.add_condition('t0', 'True')
+        f.add_condition('t1', 'True')
+        f.add_action_on_exit('A', 'self.write("exit A")')
+        f.add_action_on_transition('t0', 'self.write("t0")')
+        f.add_action_on_entry('B', 'self.write("entry B")')
+        f.compile()
+        return f
+
+    machines = [build() for _ in range(4)]
+    with fsm_action_dispatcher(max_workers=4, max_pending=16) as dispatcher:
+        for f in machines:
+            dispatcher.attach(f)
+        t0 = time.perf_counter()
+        for _ in range(50):
+            for f in machines:
+                f.step()
+        t1 = time.perf_counter()
+        dispatcher.flush()
+        t2 = time.perf_counter()
+    for f in machines:
+        assert f.log == ['t0', 'exit A', 'entry B'] * 25
+    print(f'steps {t1-t0:.3f} s, flush {t2-t1:.3f} s, {dispatcher.completed} batches')
+
+    class adb_fsm(async_fsm):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.log : List[str] = []
+
+        async def write(self, what:str) -> None:
+            await asyncio.sleep(0.001)
+            self.log.append(what)
+
+    async def main() -> None:
+        f = adb_fsm()
+        f.add_transition('A => B : t0')
+        f.add_transition('B => A : t1')
+        f.add_condition('t0', 'True')
+        f.add_condition('t1', 'True')
+        f.add_action_on_exit('A', 'self.write("exit A")')
+        f.add_action_on_entry('B', 'self.write("entry B")')
+        f.compile()
+        dispatcher = async_fsm_action_dispatcher(max_pending=4)
+        dispatcher.attach(f)
+        for _ in range(20):
+            await f.step()
+        await dispatcher.detach(f)
+        assert f.log == ['exit A', 'entry B'] * 10
+        print(f'async {dispatcher.completed} batches')
+
+    asyncio.run(main())
@@ -240,6 +240,9 @@ class dynamic_graph:
         
     # Generar SVG
     def build_svg(self) -> str:
+        # State and transition are read once from an atomic snapshot, the FSM 
+        # may be stepping on another thread
+        snapshot = self.fsm_inst.snapshot
         dot = Digraph()
         dot.attr(rankdir='LR')
         if self.properties.mode == 'ligth': 
@@ -258,7 +261,7 @@ class dynamic_graph:
             dot.attr('node', **self.properties.default_node_dark_properties)
             dot.attr('edge', **self.properties.default_edge_dark_properties) 
 
-        if self.states[self.fsm_inst.state] == self.initial_state: 
+        if snapshot.state == self.initial_state: 
             if self.properties.mode == 'ligth':
                 dot.node(str(self.initial_state), 
                          **{**self.properties.active_init_ligth_properties,
@@ -279,7 +282,7 @@ class dynamic_graph:
 
 
         for node in (n for n in self.states if n != self.initial_state):
-            if node != self.states[self.fsm_inst.state]:
+            if node != snapshot.state:
                 dot.node(node, **self.get_custom_node_properties(node))
             else:
                 if self.properties.mode == 'ligth':
@@ -291,7 +294,7 @@ class dynamic_graph:
 
         # edges
         for transition in self.node_transitions.keys():
-            if transition not in self.fsm_inst.true_transitions_name: 
+            if transition != snapshot.transition: 
                 
                 dd = self.get_custom_edge_properties(transition) 
                 if not 'label' in dd.keys():
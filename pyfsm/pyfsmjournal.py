@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmjournal.py
+
+Module for crash recovery of finite state machines as pyfsm module part.
+Runtime state of many fsm or fsm_session instances (state, step counter,
+history and user context) is saved in compact snapshots, and transitions in
+between are appended to a journal committed in groups. Recovery loads the
+last snapshot and replays the journal on top of it.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import os
+    import time
+    import zlib
+    import pickle
+    import struct
+    import weakref
+    from collections import deque
+    from typing import Any
+    from typing import Callable
+    from typing import Dict
+    from typing import Hashable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Tuple
+    from typing import Union
+    from pyfsm import fsm
+    from pyfsm import FSMException
+    from pyfsmsession import fsm_definition
+    from pyfsmsession import fsm_session
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+# Journal frame header: payload length, payload crc32, sequence number of first record.
+# truncate() writes a frame without records whose sequence number is the last one
+# used, so the counter survives restarts.
+_FRAME = struct.Struct('<IIQ')
+SNAPSHOT_VERSION = 1
+
+
+class FSMJournalError(FSMException):
+    pass
+
+
+class fsm_journal:
+    """
+    Append-only journal of transitions. Every attached instance appends a
+    record (seq, key, steps, origin, dest, transition) on each transition;
+    records are written and fsync'ed in groups of group_size records, or when
+    group_interval seconds have passed since last commit, or on commit().
+    A crash loses at most the records not committed yet.
+
+    States and transitions are journaled by name, so a journal can be
+    replayed on a new build of the definition.
+
+    Example:
+
+        journal = fsm_journal('machines.journal')
+        for key, s in sessions.items():
+            journal.attach(key, s)
+        ...
+        journal.commit()
+
+    """
+
+    def __init__(self, path:str, group_size:int = 1024, group_interval:float = 0.05,
+                 fsync:bool = True) -> None:
+        """
+        Constructor:
+
+        :param path: Journal file, records are appended if it exists.
+        :type path: str
+        :param group_size: Records committed at once.
+        :type group_size: int
+        :param group_interval: Maximum seconds between commits while records are appended.
+        :type group_interval: float
+        :param fsync: If True, every commit is fsync'ed.
+        :type fsync: bool
+
+        """
+        self.path = path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.fsync = fsync
+        self.seq = 0
+        for seq, records in _read_frames(path):
+            self.seq = records[-1][0] if records else max(self.seq, seq)
+        self.commits = 0
+        self._pending : List[Tuple[int, Hashable, int, str, str, str]] = []
+        self._last_commit = time.monotonic()
+        self._fd = open(path, 'ab')
+        self._keys : weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._sources : Dict[Hashable, Any] = {}
+
+    def attach(self, key:Hashable, instance:Union[fsm, fsm_session]) -> None:
+        """
+        Starts journaling transitions of instance under key.
+
+        :param key: Instance key, must be picklable.
+        :type key: Hashable
+        :param instance: Machine or session.
+        :type instance: fsm or fsm_session
+        :return: None
+        :rtype: None
+
+        """
+        self._keys[instance] = key
+        self._sources[key] = instance
+        if isinstance(instance, fsm_session):
+            if self._on_session_transition not in instance.definition._listeners:
+                instance.definition.add_transition_listener(self._on_session_transition)
+        else:
+            instance.add_transition_listener(self._on_fsm_transition)
+
+    def detach(self, key:Hashable) -> None:
+        """
+        Stops journaling transitions of instance attached under key.
+
+        :param key: Instance key.
+        :type key: Hashable
+        :return: None
+        :rtype: None
+
+        """
+        instance = self._sources.pop(key)
+        del self._keys[instance]
+        if isinstance(instance, fsm):
+            instance.del_transition_listener(self._on_fsm_transition)
+        elif not any(isinstance(i, fsm_session) and i.definition is instance.definition
+                     for i in self._sources.values()):
+            instance.definition.del_transition_listener(self._on_session_transition)
+
+    def _on_fsm_transition(self, f:fsm, origin:int, dest:int, tid:int, timestamp:float) -> None:
+        self.append(self._keys[f], f.step_count + 1, f.states[origin], f.states[dest],
+                    f.true_transitions_name[0])
+
+    def _on_session_transition(self, s:fsm_session, origin:int, dest:int, tid:int,
+                               timestamp:float) -> None:
+        if (key := self._keys.get(s)) is not None:
+            d = s.definition
+            self.append(key, s.step_count, d.states[origin], d.states[dest],
+                        d.transition_names[tid])
+
+    def append(self, key:Hashable, steps:int, origin:str, dest:str, transition:str) -> int:
+        """
+        Appends a record, committing the group when it is full or too old.
+
+        :param key: Instance key.
+        :type key: Hashable
+        :param steps: Step counter of the instance after the transition.
+        :type steps: int
+        :param origin: Origin state name.
+        :type origin: str
+        :param dest: Destination state name.
+        :type dest: str
+        :param transition: Transition name.
+        :type transition: str
+        :return: Sequence number of the record.
+        :rtype: int
+
+        """
+        self.seq += 1
+        self._pending.append((self.seq, key, steps, origin, dest, transition))
+        if len(self._pending) >= self.group_size or \
+                time.monotonic() - self._last_commit >= self.group_interval:
+            self.commit()
+        return self.seq
+
+    def commit(self) -> None:
+        """
+        Writes pending records as one frame and fsyncs the journal.
+
+        :return: None
+        :rtype: None
+
+        """
+        self._last_commit = time.monotonic()
+        if not self._pending:
+            return
+        payload = pickle.dumps(self._pending, protocol=pickle.HIGHEST_PROTOCOL)
+        self._fd.write(_FRAME.pack(len(payload), zlib.crc32(payload), self._pending[0][0]))
+        self._fd.write(payload)
+        self._fd.flush()
+        if self.fsync:
+            os.fsync(self._fd.fileno())
+        self._pending = []
+        self.commits += 1
+
+    def truncate(self) -> None:
+        """
+        Commits pending records and empties the journal, keeping the sequence
+        counter in a frame without records. Called after a snapshot makes 
+        existing records useless.
+
+        :return: None
+        :rtype: None
+
+        """
+        self.commit()
+        self._fd.truncate(0)
+        self._fd.seek(0)
+        payload = pickle.dumps([], protocol=pickle.HIGHEST_PROTOCOL)
+        self._fd.write(_FRAME.pack(len(payload), zlib.crc32(payload), self.seq))
+        self._fd.write(payload)
+        self._fd.flush()
+        if self.fsync:
+            os.fsync(self._fd.fileno())
+
+    def close(self) -> None:
+        """
+        Commits pending records, detaches all instances and closes the journal.
+
+        :return: None
+        :rtype: None
+
+        """
+        for key in list(self._sources):
+            self.detach(key)
+        self.commit()
+        self._fd.close()
+
+    def __enter__(self) -> 'fsm_journal':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def read_journal(path:str) -> Iterator[Tuple[int, Hashable, int, str, str, str]]:
+    """
+    Reads committed journal records. A torn or corrupted frame at the end
+    (crash while writing) ends the journal.
+
+    :param path: Journal file.
+    :type path: str
+    :return: Iterator of (seq, key, steps, origin, dest, transition)
+    :rtype: Iterator[Tuple[int, Hashable, int, str, str, str]]
+
+    """
+    for _, records in _read_frames(path):
+        yield from records
+
+
+def _read_frames(path:str) -> Iterator[Tuple[int, List[Tuple[int, Hashable, int, str, str, str]]]]:
+    """
+    Reads committed journal frames as (sequence number in header, records).
+
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as fd:
+        data = fd.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc, seq = _FRAME.unpack_from(data, offset)
+        payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning(f'{path}: journal ends with a corrupted frame at offset {offset}')
+            return
+        yield seq, pickle.loads(payload)
+        offset += _FRAME.size + length
+
+
+class fsm_checkpoint:
+    """
+    Snapshots of runtime state of many instances, plus journal replay for
+    recovery. Only runtime state is saved: current state, step counter,
+    history and session context (or the listed attributes of fsm instances),
+    never the compiled definition.
+
+    Snapshots are written to a temporary file, fsync'ed and renamed, so a
+    crash while saving keeps the previous one. The journal is truncated
+    after every snapshot; records older than the snapshot are ignored on
+    recovery anyway, using the sequence number stored in it.
+
+    Contexts are restored as of the snapshot, and step counters as of the
+    last journaled transition: steps without transition are not journaled.
+
+    Example:
+
+        checkpoint = fsm_checkpoint('machines.snapshot', journal)
+        checkpoint.save(sessions)         # periodically
+        ...
+        # after a restart
+        sessions = checkpoint.recover(definition)
+
+    """
+
+    def __init__(self, path:str, journal:Optional[Union[fsm_journal, str]] = None,
+                 attributes:Sequence[str] = ()) -> None:
+        """
+        Constructor:
+
+        :param path: Snapshot file.
+        :type path: str
+        :param journal: Journal (or its path) of transitions after the snapshot.
+        :type journal: None, str or fsm_journal
+        :param attributes: Instance attributes saved for fsm instances (user context).
+        :type attributes: Sequence[str]
+
+        """
+        self.path = path
+        self.journal = journal
+        self.attributes = tuple(attributes)
+
+    @property
+    def journal_path(self) -> Optional[str]:
+        return self.journal.path if isinstance(self.journal, fsm_journal) else self.journal
+
+    def save(self, instances:Dict[Hashable, Union[fsm, fsm_session]]) -> int:
+        """
+        Saves a snapshot of instances and truncates the journal.
+
+        :param instances: Instances by key.
+        :type instances: Dict[Hashable, Union[fsm, fsm_session]]
+        :return: Sequence number of last journal record included.
+        :rtype: int
+
+        """
+        seq = 0
+        if isinstance(self.journal, fsm_journal):
+            self.journal.commit()
+            seq = self.journal.seq
+        records = []
+        for key, i in instances.items():
+            if isinstance(i, fsm_session):
+                states = i.definition.states
+                history = None if i.history is None else [states[x] for x in i.history]
+                records.append((key, states[i.state], i.step_count, history, i.context))
+            else:
+                history = [i.states[x] for x in i.state_history if x is not None]
+                context = {a: getattr(i, a) for a in self.attributes if hasattr(i, a)}
+                records.append((key, i.states[i.state], i.step_count, history, context))
+        payload = pickle.dumps({'version': SNAPSHOT_VERSION, 'seq': seq, 'records': records},
+                               protocol=pickle.HIGHEST_PROTOCOL)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as fd:
+            fd.write(payload)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(tmp, self.path)
+        if isinstance(self.journal, fsm_journal):
+            self.journal.truncate()
+        return seq
+
+    def load(self) -> Dict[Hashable, List[Any]]:
+        """
+        Loads last snapshot and replays the journal on it, without creating instances.
+
+        :return: Dictionary of key to [state, steps, history, context].
+        :rtype: Dict[Hashable, List[Any]]
+
+        """
+        seq = 0
+        state : Dict[Hashable, List[Any]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as fd:
+                snapshot = pickle.load(fd)
+            if snapshot.get('version') != SNAPSHOT_VERSION:
+                raise FSMJournalError(f'{self.path}: unknown snapshot version')
+            seq = snapshot['seq']
+            state = {r[0]: list(r[1:]) for r in snapshot['records']}
+        if (path := self.journal_path) is not None:
+            for rseq, key, steps, _, dest, _ in read_journal(path):
+                if rseq <= seq:
+                    continue
+                if (r := state.get(key)) is None:
+                    r = state[key] = [dest, steps, [], None]
+                r[0] = dest
+                r[1] = steps
+                if r[2] is not None:
+                    r[2].append(dest)
+        return state
+
+    def recover(self, definition:Optional[fsm_definition] = None,
+                factory:Optional[Callable[[Hashable], fsm]] = None) -> Dict[Hashable, Union[fsm, fsm_session]]:
+        """
+        Restores instances from last snapshot and journal.
+
+        :param definition: Definition of restored sessions.
+        :type definition: None or fsm_definition
+        :param factory: Called with key, returns a compiled fsm to restore on (when definition is None).
+        :type factory: None or Callable[[Hashable], fsm]
+        :return: Restored instances by key.
+        :rtype: Dict[Hashable, Union[fsm, fsm_session]]
+
+        """
+        if (definition is None) == (factory is None):
+            raise FSMJournalError('Either definition or factory must be given')
+        instances = {}
+        if definition is not None:
+            # Sessions are built field by field, bypassing __init__
+            index = definition.index_dict
+            hlen = definition.history_len
+            new = fsm_session.__new__
+            for key, (state, steps, history, context) in self.load().items():
+                s = new(fsm_session)
+                s.definition = definition
+                s.state = index[state]
+                s.context = context
+                s.step_count = steps
+                s.history = None
+                if hlen > 0:
+                    s.history = deque(map(index.__getitem__, history or (state,)), hlen)
+                instances[key] = s
+            return instances
+        for key, (state, steps, history, context) in self.load().items():
+            f = factory(key)
+            for a, v in (context or {}).items():
+                setattr(f, a, v)
+            f.state = f.index_dict[state]
+            f.step_count = steps
+            f.state_history.clear()
+            f.state_history_time.clear()
+            for x in history[-f.history_len:] if history else (state,):
+                f.state_history.append(f.index_dict[x])
+                f.state_history_time.append(f.clock.monotonic())
+            f._arm_timeouts()
+            f._take_snapshot()
+            instances[key] = f
+        return instances
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    f = fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => C : t1')
+    f.add_transition('C => A : t2')
+    f.add_condition('t0', 'ctx["a"] % 10 == 0')
+    f.add_condition('t1', 'ctx["a"] % 7 == 0')
+    f.add_condition('t2', 'ctx["a"] % 11 == 0')
+    f.compile()
+    definition = fsm_definition.from_fsm(f, history_len=4)
+
+    folder = tempfile.mkdtemp()
+    N = 100000
+    sessions = {k: definition.new_instance({'a': k}) for k in range(N)}
+    journal = fsm_journal(os.path.join(folder, 'demo.journal'))
+    for k, s in sessions.items():
+        journal.attach(k, s)
+    checkpoint = fsm_checkpoint(os.path.join(folder, 'demo.snapshot'), journal)
+
+    t0 = time.perf_counter()
+    checkpoint.save(sessions)
+    t1 = time.perf_counter()
+    for a in range(20):
+        for s in sessions.values():
+            s.context['a'] += 1
+            s.step()
+    journal.close()
+    print(f'snapshot of {N} sessions in {t1-t0:.3f} s, '
+          f'{journal.seq} transitions journaled in {journal.commits} commits')
+
+    # Crash: every session is lost. Recover from snapshot plus journal.
+    t0 = time.perf_counter()
+    recovered = fsm_checkpoint(os.path.join(folder, 'demo.snapshot'),
+                               os.path.join(folder, 'demo.journal')).recover(definition)
+    t1 = time.perf_counter()
+    same = all(recovered[k].state == s.state and recovered[k].history == s.history
+               for k, s in sessions.items())
+    print(f'{len(recovered)} sessions recovered in {t1-t0:.3f} s, consistent: {same}')
+
+    # Restart right after a snapshot: sequence numbers go on after the snapshot ones
+    path, snap = os.path.join(folder, 'restart.journal'), os.path.join(folder, 'restart.snapshot')
+    s = definition.new_instance({'a': 0})
+    journal = fsm_journal(path)
+    journal.attach('s', s)
+    for _ in range(5):
+        s.context['a'] += 10
+        s.step()
+    fsm_checkpoint(snap, journal).save({'s': s})
+    journal.close()
+    journal = fsm_journal(path)
+    journal.attach('s', s)
+    s.context['a'] = 7
+    s.step()
+    journal.close()
+    recovered = fsm_checkpoint(snap, path).recover(definition)
+    assert recovered['s'].get_state() == s.get_state(), (recovered['s'].get_state(), s.get_state())
+    print(f'restart after snapshot: recovered {recovered["s"].get_state()}, live {s.get_state()}')
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmmetrics.py
+
+Module for exposing runtime metrics of finite state machines in Prometheus
+text format as pyfsm module part. Values are read from counters kept by the
+running machine (step count, fsm_stats, fsm_profiler), so rendering them
+never runs in or waits for the step loop.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    from bisect import bisect_left
+    from array import array
+    from typing import Callable
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Tuple
+    from pyfsm import fsm
+    from pyfsmstats import fsm_stats
+    from pyfsmprofile import fsm_profiler
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+# Default latency buckets in seconds, 10 us to 10 s
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _escape(value:str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels:Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value:float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class latency_histogram:
+    """
+    Cumulative histogram of durations in seconds with fixed bucket bounds,
+    as a Prometheus histogram. observe() costs one bisection and two
+    additions.
+
+    """
+
+    def __init__(self, buckets:Sequence[float] = LATENCY_BUCKETS) -> None:
+        """
+        Constructor:
+
+        :param buckets: Increasing upper bounds in seconds.
+        :type buckets: Sequence[float]
+
+        """
+        self.buckets = tuple(buckets)
+        self.counts = array('q', bytes(8 * (len(self.buckets) + 1)))
+        self.sum = 0.0
+
+    def observe(self, seconds:float) -> None:
+        """
+        Adds one duration.
+
+        :param seconds: Duration in seconds.
+        :type seconds: float
+        :return: None
+        :rtype: None
+
+        """
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+
+
+class fsm_metrics:
+    """
+    Collects runtime metrics of a compiled machine and renders them in
+    Prometheus text exposition format:
+
+        pyfsm_steps_total                  counter, steps since compile() or reset()
+        pyfsm_transitions_total            counter per transition (origin, dest, transition)
+        pyfsm_state                        gauge, 1 for current state and 0 for the rest
+        pyfsm_guard_duration_seconds       histogram per transition (if latency)
+        pyfsm_action_duration_seconds      histogram per action kind and name (if latency)
+
+    plus gauges and histograms added with add_gauge() and add_histogram().
+    Step rate is rate(pyfsm_steps_total[...]) on Prometheus side.
+
+    Transition counters come from a fsm_stats and latencies from a
+    fsm_profiler with histograms, which wraps step() while attached: latency
+    is opt-in.
+
+    Example:
+
+        metrics = fsm_metrics(f, labels={'machine': 'line1'}, latency=True)
+        ...                                   # f.step() as usual
+        text = metrics.render()               # body of GET /metrics
+
+    """
+
+    def __init__(self, f:fsm, labels:Optional[Dict[str, str]] = None, latency:bool = False,
+                 buckets:Sequence[float] = LATENCY_BUCKETS) -> None:
+        """
+        Constructor: attaches statistics (and profiler if latency) to f.
+
+        :param f: Compiled machine.
+        :type f: fsm
+        :param labels: Labels added to every sample, e.g. {'machine': 'line1'}.
+        :type labels: None or Dict[str, str]
+        :param latency: If True guard and action latency histograms are collected.
+        :type latency: bool
+        :param buckets: Latency histogram bounds in seconds.
+        :type buckets: Sequence[float]
+
+        """
+        self.fsm = f
+        self.labels : Dict[str, str] = dict(labels or {})
+        self.profiler : Optional[fsm_profiler] = fsm_profiler(f, buckets=buckets) if latency else None
+        self.stats = fsm_stats(f)
+        self._gauges : List[Tuple[str, str, Callable[[], float]]] = []
+        self._histograms : List[Tuple[str, str, latency_histogram]] = []
+
+    def add_gauge(self, name:str, help:str, fn:Callable[[], float]) -> None:
+        """
+        Adds a gauge read by calling fn on every render.
+
+        :param name: Metric name.
+        :type name: str
+        :param help: Help text.
+        :type help: str
+        :param fn: Returns current value.
+        :type fn: Callable[[], float]
+        :return: None
+        :rtype: None
+
+        """
+        self._gauges.append((name, help, fn))
+
+    def add_histogram(self, name:str, help:str,
+                      buckets:Sequence[float] = LATENCY_BUCKETS) -> latency_histogram:
+        """
+        Adds a histogram fed by the caller.
+
+        :param name: Metric name.
+        :type name: str
+        :param help: Help text.
+        :type help: str
+        :param buckets: Bounds in seconds.
+        :type buckets: Sequence[float]
+        :return: Histogram to observe() durations on.
+        :rtype: latency_histogram
+
+        """
+        h = latency_histogram(buckets)
+        self._histograms.append((name, help, h))
+        return h
+
+    def _header(self, out:List[str], name:str, help:str, kind:str) -> None:
+        out.append(f'# HELP {name} {help}')
+        out.append(f'# TYPE {name} {kind}')
+
+    def _histogram(self, out:List[str], name:str, labels:Dict[str, str],
+                   bounds:Sequence[float], counts:Sequence[int], total:float) -> None:
+        cumulative = 0
+        for bound, count in zip(list(bounds) + [float('inf')], counts):
+            cumulative += count
+            out.append(f'{name}_bucket{_labels({**labels, "le": _number(bound)})} {cumulative}')
+        out.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+        out.append(f'{name}_count{_labels(labels)} {cumulative}')
+
+    def render(self) -> str:
+        """
+        Renders all metrics in Prometheus text exposition format.
+
+        :return: Metrics text, ending with a newline.
+        :rtype: str
+
+        """
+        f = self.fsm
+        out : List[str] = []
+        self._header(out, 'pyfsm_steps_total', 'Steps executed since compile or reset.', 'counter')
+        out.append(f'pyfsm_steps_total{_labels(self.labels)} {f.step_count}')
+
+        _, names, counts = self.stats.counters()
+        states = f.states
+        edges = f.transition_edges
+        self._header(out, 'pyfsm_transitions_total', 'Transitions taken per edge.', 'counter')
+        for tid, (name, count) in enumerate(zip(names, counts)):
+            origin, dest = edges[tid]
+            labels = {**self.labels, 'origin': states[origin], 'dest': states[dest], 'transition': name}
+            out.append(f'pyfsm_transitions_total{_labels(labels)} {count}')
+
+        current = f.snapshot.state
+        self._header(out, 'pyfsm_state', 'Current state (1) of the machine.', 'gauge')
+        for s in states:
+            out.append(f'pyfsm_state{_labels({**self.labels, "state": s})} {int(s == current)}')
+
+        if (prof := self.profiler) is not None:
+            slots = prof.slots()
+            nb = len(prof.buckets) + 1
+            hist, total = prof.hist, prof.total
+            self._header(out, 'pyfsm_guard_duration_seconds', 'Condition evaluation time.', 'histogram')
+            for i, (kind, name) in enumerate(slots):
+                if kind == 'condition' and prof.calls[i] > 0:
+                    self._histogram(out, 'pyfsm_guard_duration_seconds', {**self.labels, 'transition': name},
+                                    prof.buckets, hist[i * nb:(i + 1) * nb], total[i])
+            self._header(out, 'pyfsm_action_duration_seconds', 'Action execution time.', 'histogram')
+            for i, (kind, name) in enumerate(slots):
+                if kind != 'condition' and prof.calls[i] > 0:
+                    self._histogram(out, 'pyfsm_action_duration_seconds',
+                                    {**self.labels, 'kind': kind, 'name': name},
+                                    prof.buckets, hist[i * nb:(i + 1) * nb], total[i])
+
+        for name, help, fn in self._gauges:
+            self._header(out, name, help, 'gauge')
+            out.append(f'{name}{_labels(self.labels)} {_number(fn())}')
+        for name, help, h in self._histograms:
+            self._header(out, name, help, 'histogram')
+            self._histogram(out, name, self.labels, h.buckets, h.counts, h.sum)
+        return '\n'.join(out) + '\n'
+
+    def close(self) -> None:
+        """
+        Detaches statistics and profiler from the machine.
+
+        :return: None
+        :rtype: None
+
+        """
+        self.stats.close()
+        if self.profiler is not None:
+            self.profiler.detach()
+
+
+if __name__ == '__main__':
+    import time
+
+    f = fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => A : t1')
+    f.add_condition('t0', 'self.step_count % 3 == 0')
+    f.add_condition('t1', 'True')
+    f.add_action_on_entry('B', 'time.sleep(0.0001)')
+    f.compile()
+
+    metrics = fsm_metrics(f, labels={'machine': 'demo'}, latency=True)
+    clients = 2
+    metrics.add_gauge('pyfsm_websocket_clients', 'Connected websocket clients.', lambda: clients)
+    render = metrics.add_histogram('pyfsm_render_duration_seconds', 'SVG render time.')
+    for _ in range(300):
+        f.step()
+    t0 = time.perf_counter()
+    text = metrics.render()
+    render.observe(time.perf_counter() - t0)
+    print(metrics.render())
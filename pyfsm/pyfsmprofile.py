@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmprofile.py
+
+Module for profiling finite state machines as pyfsm module part. Counts calls
+and measures cumulative and maximum time of every condition and action, and
+of every phase of step(), into preallocated arrays exportable as tables.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import time
+    import asyncio
+    import inspect
+    import threading
+    from bisect import bisect_left
+    from array import array
+    import pandas as pd
+    from typing import Any
+    from typing import Callable
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Tuple
+    from pyfsm import fsm
+    from pyfsm import FSMException
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+# Phases of step()
+PHASES = ('step', 'on_state', 'guards', 'actions')
+_STEP, _ON_STATE, _GUARDS, _ACTIONS = range(len(PHASES))
+
+
+class fsm_profiler:
+    """
+    Opt-in profiler of a compiled machine. While attached, it replaces
+    step(), condition evaluation and action calls of that instance by timed
+    wrappers; once detached the instance runs its original methods, so a
+    machine without profiler pays nothing.
+
+    Every condition (by transition) and action (on_state, on_entry, on_exit
+    by state, on_transition by transition) has a slot in preallocated arrays
+    of calls, cumulative and maximum time. Conditions served from caches or
+    step context are not calls. Phases of step() ('step' whole step,
+    'on_state' action, 'guards' evaluation, 'actions' on transition, exit
+    and entry) have calls, cumulative and maximum time per step.
+
+    With buckets, every condition and action slot also has a latency
+    histogram: hist[slot * (len(buckets) + 1) + k] counts calls lasting at
+    most buckets[k] and more than the previous bound, the last one counts
+    calls longer than all bounds.
+
+    Conditions evaluated by a guard executor and actions run by an action
+    dispatcher update their slots from other threads, serialized by a lock;
+    step phases only account for work done by the thread running step() (the
+    task running it for async_fsm, whose awaitables are timed until done).
+
+    Example:
+
+        prof = fsm_profiler(f)
+        for _ in range(10000):
+            f.step()
+        print(prof.table().sort_values('total', ascending=False))
+        print(prof.phases())
+        prof.detach()
+
+    """
+
+    def __init__(self, f:fsm, clock:Callable[[], float] = time.perf_counter,
+                 buckets:Optional[Sequence[float]] = None) -> None:
+        """
+        Constructor: attaches the profiler to f.
+
+        :param f: Compiled machine to profile.
+        :type f: fsm
+        :param clock: Time source in seconds.
+        :type clock: Callable[[], float]
+        :param buckets: Increasing upper bounds in seconds of latency histograms, no histograms if None.
+        :type buckets: None or Sequence[float]
+
+        """
+        self.fsm = f
+        self.clock = clock
+        self.buckets : Optional[Tuple[float, ...]] = tuple(buckets) if buckets is not None else None
+        self._lock = threading.Lock()
+        self._step_owner : Any = None
+        self._allocate()
+        self.attach()
+
+    def _allocate(self) -> None:
+        self._slots : List[Tuple[str, str]] = []
+        self._build_slots()
+        n = len(self._slots)
+        self.calls = array('q', bytes(8 * n))
+        self.total = array('d', bytes(8 * n))
+        self.max = array('d', bytes(8 * n))
+        self.hist : Optional[array] = None
+        if self.buckets is not None:
+            self.hist = array('q', bytes(8 * n * (len(self.buckets) + 1)))
+        m = len(PHASES)
+        self.phase_calls = array('q', bytes(8 * m))
+        self.phase_total = array('d', bytes(8 * m))
+        self.phase_max = array('d', bytes(8 * m))
+        self._current = [0.0] * m
+        self._guards_start = 0.0
+
+    def _build_slots(self) -> None:
+        f = self.fsm
+        names = sorted(f.transition_ids, key=f.transition_ids.get)
+        self._slots = [('condition', t) for t in names]
+        self._condition = {t: k for k, t in enumerate(names)}
+        self._action = {}
+        for kind, keys in (('on_state', f.states), ('on_entry', f.states),
+                           ('on_exit', f.states), ('on_transition', names)):
+            for key in keys:
+                self._action[(kind, key)] = len(self._slots)
+                self._slots.append((kind, key))
+
+    def attach(self) -> None:
+        """
+        Installs timed wrappers on the machine instance.
+
+        :return: None
+        :rtype: None
+
+        """
+        f = self.fsm
+        clock = self.clock
+        calls, total, maxt = self.calls, self.total, self.max
+        current = self._current
+        step, call_condition, run_action = f.step, f._call_condition, f._run_action
+        begin_guards, end_guards = f._begin_guards, f._end_guards
+        pcalls, ptotal, pmax = self.phase_calls, self.phase_total, self.phase_max
+        conditions, actions = self._condition, self._action
+        hist, bounds = self.hist, self.buckets
+        nb = len(bounds) + 1 if bounds is not None else 0
+        lock = self._lock
+
+        def record(i, dt):
+            with lock:
+                calls[i] += 1
+                total[i] += dt
+                if dt > maxt[i]:
+                    maxt[i] = dt
+                if hist is not None:
+                    hist[i * nb + bisect_left(bounds, dt)] += 1
+
+        # Thread (task for coroutine step()) running step(): only its work counts in phases
+        stepping = inspect.iscoroutinefunction(step)
+        owner = asyncio.current_task if stepping else threading.get_ident
+
+        def begin_step():
+            self._step_owner = owner()
+            for k in range(len(current)):
+                current[k] = 0.0
+            return clock()
+
+        def end_step(t0):
+            current[_STEP] = clock() - t0
+            for k, dt in enumerate(current):
+                pcalls[k] += 1
+                ptotal[k] += dt
+                if dt > pmax[k]:
+                    pmax[k] = dt
+
+        def finish(t0, i, phase):
+            dt = clock() - t0
+            if phase is not None and owner() == self._step_owner:
+                current[phase] += dt
+            if i is not None:
+                record(i, dt)
+
+        async def timed_await(result, t0, i, phase):
+            try:
+                return await result
+            finally:
+                finish(t0, i, phase)
+
+        def timed_call(fn, args, i, phase):
+            # Awaitable results (async_fsm) are timed until completion
+            t0 = clock()
+            try:
+                result = fn(*args)
+            except BaseException:
+                finish(t0, i, phase)
+                raise
+            if inspect.isawaitable(result):
+                return timed_await(result, t0, i, phase)
+            finish(t0, i, phase)
+            return result
+
+        if stepping:
+            async def timed_step(*args, **kwargs):
+                t0 = begin_step()
+                try:
+                    return await step(*args, **kwargs)
+                finally:
+                    end_step(t0)
+        else:
+            def timed_step(*args, **kwargs):
+                t0 = begin_step()
+                try:
+                    return step(*args, **kwargs)
+                finally:
+                    end_step(t0)
+
+        def timed_call_condition(t):
+            return timed_call(call_condition, (t,), conditions[t], None)
+
+        def timed_run_action(fa, kind, name, transition=None):
+            if fa is None:
+                return None
+            return timed_call(run_action, (fa, kind, name, transition), actions.get((kind, name)),
+                              _ON_STATE if kind == 'on_state' else _ACTIONS)
+
+        def timed_begin_guards():
+            self._guards_start = clock()
+            return begin_guards()
+
+        def timed_end_guards():
+            current[_GUARDS] = clock() - self._guards_start
+            return end_guards()
+
+        f.step = timed_step
+        f._call_condition = timed_call_condition
+        f._run_action = timed_run_action
+        f._begin_guards = timed_begin_guards
+        f._end_guards = timed_end_guards
+        if self._on_swap not in f.swap_listeners:
+            f.swap_listeners.append(self._on_swap)
+
+    def _on_swap(self, f:fsm) -> None:
+        # Slots depend on the definition: data is discarded after fsm.hot_swap()
+        self.detach()
+        self._allocate()
+        self.attach()
+
+    def detach(self) -> None:
+        """
+        Removes timed wrappers, the machine runs its original methods again.
+        Collected data remains available.
+
+        :return: None
+        :rtype: None
+
+        """
+        for name in ('step', '_call_condition', '_run_action', '_begin_guards', '_end_guards'):
+            self.fsm.__dict__.pop(name, None)
+        if self._on_swap in self.fsm.swap_listeners:
+            self.fsm.swap_listeners.remove(self._on_swap)
+
+    def reset(self) -> None:
+        """
+        Clears collected data.
+
+        :return: None
+        :rtype: None
+
+        """
+        for a in (self.calls, self.total, self.max, self.hist, self.phase_calls, self.phase_total, self.phase_max):
+            if a is None:
+                continue
+            for k in range(len(a)):
+                a[k] = 0
+
+    def slots(self) -> List[Tuple[str, str]]:
+        """
+        Gets (kind, name) of every condition and action slot, in slot order.
+
+        :return: List of slots.
+        :rtype: List[Tuple[str, str]]
+
+        """
+        return list(self._slots)
+
+    def histogram(self, slot:int) -> List[int]:
+        """
+        Gets latency histogram counts of a slot (see slots()).
+
+        :param slot: Slot index.
+        :type slot: int
+        :return: Count per bucket, last one above all bounds.
+        :rtype: List[int]
+
+        """
+        if self.hist is None:
+            raise FSMException('Profiler has no latency histograms, see buckets')
+        nb = len(self.buckets) + 1
+        return self.hist[slot * nb:(slot + 1) * nb].tolist()
+
+    def table(self, all_slots:bool = False) -> pd.DataFrame:
+        """
+        Exports per callable data.
+
+        :param all_slots: If True includes conditions and actions never called.
+        :type all_slots: bool
+        :return: Table with columns kind, name, calls, total, mean, max (seconds).
+        :rtype: pd.DataFrame
+
+        """
+        df = pd.DataFrame(self._slots, columns=['kind', 'name'])
+        df['calls'] = list(self.calls)
+        df['total'] = list(self.total)
+        df['mean'] = (df['total'] / df['calls']).where(df['calls'] > 0, 0.0)
+        df['max'] = list(self.max)
+        if not all_slots:
+            df = df[df['calls'] > 0].reset_index(drop=True)
+        return df
+
+    def phases(self) -> pd.DataFrame:
+        """
+        Exports per phase data of step().
+
+        :return: Table indexed by phase with columns calls, total, mean, max (seconds).
+        :rtype: pd.DataFrame
+
+        """
+        df = pd.DataFrame({'calls': list(self.phase_calls), 'total': list(self.phase_total),
+                           'max': list(self.phase_max)}, index=pd.Index(PHASES, name='phase'))
+        df.insert(2, 'mean', (df['total'] / df['calls']).where(df['calls'] > 0, 0.0))
+        return df
+
+    def __enter__(self) -> 'fsm_profiler':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.detach()
+
+
+if __name__ == '__main__':
+
+    class demo_fsm(fsm):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.counter = 0
+
+        def slow_guard(self) -> bool:
+            time.sleep(0.0002)
+            return self.counter % 5 == 0
+
+        def on_entry_b(self) -> None:
+            time.sleep(0.001)
+
+    f = demo_fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => A : t1')
+    f.add_condition('t0', f.slow_guard)
+    f.add_condition('t1', 'True')
+    f.add_action_on_entry('B', f.on_entry_b)
+    f.add_action_on_state('A', 'self.__setattr__("counter", self.counter + 1)')
+    f.compile()
+
+    with fsm_profiler(f) as prof:
+        for _ in range(500):
+            f.step()
+    print(prof.table().to_string())
+    print(prof.phases().to_string())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmreplay.py
+
+Module for deterministic replay of recorded transition traces as pyfsm module
+part. A compiled machine is driven with the recorded inputs of every step,
+actions optionally stubbed, and its transitions are compared with the trace
+up to the first divergence.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import time
+    import numpy as np
+    from collections import deque
+    from dataclasses import dataclass
+    from typing import Any
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+    from typing import Union
+    from pyfsm import fsm
+    from pyfsm import fsm_columns
+    from pyfsm import FSMException
+    from pyfsm import FSMTransitionEvalError
+    from pyfsmtrace import read_trace
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+@dataclass
+class fsm_divergence:
+    """
+    First difference between a recorded trace and its replay.
+
+    :ivar step: Step number.
+    :ivar state: State of the replayed machine before the step.
+    :ivar expected: Recorded transition name, None if the step had no transition.
+    :ivar actual: Replayed transition name, None if the step had no transition.
+    :ivar error: Exception raised by the replayed step, if any.
+    """
+    step : int
+    state : str
+    expected : Optional[str]
+    actual : Optional[str]
+    error : Optional[str] = None
+
+
+@dataclass
+class fsm_replay_report:
+    """
+    Result of fsm_replay.run().
+
+    :ivar steps: Number of replayed steps.
+    :ivar transitions: Number of replayed transitions.
+    :ivar mode: 'vectorized' (truth table walk) or 'step' (step() per input).
+    :ivar elapsed: Replay time in seconds.
+    :ivar divergence: First divergence, None if replay matches the trace.
+    """
+    steps : int
+    transitions : int
+    mode : str
+    elapsed : float
+    divergence : Optional[fsm_divergence] = None
+
+    @property
+    def ok(self)->bool:
+        return self.divergence is None
+
+
+class fsm_replay:
+    """
+    Replays a trace recorded by fsm_trace_recorder on a compiled machine,
+    possibly a new build of the recorded definition. Inputs are columns with
+    one value per step (step 0 is the first step after compile() or reset()),
+    set as machine attributes before every step.
+
+    When all conditions are string expressions valid on NumPy arrays and
+    actions are stubbed, they are evaluated once over whole columns and the
+    machine is walked over the resulting truth table (see fsm.walk()), whose
+    cost grows with transitions instead of steps. Otherwise the machine is
+    reset and step() runs once per input row; its runtime state and input
+    attributes are restored afterwards.
+
+    States and transitions are matched by name when the trace was recorded
+    with another build (see trace_states, trace_transitions).
+
+    Example:
+
+        replay = fsm_replay(f, 'run.trace', {'a': a_values, 'b': b_values})
+        report = replay.run()
+        if not report.ok:
+            print(report.divergence)
+
+    """
+
+    def __init__(self, f:fsm, trace:Union[str, np.ndarray], inputs:Any,
+                 stub_actions:bool = True, trace_states:Optional[List[str]] = None,
+                 trace_transitions:Optional[List[str]] = None) -> None:
+        """
+        Constructor:
+
+        :param f: Compiled machine to replay on.
+        :type f: fsm
+        :param trace: Trace (TRACE_DTYPE array) or path accepted by read_trace().
+        :type trace: str or np.ndarray
+        :param inputs: Recorded guard inputs: dictionary of column name to array-like, DataFrame or structured array.
+        :type inputs: Any
+        :param stub_actions: If True, actions are not run.
+        :type stub_actions: bool
+        :param trace_states: State names of the recording build, f.states if None.
+        :type trace_states: None or List[str]
+        :param trace_transitions: Transition names by id of the recording build, f's ones if None.
+        :type trace_transitions: None or List[str]
+
+        """
+        self.fsm = f
+        self.trace = read_trace(trace) if isinstance(trace, str) else trace
+        self.columns = fsm_columns(f, inputs)
+        self.stub_actions = stub_actions
+        self.names = sorted(f.transition_ids, key=f.transition_ids.get)
+        tids = self.trace['transition'].astype(np.int64)
+        if trace_transitions is not None:
+            remap = np.array([f.transition_ids.get(t, -2) for t in trace_transitions], dtype=np.int64)
+            tids = remap[tids]
+        if len(self.trace) > 0:
+            origin = int(self.trace['origin'][0])
+            if trace_states is not None:
+                origin = f.index_dict[trace_states[origin]]
+            self.initial_state = origin
+        else:
+            self.initial_state = f.index_dict[f.entry_point]
+        steps = self.trace['step'].astype(np.int64)
+        inside = steps < len(self.columns)
+        self.expected : Tuple[np.ndarray, np.ndarray] = (steps[inside], tids[inside])
+
+    def _name(self, tid:Optional[int])->Optional[str]:
+        if tid is None:
+            return None
+        return self.names[tid] if tid >= 0 else f'<unknown {tid}>'
+
+    def run(self, vectorized:Optional[bool] = None)->fsm_replay_report:
+        """
+        Replays the trace.
+
+        :param vectorized: Force ('True') or avoid ('False') truth table walk, automatic if None.
+        :type vectorized: None or bool
+        :return: Replay report
+        :rtype: fsm_replay_report
+
+        """
+        t0 = time.perf_counter()
+        truth = None
+        if vectorized is not False and self.stub_actions:
+            try:
+                truth = self.fsm.truth_table(self.columns)
+            except FSMTransitionEvalError as e:
+                if vectorized:
+                    raise
+                logger.info(f'Replay falls back to step mode: {e}')
+        if truth is not None:
+            report = self._run_vectorized(truth)
+        else:
+            report = self._run_steps()
+        report.elapsed = time.perf_counter() - t0
+        return report
+
+    def _run_vectorized(self, truth:np.ndarray)->fsm_replay_report:
+        f = self.fsm
+        steps_a, tids_a = f.walk(truth, state=self.initial_state)
+        steps_e, tids_e = self.expected
+        m = min(len(steps_a), len(steps_e))
+        differ = np.flatnonzero((steps_a[:m] != steps_e[:m]) | (tids_a[:m] != tids_e[:m]))
+        i = int(differ[0]) if len(differ) > 0 else m
+        report = fsm_replay_report(steps=len(self.columns), transitions=len(steps_a),
+                                   mode='vectorized', elapsed=0.0)
+        if i == len(steps_a) and i == len(steps_e):
+            return report
+        state = self.initial_state if i == 0 else f.transition_edges[int(tids_a[i-1])][1]
+        step_a = int(steps_a[i]) if i < len(steps_a) else None
+        step_e = int(steps_e[i]) if i < len(steps_e) else None
+        expected = actual = None
+        error = None
+        if step_e is not None and (step_a is None or step_e <= step_a):
+            expected = int(tids_e[i])
+        if step_a is not None and (step_e is None or step_a <= step_e):
+            actual = int(tids_a[i])
+            if actual == -1:
+                actual = None
+                error = 'More than one condition is true'
+        step = min(s for s in (step_a, step_e) if s is not None)
+        report.divergence = fsm_divergence(step=step, state=f.states[state],
+                                           expected=self._name(expected),
+                                           actual=self._name(actual), error=error)
+        report.steps = step + 1
+        report.transitions = i
+        return report
+
+    def _run_steps(self)->fsm_replay_report:
+        f = self.fsm
+        names = [n for n in vars(self.columns) if not n.startswith('_')]
+        columns = [getattr(self.columns, n).tolist() for n in names]
+        steps_e, tids_e = (x.tolist() for x in self.expected)
+        saved = (f.actions_on_state, f.actions_on_entry, f.actions_on_exit, f.actions_on_transition)
+        runtime = self._save_runtime(names)
+        if self.stub_actions:
+            f.actions_on_state, f.actions_on_entry, f.actions_on_exit, f.actions_on_transition = {}, {}, {}, {}
+        fired : List[int] = []
+        listener = lambda f, origin, dest, tid, timestamp: fired.append(tid)
+        f.add_transition_listener(listener)
+        report = fsm_replay_report(steps=0, transitions=0, mode='step', elapsed=0.0)
+        try:
+            f.reset()
+            f.state = self.initial_state
+            if len(f.state_history) > 0:
+                f.state_history[-1] = self.initial_state
+            f._arm_timeouts()
+            i = 0
+            for k in range(len(self.columns)):
+                for n, col in zip(names, columns):
+                    setattr(f, n, col[k])
+                state = f.state
+                error = None
+                try:
+                    f.step()
+                except FSMException as e:
+                    error = f'{e.__class__.__name__}: {e}'
+                actual = fired.pop() if fired else None
+                expected = tids_e[i] if i < len(steps_e) and steps_e[i] == k else None
+                report.steps = k + 1
+                if actual != expected or error is not None:
+                    report.divergence = fsm_divergence(step=k, state=f.states[state],
+                                                       expected=self._name(expected),
+                                                       actual=self._name(actual), error=error)
+                    break
+                if expected is not None:
+                    i += 1
+                    report.transitions += 1
+            else:
+                if i < len(steps_e):
+                    report.divergence = fsm_divergence(step=steps_e[i], state=f.get_state(),
+                                                       expected=self._name(tids_e[i]), actual=None)
+        finally:
+            f.del_transition_listener(listener)
+            f.actions_on_state, f.actions_on_entry, f.actions_on_exit, f.actions_on_transition = saved
+            self._restore_runtime(runtime)
+        return report
+
+    def _save_runtime(self, names:List[str])->Tuple[Any, ...]:
+        f = self.fsm
+        caches = {t: (c.value, c.timestamp, c.step) for t, c in f.condition_cache.items()}
+        inputs = {n: getattr(f, n) for n in names if hasattr(f, n)}
+        return (f.state, deque(f.state_history, maxlen=f.state_history.maxlen),
+                deque(f.state_history_time, maxlen=f.state_history_time.maxlen),
+                f.step_count, f.snapshot, caches, inputs, names)
+
+    def _restore_runtime(self, runtime:Tuple[Any, ...])->None:
+        f = self.fsm
+        state, history, history_time, step_count, snapshot, caches, inputs, names = runtime
+        f.state, f.state_history, f.state_history_time = state, history, history_time
+        f.step_count, f.snapshot = step_count, snapshot
+        f.true_transitions.clear()
+        f.true_transitions_name.clear()
+        for t, (value, timestamp, step) in caches.items():
+            if (c := f.condition_cache.get(t)) is not None:
+                c.value, c.timestamp, c.step = value, timestamp, step
+        for n in names:
+            if n in inputs:
+                setattr(f, n, inputs[n])
+            elif hasattr(f, n):
+                delattr(f, n)
+        # Timers of the restored state start again
+        f._arm_timeouts()
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from pyfsmtrace import fsm_trace_recorder
+
+    def build(limit:int)->fsm:
+        f = fsm()
+        f.add_transition('IDLE => RUN : start')
+        f.add_transition('RUN => IDLE : stop')
+        f.add_transition('RUN => ALARM : overheat')
+        f.add_transition('ALARM => IDLE : cooled')
+        f.add_condition('start', 'self.speed > 0')
+        f.add_condition('stop', '(self.speed == 0) & (self.temp <= %d)' % limit)
+        f.add_condition('overheat', 'self.temp > %d' % limit)
+        f.add_condition('cooled', 'self.temp < 40')
+        f.compile()
+        return f
+
+    rng = np.random.default_rng(1)
+    N = 200000
+    inputs = {'speed': rng.integers(0, 3, N), 'temp': rng.integers(20, 100, N)}
+
+    f = build(90)
+    base = os.path.join(tempfile.mkdtemp(), 'demo.trace')
+    with fsm_trace_recorder(base) as rec:
+        rec.attach(f)
+        for k in range(N):
+            f.speed, f.temp = inputs['speed'][k], inputs['temp'][k]
+            f.step()
+
+    print(fsm_replay(f, base, inputs).run())
+    print(fsm_replay(build(95), base, inputs).run())
+    print(fsm_replay(build(95), base, inputs).run(vectorized=False))
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmsession.py
+
+Module for running many instances (sessions) of one finite state machine as pyfsm module part.
+The compiled definition of a machine is immutable and shared (flyweight), every
+session only holds its current state, a small history and its own context.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    from collections import deque
+    from types import CodeType
+    from typing import Any
+    from typing import Callable
+    from typing import Deque
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+    from typing import Union
+    from pyfsm import fsm
+    from pyfsm import fsm_clock
+    from pyfsm import fsm_timeout
+    from pyfsm import default_clock
+    from pyfsm import FSMException
+    from pyfsm import FSMSysMgs
+    from pyfsm import FSMNondisjoinctTransitions
+    from pyfsm import FSMTransitionEvalError
+    from pyfsm import FSMOnEntryActionError
+    from pyfsm import FSMOnExitActionError
+    from pyfsm import FSMOnTransitionActionError
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+def _code_names(code:CodeType)->set:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _code_names(const)
+    return names
+
+def _session_incompatibility(f:fsm, value:Any)->Optional[str]:
+    """
+    Tells why a condition or action of f can not run on sessions, None if it can.
+
+    """
+    if isinstance(value, fsm_timeout):
+        return 'timed transitions need the fsm instance'
+    if isinstance(value, str):
+        try:
+            code = compile(value, '<pyfsm>', 'eval')
+        except SyntaxError:
+            return None
+        if 'self' in _code_names(code):
+            return 'expression uses self, expressions are evaluated with ctx and session'
+    elif isinstance(getattr(value, '__self__', None), fsm):
+        return 'method bound to the fsm instance, functions are called as f(ctx)'
+    return None
+
+
+class fsm_definition:
+    """
+    Immutable compiled definition of a finite state machine, shared by any
+    number of fsm_session instances.
+
+    Unlike fsm, conditions and actions of a definition do not belong to an
+    instance: functions are called with the session context as only argument,
+    and string expressions are evaluated with names ctx (session context) and
+    session available. Transition listeners get timestamps of clock.
+
+    :ivar states: Names of number-coded states.
+    :ivar entry_point: Index of initial state.
+    :ivar tsymbol: Transition symbol.
+    :ivar machine_transitions: Defined transitions.
+    :ivar conditions: Expressions or functions of named transitions.
+    :ivar outgoing: For every state, tuple of (destination index, transition name) in column order.
+    :ivar actions_on_state: On state actions by state name.
+    :ivar actions_on_entry: On entry actions by state name.
+    :ivar actions_on_exit: On exit actions by state name.
+    :ivar actions_on_transition: On transition actions by transition name.
+    :ivar check_disjoint: If True check for disjoint transitions.
+    :ivar history_len: Length of history kept by each session, 0 disables it.
+    :ivar namespace: Globals used to evaluate string expressions.
+    :ivar transition_names: Transition names by transition id (declaration order).
+    :ivar transition_ids: Transition name to transition id.
+    :ivar clock: Time source of listener timestamps.
+    """
+
+    def __init__(self, states:List[str], entry_point:int, tsymbol:str,
+                 machine_transitions:List[str], conditions:Dict[str, Union[str,Callable[...,bool]]],
+                 outgoing:List[List[Tuple[int,str]]],
+                 actions_on_state:Optional[Dict[str, Union[str,Callable[...,Any]]]] = None,
+                 actions_on_entry:Optional[Dict[str, Union[str,Callable[...,Any]]]] = None,
+                 actions_on_exit:Optional[Dict[str, Union[str,Callable[...,Any]]]] = None,
+                 actions_on_transition:Optional[Dict[str, Union[str,Callable[...,Any]]]] = None,
+                 check_disjoint:bool = True, history_len:int = 0,
+                 namespace:Optional[Dict[str, Any]] = None,
+                 clock:Optional[fsm_clock] = None) -> None:
+        self.states : Tuple[str, ...] = tuple(states)
+        self.entry_point : int = entry_point
+        self.tsymbol : str = tsymbol
+        self.machine_transitions : Tuple[str, ...] = tuple(machine_transitions)
+        self.conditions : Dict[str, Union[str,Callable[...,bool]]] = dict(conditions)
+        self.outgoing : Tuple[Tuple[Tuple[int,str], ...], ...] = \
+            tuple(tuple(row) for row in outgoing)
+        self.actions_on_state = dict(actions_on_state or {})
+        self.actions_on_entry = dict(actions_on_entry or {})
+        self.actions_on_exit = dict(actions_on_exit or {})
+        self.actions_on_transition = dict(actions_on_transition or {})
+        self.check_disjoint = check_disjoint
+        self.history_len = history_len
+        self.namespace : Dict[str, Any] = dict(namespace or {})
+        self.clock : fsm_clock = clock if clock is not None else default_clock
+        self.index_dict : Dict[str, int] = {s:k for k,s in enumerate(self.states)}
+        self.transition_names : Tuple[str, ...] = tuple(m.rsplit(':', 1)[1].strip()
+                                                        for m in self.machine_transitions)
+        self.transition_ids : Dict[str, int] = {t:k for k,t in enumerate(self.transition_names)}
+        self._listeners : List[Callable[['fsm_session', int, int, int, float], Any]] = []
+        self._prepare()
+
+    @classmethod
+    def from_fsm(cls, f:fsm, history_len:int = 0,
+                 namespace:Optional[Dict[str, Any]] = None) -> 'fsm_definition':
+        """
+        Creates a definition from a compiled fsm. A certified fsm
+        (see fsm.certify_disjoint()) gives a definition with first-match semantics.
+        Conditions and actions of f must follow the session convention: 
+        functions are called as f(ctx), expressions are evaluated with ctx 
+        and session. The definition uses the clock of f.
+
+        Exceptions: 
+        -----------
+            FSMException : If a condition or action is a method of f, an 
+            expression using self or a timed transition.
+
+        :param f: Compiled finite state machine.
+        :type f: fsm
+        :param history_len: Length of history kept by each session.
+        :type history_len: int
+        :param namespace: Globals used to evaluate string expressions.
+        :type namespace: None or dict
+        :return: Definition
+        :rtype: fsm_definition
+
+        """
+        for kind, table in (('Condition', f.conditions), ('On State', f.actions_on_state),
+                            ('On Entry', f.actions_on_entry), ('On Exit', f.actions_on_exit),
+                            ('On Transition', f.actions_on_transition)):
+            for name, value in table.items():
+                if (reason := _session_incompatibility(f, value)) is not None:
+                    errmsg = FSMSysMgs.error_session_callable(kind, name, reason)
+                    logger.error(errmsg)
+                    raise FSMException(errmsg)
+        outgoing = [[(k, t) for k, t in enumerate(row) if isinstance(t, str)]
+                    for row in f.tmatrix]
+        certified = f.disjoint_certificate is not None and f.disjoint_certificate.certified
+        return cls(states=f.states, entry_point=f.index_dict[f.entry_point],
+                   tsymbol=f.tsymbol, machine_transitions=f.machine_trasitions,
+                   conditions=f.conditions, outgoing=outgoing,
+                   actions_on_state=f.actions_on_state, actions_on_entry=f.actions_on_entry,
+                   actions_on_exit=f.actions_on_exit, actions_on_transition=f.actions_on_transition,
+                   check_disjoint=f.check_disjoint and not certified,
+                   history_len=history_len, namespace=namespace, clock=f.clock)
+
+    def _prepare(self) -> None:
+        """
+        Builds per state lookup tables, string expressions are compiled once.
+
+        """
+        def prepare(f):
+            if isinstance(f, str):
+                return compile(f, '<pyfsm>', 'eval')
+            return f
+
+        self._guards = tuple(tuple((dest, t, prepare(self.conditions[t])) for dest, t in row)
+                             for row in self.outgoing)
+        self._on_state = tuple(prepare(self.actions_on_state.get(s)) for s in self.states)
+        self._on_entry = tuple(prepare(self.actions_on_entry.get(s)) for s in self.states)
+        self._on_exit = tuple(prepare(self.actions_on_exit.get(s)) for s in self.states)
+        self._on_transition = {t: prepare(f) for t, f in self.actions_on_transition.items()}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Compiled expressions are not picklable, they are rebuilt on unpickling.
+        # Clocks are local to the process, as listeners
+        return {k:v for k,v in self.__dict__.items() if not k.startswith('_') and k != 'clock'}
+
+    def __setstate__(self, state:Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.clock = default_clock
+        self._listeners = []
+        self._prepare()
+
+    def add_transition_listener(self, listener:Callable[['fsm_session', int, int, int, float], Any]) -> None:
+        """
+        Adds a callable called on every transition of any session of this
+        definition, as listener(session, origin, dest, transition_id, timestamp).
+        Listeners are local to the process, they are not pickled.
+
+        :param listener: Callable to add.
+        :type listener: Callable
+        :return: None
+        :rtype: None
+
+        """
+        self._listeners.append(listener)
+
+    def del_transition_listener(self, listener:Callable[['fsm_session', int, int, int, float], Any]) -> None:
+        """
+        Removes a transition listener.
+
+        :param listener: Callable to remove.
+        :type listener: Callable
+        :return: None
+        :rtype: None
+
+        """
+        self._listeners.remove(listener)
+
+    def _call(self, f:Union[CodeType, Callable[...,Any]], session:'fsm_session') -> Any:
+        if type(f) is CodeType:
+            return eval(f, self.namespace, {'ctx': session.context, 'session': session})
+        return f(session.context)
+
+    def new_instance(self, context:Any = None, state:Optional[str] = None) -> 'fsm_session':
+        """
+        Creates a new session of this machine.
+
+        :param context: Per instance user context passed to conditions and actions.
+        :type context: Any
+        :param state: Initial state name, entry point if None.
+        :type state: None or str
+        :return: New session
+        :rtype: fsm_session
+
+        """
+        return fsm_session(self, context, None if state is None else self.index_dict[state])
+
+    def __repr__(self) -> str:
+        return f'<class {self.__class__.__name__} at {hex(id(self))} ' +\
+            f'states: {len(self.states)} transitions: {len(self.machine_transitions)}>'
+
+
+class fsm_session:
+    """
+    Lightweight running instance of a fsm_definition.
+
+    :ivar definition: Shared compiled definition.
+    :ivar state: Current state index.
+    :ivar history: Present and previous states, None if definition.history_len is 0.
+    :ivar context: User context passed to conditions and actions.
+    :ivar step_count: Number of step() calls.
+    """
+    __slots__ = ('definition', 'state', 'history', 'context', 'step_count', '__weakref__')
+
+    def __init__(self, definition:fsm_definition, context:Any = None,
+                 state:Optional[int] = None) -> None:
+        self.definition = definition
+        self.state = definition.entry_point if state is None else state
+        self.history : Optional[Deque[int]] = None
+        if definition.history_len > 0:
+            self.history = deque((self.state,), maxlen=definition.history_len)
+        self.context = context
+        self.step_count = 0
+
+    def get_state(self) -> str:
+        """
+        Get current state name
+
+        :return: String containing the current state name
+        :rtype: str
+
+        """
+        return self.definition.states[self.state]
+
+    def reset(self) -> None:
+        """
+        Resets the session to entry point. Context is kept.
+
+        :return: None
+        :rtype: None
+
+        """
+        self.state = self.definition.entry_point
+        self.step_count = 0
+        if self.history is not None:
+            self.history.clear()
+            self.history.append(self.state)
+
+    def step(self) -> Optional[str]:
+        """
+        Executes one step on session
+
+        :return: Name of the transition performed, None if state did not change
+        :rtype: None or str
+
+        """
+        d = self.definition
+        state = self.state
+        self.step_count += 1
+        if (f := d._on_state[state]) is not None:
+            self._run_action(f, f'On State {d.states[state]}', FSMOnEntryActionError)
+
+        taken = None
+        t = ''
+        try:
+            for dest, t, fcond in d._guards[state]:
+                if d._call(fcond, self):
+                    if taken is not None:
+                        errmsg = FSMSysMgs.error_non_disjoint_transitions(d.states[state],
+                                    transitions=str([taken[1], t]))
+                        logger.error(errmsg)
+                        raise FSMNondisjoinctTransitions(errmsg)
+                    taken = (dest, t)
+                    if not d.check_disjoint:
+                        break
+        except FSMNondisjoinctTransitions:
+            raise
+        except Exception as e:
+            fexp = d.conditions.get(t)
+            errmsg = FSMSysMgs.error_transition_eval_error(
+                    state = d.states[state], transition = t,
+                    eval_fcnexp=fexp if isinstance(fexp, str) else '')
+            errmsg = str(e) +'\n'+errmsg
+            logger.error(errmsg)
+            raise FSMTransitionEvalError(errmsg)
+
+        if taken is None:
+            return None
+
+        dest, t = taken
+        self.state = dest
+        if self.history is not None:
+            self.history.append(dest)
+        if d._listeners:
+            tid = d.transition_ids[t]
+            now = d.clock.monotonic()
+            for listener in d._listeners:
+                listener(self, state, dest, tid, now)
+        for f, field, excpt in ((d._on_transition.get(t), t, FSMOnTransitionActionError),
+                                (d._on_exit[state], d.states[state], FSMOnExitActionError),
+                                (d._on_entry[dest], d.states[dest], FSMOnEntryActionError)):
+            if f is not None:
+                self._run_action(f, f'{field}:', excpt)
+        return t
+
+    def _run_action(self, f:Union[CodeType, Callable[...,Any]], prefix:str, excpt:type) -> None:
+        try:
+            self.definition._call(f, self)
+        except Exception as e:
+            msg = f"{prefix} {e}"
+            logger.error(msg)
+            raise excpt(msg)
+
+    def __repr__(self) -> str:
+        return f'<class {self.__class__.__name__} at {hex(id(self))} state: {self.get_state()}>'
+
+
+if __name__ == '__main__':
+    import time
+    import tracemalloc
+
+    f = fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => C : t1')
+    f.add_transition('C => A : t2')
+    f.add_condition('t0', 'ctx["a"] % 10 == 0')
+    f.add_condition('t1', 'ctx["a"] % 7 == 0')
+    f.add_condition('t2', 'ctx["a"] % 11 == 0')
+    f.compile()
+
+    definition = fsm_definition.from_fsm(f)
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    sessions = [definition.new_instance() for _ in range(100000)]
+    t1 = time.perf_counter()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'100000 sessions created in {t1-t0:.3f} s, {size/1e6:.1f} MB')
+
+    s = definition.new_instance({'a': 0})
+    for j in range(130):
+        if (t := s.step()) is not None:
+            print(f'{j}: {t} -> {s.get_state()}')
+        s.context['a'] += 1
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmshard.py
+
+Module for running large populations of finite state machine sessions on
+several processes as pyfsm module part. Sessions are partitioned by key
+across worker processes (shards), inputs are routed to the owning shard in
+batches, and transitions, metrics and errors stream back through a queue.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import os
+    import queue
+    import multiprocessing
+    from collections import deque
+    from typing import Any
+    from typing import Deque
+    from typing import Dict
+    from typing import Hashable
+    from typing import Iterator
+    from typing import List
+    from typing import Optional
+    from typing import Tuple
+    from pyfsmsession import fsm_definition
+except Exception as e:
+    logger.error(e)
+    raise e
+
+# Operations sent to shards
+_OP_SPAWN = 0
+_OP_STEP = 1
+_OP_REMOVE = 2
+
+
+def _apply_inputs(context:Any, inputs:Dict[str, Any])->None:
+    if isinstance(context, dict):
+        context.update(inputs)
+    else:
+        for k, v in inputs.items():
+            setattr(context, k, v)
+
+
+def _shard_worker(definition:fsm_definition, shard:int, inbox:Any, outbox:Any)->None:
+    """
+    Worker process main loop. Receives batches of operations, runs them on
+    its own sessions and sends back transitions, errors and metrics.
+
+    """
+    sessions = {}
+    steps = 0
+    transitions_count = 0
+    errors_count = 0
+    while (batch := inbox.get()) is not None:
+        transitions = []
+        errors = []
+        for op, key, payload in batch:
+            try:
+                if op == _OP_STEP:
+                    s = sessions[key]
+                    if payload is not None:
+                        _apply_inputs(s.context, payload)
+                    src = s.state
+                    if (t := s.step()) is not None:
+                        transitions.append((key, s.step_count, src, s.state, t))
+                    steps += 1
+                elif op == _OP_SPAWN:
+                    context, state = payload
+                    sessions[key] = definition.new_instance(context, state)
+                elif op == _OP_REMOVE:
+                    del sessions[key]
+            except Exception as e:
+                errors.append((key, f'{e.__class__.__name__}: {e}'))
+        transitions_count += len(transitions)
+        errors_count += len(errors)
+        if transitions:
+            outbox.put(('transitions', shard, transitions))
+        if errors:
+            outbox.put(('errors', shard, errors))
+        outbox.put(('metrics', shard, {'instances': len(sessions), 'steps': steps,
+                                       'transitions': transitions_count, 'errors': errors_count}))
+    outbox.put(('stopped', shard, None))
+
+
+class fsm_shard_runner:
+    """
+    Runs sessions of one fsm_definition partitioned by key across a pool of
+    processes. The definition is shipped once to every worker. Operations are
+    buffered per shard and sent in batches of batch_size, or on flush().
+
+    Messages returned by results() are tuples (kind, shard, payload):
+
+        - ('transitions', shard, [(key, step_count, from, to, transition), ...])
+        - ('errors', shard, [(key, message), ...])
+        - ('metrics', shard, {'instances', 'steps', 'transitions', 'errors'})
+        - ('stopped', shard, None)
+
+    Definition conditions, actions and session contexts must be picklable.
+
+    Example:
+
+        runner = fsm_shard_runner(definition, shards=4)
+        runner.start()
+        for key in range(100000):
+            runner.spawn(key, {'a': 0})
+        for key, a in readings:
+            runner.feed(key, {'a': a})
+        runner.flush()
+        for kind, shard, payload in runner.results():
+            ...
+        runner.stop()
+
+    """
+
+    def __init__(self, definition:fsm_definition, shards:Optional[int] = None,
+                 batch_size:int = 1000, mp_context:Optional[str] = None) -> None:
+        """
+        Constructor:
+
+        :param definition: Compiled definition to run.
+        :type definition: fsm_definition
+        :param shards: Number of worker processes, os.cpu_count() if None.
+        :type shards: None or int
+        :param batch_size: Number of operations buffered per shard before sending.
+        :type batch_size: int
+        :param mp_context: multiprocessing start method ('fork', 'spawn', 'forkserver'), default if None.
+        :type mp_context: None or str
+
+        """
+        self.definition = definition
+        self.shards = shards or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._ctx = multiprocessing.get_context(mp_context)
+        self._inboxes : List[Any] = []
+        self._outbox : Any = None
+        self._workers : List[Any] = []
+        self._buffers : List[List[Tuple[int, Hashable, Any]]] = [[] for _ in range(self.shards)]
+        self._received : Deque[Tuple[str, int, Any]] = deque()
+
+    def start(self) -> None:
+        """
+        Starts worker processes.
+
+        :return: None
+        :rtype: None
+
+        """
+        self._outbox = self._ctx.Queue()
+        for shard in range(self.shards):
+            inbox = self._ctx.Queue()
+            worker = self._ctx.Process(target=_shard_worker,
+                                       args=(self.definition, shard, inbox, self._outbox),
+                                       name=f'pyfsm-shard-{shard}', daemon=True)
+            worker.start()
+            self._inboxes.append(inbox)
+            self._workers.append(worker)
+        logger.info(f'{self.shards} shards started')
+
+    def shard_of(self, key:Hashable) -> int:
+        """
+        Gets the shard owning key.
+
+        :param key: Session key.
+        :type key: Hashable
+        :return: Shard index
+        :rtype: int
+
+        """
+        return hash(key) % self.shards
+
+    def _post(self, op:int, key:Hashable, payload:Any) -> None:
+        shard = hash(key) % self.shards
+        buffer = self._buffers[shard]
+        buffer.append((op, key, payload))
+        if len(buffer) >= self.batch_size:
+            self._inboxes[shard].put(buffer)
+            self._buffers[shard] = []
+
+    def spawn(self, key:Hashable, context:Any = None, state:Optional[str] = None) -> None:
+        """
+        Creates a session on its owning shard.
+
+        :param key: Session key.
+        :type key: Hashable
+        :param context: Session context.
+        :type context: Any
+        :param state: Initial state name, entry point if None.
+        :type state: None or str
+        :return: None
+        :rtype: None
+
+        """
+        self._post(_OP_SPAWN, key, (context, None if state is None else self.definition.index_dict[state]))
+
+    def feed(self, key:Hashable, inputs:Optional[Dict[str, Any]] = None) -> None:
+        """
+        Updates the context of a session with inputs (dictionary update or
+        attribute assignment) and executes one step.
+
+        :param key: Session key.
+        :type key: Hashable
+        :param inputs: Values to set on session context before the step.
+        :type inputs: None or dict
+        :return: None
+        :rtype: None
+
+        """
+        self._post(_OP_STEP, key, inputs)
+
+    def remove(self, key:Hashable) -> None:
+        """
+        Removes a session from its owning shard.
+
+        :param key: Session key.
+        :type key: Hashable
+        :return: None
+        :rtype: None
+
+        """
+        self._post(_OP_REMOVE, key, None)
+
+    def flush(self) -> None:
+        """
+        Sends all buffered operations to their shards.
+
+        :return: None
+        :rtype: None
+
+        """
+        for shard, buffer in enumerate(self._buffers):
+            if buffer:
+                self._inboxes[shard].put(buffer)
+                self._buffers[shard] = []
+
+    def results(self, timeout:Optional[float] = 0.0) -> Iterator[Tuple[str, int, Any]]:
+        """
+        Yields messages received from shards until none is available.
+
+        :param timeout: Seconds to wait for each message, 0 does not wait.
+        :type timeout: None or float
+        :return: Iterator of (kind, shard, payload)
+        :rtype: Iterator[Tuple[str, int, Any]]
+
+        """
+        while self._received:
+            yield self._received.popleft()
+        if self._outbox is None:
+            return
+        while True:
+            try:
+                if timeout == 0:
+                    yield self._outbox.get_nowait()
+                else:
+                    yield self._outbox.get(timeout=timeout)
+            except queue.Empty:
+                return
+
+    def stop(self) -> None:
+        """
+        Flushes pending operations and stops worker processes. Messages not
+        read yet remain available through results().
+
+        :return: None
+        :rtype: None
+
+        """
+        if not self._workers:
+            return
+        self.flush()
+        for inbox in self._inboxes:
+            inbox.put(None)
+        # Outbox must be drained before joining, otherwise workers can block on put()
+        running = set(range(len(self._workers)))
+        while running:
+            try:
+                msg = self._outbox.get(timeout=0.1)
+            except queue.Empty:
+                # A dead worker never sends 'stopped'
+                for shard in [k for k in running if not self._workers[k].is_alive()]:
+                    logger.warning(f'shard {shard} exited with code {self._workers[shard].exitcode}')
+                    running.discard(shard)
+                continue
+            self._received.append(msg)
+            if msg[0] == 'stopped':
+                running.discard(msg[1])
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+        self._inboxes.clear()
+        logger.info('shards stopped')
+
+    def __enter__(self) -> 'fsm_shard_runner':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    import time
+    from pyfsm import fsm
+
+    f = fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => C : t1')
+    f.add_transition('C => A : t2')
+    f.add_condition('t0', 'ctx["a"] % 10 == 0')
+    f.add_condition('t1', 'ctx["a"] % 7 == 0')
+    f.add_condition('t2', 'ctx["a"] % 11 == 0')
+    f.compile()
+
+    definition = fsm_definition.from_fsm(f)
+    N = 10000
+    transitions = 0
+    t0 = time.perf_counter()
+    with fsm_shard_runner(definition, batch_size=5000) as runner:
+        for key in range(N):
+            runner.spawn(key, {'a': 0})
+        for a in range(100):
+            for key in range(N):
+                runner.feed(key, {'a': a + key})
+    for kind, shard, payload in runner.results():
+        if kind == 'transitions':
+            transitions += len(payload)
+    print(f'{N*100} steps, {transitions} transitions in {time.perf_counter()-t0:.2f} s')
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmshm.py
+
+Module for publishing live state of a finite state machine in shared memory
+as pyfsm module part. The running process writes current state, last
+transition, step counter and transition counters into a
+multiprocessing.shared_memory block under a seqlock; monitor processes read
+consistent snapshots without IPC and without locking the writer.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import json
+    import time
+    import struct
+    import numpy as np
+    from dataclasses import dataclass
+    from multiprocessing import shared_memory
+    from multiprocessing import resource_tracker
+    from typing import Any
+    from typing import Dict
+    from typing import List
+    from typing import Optional
+    from pyfsm import fsm
+    from pyfsm import FSMException
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+# Block layout:
+#   header   magic, version, number of states, number of transitions, metadata length
+#   seq      seqlock sequence, odd while the writer is updating
+#   payload  state, origin and transition id of last transition, step counter,
+#            timestamp of last transition, number of transitions
+#   counters number of times every transition id was taken (uint64)
+#   metadata JSON with state and transition names
+# After fsm.hot_swap() the block is retired (seq set to _RETIRED, odd) and
+# created again under the same name with the new layout.
+SHM_MAGIC = b'PYFSMSHM'
+SHM_VERSION = 1
+_HEADER = struct.Struct('<8sIIII')
+_SEQ = struct.Struct('<Q')
+_PAYLOAD = struct.Struct('<iii4xQdQ')
+_SEQ_OFFSET = _HEADER.size
+_PAYLOAD_OFFSET = _SEQ_OFFSET + _SEQ.size
+_COUNTERS_OFFSET = _PAYLOAD_OFFSET + _PAYLOAD.size
+_RETIRED = 2**64 - 1
+
+
+class FSMSharedMemoryError(FSMException):
+    pass
+
+
+@dataclass(frozen=True)
+class fsm_live_state:
+    """
+    Consistent snapshot of a published machine.
+
+    :ivar state: Current state name.
+    :ivar origin: Origin state name of last transition, None before the first one.
+    :ivar transition: Name of last transition, None before the first one.
+    :ivar step: Step counter.
+    :ivar timestamp: Clock time (monotonic) of last transition.
+    :ivar transitions: Number of transitions since publication started.
+    :ivar counters: Number of times every transition was taken, by name.
+    """
+    state : str
+    origin : Optional[str]
+    transition : Optional[str]
+    step : int
+    timestamp : float
+    transitions : int
+    counters : Dict[str, int]
+
+
+class fsm_shm_publisher:
+    """
+    Publishes live state of a machine into a named shared memory block.
+    The block is written at the end of every step through step and
+    transition listeners, under a seqlock: the sequence is made odd, the
+    payload is written, and the sequence is made even again. Readers retry
+    while the sequence is odd or changed while they copied.
+
+    The layout depends on the definition: after fsm.hot_swap() the block is
+    retired and created again under the same name, with counters cleared.
+    Monitors attach to the new block on their next read.
+
+    Example:
+
+        pub = fsm_shm_publisher(f, name='pyfsm-line1')
+        ...                              # f.step() as usual
+        pub.close(unlink=True)
+
+        # In the monitor process
+        mon = fsm_shm_monitor('pyfsm-line1')
+        print(mon.read())
+
+    """
+
+    def __init__(self, f:fsm, name:Optional[str] = None) -> None:
+        """
+        Constructor: creates the block and starts publishing.
+
+        :param f: Compiled machine to publish.
+        :type f: fsm
+        :param name: Shared memory block name, random if None.
+        :type name: None or str
+
+        """
+        self.fsm = f
+        self._create(f, name)
+        f.add_transition_listener(self._on_transition)
+        f.add_step_listener(self.publish)
+        f.swap_listeners.append(self._on_swap)
+
+    def _create(self, f:fsm, name:Optional[str]) -> None:
+        names = sorted(f.transition_ids, key=f.transition_ids.get)
+        meta = json.dumps({'states': list(f.states), 'transitions': names}).encode()
+        size = _COUNTERS_OFFSET + 8 * len(names) + len(meta)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self.shm.name
+        self._buf = self.shm.buf
+        meta_offset = _COUNTERS_OFFSET + 8 * len(names)
+        self._buf[meta_offset:meta_offset + len(meta)] = meta
+        self._buf[_COUNTERS_OFFSET:meta_offset] = bytes(meta_offset - _COUNTERS_OFFSET)
+        self._counts = [0] * len(names)
+        self._seq = 0
+        self._origin = -1
+        self._tid = -1
+        self._timestamp = 0.0
+        self._transitions = 0
+        self._pending = -1
+        self.publish(f)
+        # Magic last: monitors attaching meanwhile retry until the block is complete
+        _HEADER.pack_into(self._buf, 0, bytes(8), SHM_VERSION, len(f.states), len(names), len(meta))
+        self._buf[0:8] = SHM_MAGIC
+
+    def _on_swap(self, f:fsm) -> None:
+        _SEQ.pack_into(self._buf, _SEQ_OFFSET, _RETIRED)
+        self._buf = None
+        self.shm.close()
+        self.shm.unlink()
+        self._create(f, self.name)
+
+    def _on_transition(self, f:fsm, origin:int, dest:int, tid:int, timestamp:float) -> None:
+        self._origin = origin
+        self._tid = tid
+        self._timestamp = timestamp
+        self._transitions += 1
+        self._pending = tid
+
+    def publish(self, f:fsm) -> None:
+        """
+        Writes current state of f into the block (step listener).
+
+        """
+        buf = self._buf
+        seq = self._seq + 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, seq)
+        if (tid := self._pending) >= 0:
+            self._counts[tid] += 1
+            _SEQ.pack_into(buf, _COUNTERS_OFFSET + 8 * tid, self._counts[tid])
+            self._pending = -1
+        _PAYLOAD.pack_into(buf, _PAYLOAD_OFFSET, f.state, self._origin, self._tid,
+                           f.step_count, self._timestamp, self._transitions)
+        self._seq = seq + 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, self._seq)
+
+    def close(self, unlink:bool = False) -> None:
+        """
+        Stops publishing and closes the block.
+
+        :param unlink: If True the block is destroyed, monitors must not use it anymore.
+        :type unlink: bool
+        :return: None
+        :rtype: None
+
+        """
+        if self._buf is None:
+            return
+        self.fsm.del_transition_listener(self._on_transition)
+        self.fsm.del_step_listener(self.publish)
+        if self._on_swap in self.fsm.swap_listeners:
+            self.fsm.swap_listeners.remove(self._on_swap)
+        self._buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+    def __enter__(self) -> 'fsm_shm_publisher':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close(unlink=True)
+
+
+class fsm_shm_monitor:
+    """
+    Reads live state published by fsm_shm_publisher, from any process.
+    When the publisher retires its block (fsm.hot_swap()), the next read
+    attaches to the new one and states, transitions follow the new
+    definition.
+
+    """
+
+    def __init__(self, name:str, reattach_timeout:float = 1.0) -> None:
+        """
+        Constructor: attaches to an existing block.
+
+        :param name: Shared memory block name.
+        :type name: str
+        :param reattach_timeout: Seconds a read waits for the block replacing a retired one.
+        :type reattach_timeout: float
+
+        """
+        self.name = name
+        self.reattach_timeout = reattach_timeout
+        self.retries = 0
+        self._attach()
+
+    def _open(self) -> shared_memory.SharedMemory:
+        name = self.name
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13: the block must not be registered to resource tracker, 
+            # otherwise it is destroyed when the monitor process exits
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                return shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+
+    def _attach(self) -> None:
+        self.shm = self._open()
+        buf = self.shm.buf
+        magic, version, n_states, n_transitions, meta_len = _HEADER.unpack_from(buf, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION:
+            self.shm.close()
+            raise FSMSharedMemoryError(f'{self.name} is not a pyfsm shared memory block')
+        meta_offset = _COUNTERS_OFFSET + 8 * n_transitions
+        meta = json.loads(bytes(buf[meta_offset:meta_offset + meta_len]))
+        self.states : List[str] = meta['states']
+        self.transitions : List[str] = meta['transitions']
+        self._counters_end = meta_offset
+
+    def _reattach(self) -> None:
+        # Retired block: the publisher is creating its replacement under the same name
+        self.shm.close()
+        deadline = time.monotonic() + self.reattach_timeout
+        while True:
+            try:
+                self._attach()
+                return
+            except (FileNotFoundError, FSMSharedMemoryError) as e:
+                if time.monotonic() > deadline:
+                    raise FSMSharedMemoryError(f'{self.name} was retired and not replaced: {e}')
+                time.sleep(0.001)
+
+    def read_raw(self, spin:int = 1000) -> Any:
+        """
+        Reads a consistent copy of payload and counters.
+
+        :param spin: Attempts before sleeping shortly between attempts.
+        :type spin: int
+        :return: (state, origin, transition, step, timestamp, transitions, counters bytes)
+        :rtype: tuple
+
+        """
+        buf = self.shm.buf
+        attempt = 0
+        while True:
+            seq = _SEQ.unpack_from(buf, _SEQ_OFFSET)[0]
+            if seq & 1 == 0:
+                payload = _PAYLOAD.unpack_from(buf, _PAYLOAD_OFFSET)
+                counters = bytes(buf[_COUNTERS_OFFSET:self._counters_end])
+                if _SEQ.unpack_from(buf, _SEQ_OFFSET)[0] == seq:
+                    return payload + (counters,)
+            elif seq == _RETIRED:
+                self._reattach()
+                buf = self.shm.buf
+                continue
+            self.retries += 1
+            attempt += 1
+            if attempt > spin:
+                time.sleep(0)
+
+    def read(self) -> fsm_live_state:
+        """
+        Reads a consistent snapshot of the published machine.
+
+        :return: Live state
+        :rtype: fsm_live_state
+
+        """
+        state, origin, tid, step, timestamp, transitions, counters = self.read_raw()
+        counts = np.frombuffer(counters, dtype='<u8')
+        return fsm_live_state(state=self.states[state],
+                              origin=self.states[origin] if origin >= 0 else None,
+                              transition=self.transitions[tid] if tid >= 0 else None,
+                              step=step, timestamp=timestamp, transitions=transitions,
+                              counters=dict(zip(self.transitions, counts.tolist())))
+
+    def close(self) -> None:
+        """
+        Detaches from the block.
+
+        :return: None
+        :rtype: None
+
+        """
+        self.shm.close()
+
+    def __enter__(self) -> 'fsm_shm_monitor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+if __name__ == '__main__':
+    import multiprocessing
+
+    def monitor(name:str, n:int) -> None:
+        with fsm_shm_monitor(name) as mon:
+            for _ in range(n):
+                s = mon.read()
+                assert sum(s.counters.values()) == s.transitions
+                time.sleep(0.05)
+            print(s)
+            print(f'monitor retries: {mon.retries}')
+
+    f = fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => C : t1')
+    f.add_transition('C => A : t2')
+    f.add_condition('t0', 'True')
+    f.add_condition('t1', 'True')
+    f.add_condition('t2', 'True')
+    f.compile()
+
+    with fsm_shm_publisher(f) as pub:
+        p = multiprocessing.Process(target=monitor, args=(pub.name, 10))
+        p.start()
+        while p.is_alive():
+            f.step()
+        p.join()
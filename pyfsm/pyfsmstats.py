@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmstats.py
+
+Module for runtime statistics of finite state machines as pyfsm module part.
+Time spent in every state (total, visits and log-bucketed histogram) and the
+number of times every transition was taken are updated in constant time per
+transition, and read as consistent snapshots, optionally resetting them.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import math
+    import threading
+    import numpy as np
+    import pandas as pd
+    from array import array
+    from dataclasses import dataclass
+    from typing import List
+    from typing import Tuple
+    from pyfsm import fsm
+    from pyfsm import FSMException
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+@dataclass
+class fsm_stats_snapshot:
+    """
+    Statistics read from fsm_stats.
+
+    :ivar states: State names, index of dwell arrays.
+    :ivar transitions: Transition names by id, index of edge_counts.
+    :ivar edges: (origin, destination) state indexes by transition id.
+    :ivar dwell_total: Seconds spent in every state, finished visits only.
+    :ivar visits: Finished visits of every state.
+    :ivar histogram: Finished visits by state (rows) and dwell bucket (columns).
+    :ivar bucket_bounds: Upper bound in seconds of every histogram bucket, last one is inf.
+    :ivar edge_counts: Number of times every transition was taken.
+    :ivar state: Current state index.
+    :ivar dwell_current: Seconds spent in current state so far, not in the accumulators.
+    :ivar elapsed: Seconds covered by the snapshot (since attach or last reset).
+    """
+    states : List[str]
+    transitions : List[str]
+    edges : List[Tuple[int, int]]
+    dwell_total : np.ndarray
+    visits : np.ndarray
+    histogram : np.ndarray
+    bucket_bounds : np.ndarray
+    edge_counts : np.ndarray
+    state : int
+    dwell_current : float
+    elapsed : float
+
+    @property
+    def dwell_mean(self) -> np.ndarray:
+        """
+        Mean seconds per finished visit of every state (0 if never left).
+
+        """
+        return np.divide(self.dwell_total, self.visits, out=np.zeros_like(self.dwell_total),
+                         where=self.visits > 0)
+
+    @property
+    def transition_matrix(self) -> np.ndarray:
+        """
+        Transition counts as a states x states matrix (origin rows, destination columns).
+
+        """
+        m = np.zeros((len(self.states), len(self.states)), dtype=np.int64)
+        if self.edges:
+            origin, dest = np.array(self.edges, dtype=np.int64).T
+            np.add.at(m, (origin, dest), self.edge_counts)
+        return m
+
+    def quantile(self, state:str, q:float) -> float:
+        """
+        Estimates a dwell time quantile of a state from its histogram, as the
+        upper bound of the bucket reaching q.
+
+        :param state: State name.
+        :type state: str
+        :param q: Quantile in [0, 1].
+        :type q: float
+        :return: Seconds, nan if the state was never left.
+        :rtype: float
+
+        """
+        row = self.histogram[self.states.index(state)]
+        total = row.sum()
+        if total == 0:
+            return math.nan
+        k = int(np.searchsorted(np.cumsum(row), q * total))
+        return float(self.bucket_bounds[min(k, len(row) - 1)])
+
+    def states_frame(self) -> pd.DataFrame:
+        """
+        Exports dwell statistics per state.
+
+        :return: Table indexed by state (categorical) with columns visits, dwell_total, dwell_mean.
+        :rtype: pd.DataFrame
+
+        """
+        index = pd.CategoricalIndex(self.states, categories=self.states, name='state')
+        return pd.DataFrame({'visits': self.visits, 'dwell_total': self.dwell_total,
+                             'dwell_mean': self.dwell_mean}, index=index)
+
+    def edges_frame(self) -> pd.DataFrame:
+        """
+        Exports transition counters.
+
+        :return: Columns transition, origin, dest (categoricals) and count, one row per transition id.
+        :rtype: pd.DataFrame
+
+        """
+        edges = np.array(self.edges, dtype=np.int32).reshape(-1, 2)
+        return pd.DataFrame({
+            'transition': pd.Categorical(self.transitions, categories=self.transitions),
+            'origin': pd.Categorical.from_codes(edges[:, 0], categories=self.states),
+            'dest': pd.Categorical.from_codes(edges[:, 1], categories=self.states),
+            'count': self.edge_counts})
+
+
+class fsm_stats:
+    """
+    Maintains dwell time and transition frequency statistics of a compiled
+    machine from its transitions, with constant work per transition: the
+    visit of the origin state is added to its total, counter and histogram
+    bucket, and the transition counter is incremented. Steps without
+    transition cost nothing.
+
+    Dwell histograms are log2-bucketed: bucket 0 holds visits shorter than
+    resolution, bucket k visits in [resolution*2**(k-1), resolution*2**k),
+    and the last one all longer visits. Times come from the machine clock.
+
+    Example:
+
+        stats = fsm_stats(f)
+        ...                                   # f.step() as usual
+        snap = stats.snapshot(reset=True)     # e.g. once per minute
+        print(dict(zip(snap.states, snap.dwell_mean)))
+        print(snap.transition_matrix)
+
+    """
+
+    def __init__(self, f:fsm, resolution:float = 1e-6, buckets:int = 40) -> None:
+        """
+        Constructor: attaches the statistics to f.
+
+        :param f: Compiled machine.
+        :type f: fsm
+        :param resolution: Upper bound in seconds of first histogram bucket.
+        :type resolution: float
+        :param buckets: Number of histogram buckets.
+        :type buckets: int
+
+        """
+        if resolution <= 0 or buckets < 2:
+            raise FSMException('resolution must be positive and buckets at least 2')
+        self.fsm = f
+        self.resolution = resolution
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._allocate()
+        f.add_transition_listener(self._on_transition)
+        f.swap_listeners.append(self._on_swap)
+        f.reset_listeners.append(self._on_reset)
+
+    def _allocate(self) -> None:
+        f = self.fsm
+        n = len(f.states)
+        self._names = sorted(f.transition_ids, key=f.transition_ids.get)
+        self._edges = list(f.transition_edges)
+        self._dwell = array('d', bytes(8 * n))
+        self._visits = array('q', bytes(8 * n))
+        self._hist = array('q', bytes(8 * n * self.buckets))
+        self._counts = array('q', bytes(8 * len(self._edges)))
+        self._state = f.state
+        self._start = self._entered = f.clock.monotonic()
+
+    def _on_transition(self, f:fsm, origin:int, dest:int, tid:int, timestamp:float) -> None:
+        with self._lock:
+            # Origin differs after recovery or replay: its entry time is unknown
+            if origin == self._state:
+                dwell = timestamp - self._entered
+                self._dwell[origin] += dwell
+                self._visits[origin] += 1
+                k = math.frexp(dwell / self.resolution)[1] if dwell > 0 else 0
+                self._hist[origin * self.buckets + min(max(k, 0), self.buckets - 1)] += 1
+            self._counts[tid] += 1
+            self._state = dest
+            self._entered = timestamp
+
+    def _on_reset(self, f:fsm) -> None:
+        # The machine is back to its entry point, current visit starts now
+        with self._lock:
+            self._state = f.state
+            self._entered = f.clock.monotonic()
+
+    def _on_swap(self, f:fsm) -> None:
+        # Accumulators depend on the definition: data is discarded after fsm.hot_swap()
+        with self._lock:
+            self._allocate()
+
+    def bucket_bounds(self) -> np.ndarray:
+        """
+        Upper bound in seconds of every histogram bucket.
+
+        :return: Array of buckets bounds, last one is inf.
+        :rtype: np.ndarray
+
+        """
+        bounds = self.resolution * np.exp2(np.arange(self.buckets, dtype=np.float64))
+        bounds[-1] = np.inf
+        return bounds
+
+    def snapshot(self, reset:bool = False) -> fsm_stats_snapshot:
+        """
+        Copies current statistics. May be called from any thread.
+
+        :param reset: If True accumulators are cleared in the same critical section (reset-on-read).
+        :type reset: bool
+        :return: Statistics
+        :rtype: fsm_stats_snapshot
+
+        """
+        with self._lock:
+            n = len(self._visits)
+            now = self.fsm.clock.monotonic()
+            snap = fsm_stats_snapshot(states=list(self.fsm.states), transitions=list(self._names),
+                                      edges=list(self._edges),
+                                      dwell_total=np.frombuffer(self._dwell, dtype=np.float64).copy(),
+                                      visits=np.frombuffer(self._visits, dtype=np.int64).copy(),
+                                      histogram=np.frombuffer(self._hist, dtype=np.int64).reshape(n, self.buckets).copy(),
+                                      bucket_bounds=self.bucket_bounds(),
+                                      edge_counts=np.frombuffer(self._counts, dtype=np.int64).copy(),
+                                      state=self._state, dwell_current=now - self._entered,
+                                      elapsed=now - self._start)
+            if reset:
+                self._clear(now)
+        return snap
+
+    def counters(self) -> Tuple[int, List[str], List[int]]:
+        """
+        Reads current state and transition counters without locking, for
+        frequent readers as metrics scrapers. Counters may be one transition 
+        apart from each other.
+
+        :return: (current state index, transition names by id, counts by id)
+        :rtype: Tuple[int, List[str], List[int]]
+
+        """
+        return self._state, self._names, self._counts.tolist()
+
+    def _clear(self, now:float) -> None:
+        for a in (self._dwell, self._visits, self._hist, self._counts):
+            a[:] = array(a.typecode, bytes(len(a) * a.itemsize))
+        self._start = now
+
+    def reset(self) -> None:
+        """
+        Clears accumulators. Time spent in current state so far is kept.
+
+        :return: None
+        :rtype: None
+
+        """
+        with self._lock:
+            self._clear(self.fsm.clock.monotonic())
+
+    def close(self) -> None:
+        """
+        Stops collecting statistics.
+
+        :return: None
+        :rtype: None
+
+        """
+        self.fsm.del_transition_listener(self._on_transition)
+        if self._on_swap in self.fsm.swap_listeners:
+            self.fsm.swap_listeners.remove(self._on_swap)
+        if self._on_reset in self.fsm.reset_listeners:
+            self.fsm.reset_listeners.remove(self._on_reset)
+
+    def __enter__(self) -> 'fsm_stats':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+if __name__ == '__main__':
+    import time
+
+    f = fsm()
+    f.add_transition('IDLE => RUN : start')
+    f.add_transition('RUN => IDLE : stop')
+    f.add_transition('RUN => ALARM : overheat')
+    f.add_transition('ALARM => IDLE : cooled')
+    f.add_condition('start', 'self.x < 0.5')
+    f.add_condition('stop', 'self.x < 0.3')
+    f.add_condition('overheat', 'self.x > 0.95')
+    f.add_condition('cooled', 'self.x < 0.5')
+    f.compile()
+
+    rng = np.random.default_rng(0)
+    with fsm_stats(f, resolution=1e-6) as stats:
+        for x in rng.random(100000):
+            f.x = x
+            f.step()
+        snap = stats.snapshot(reset=True)
+    print(dict(zip(snap.states, snap.visits.tolist())))
+    print(dict(zip(snap.states, (snap.dwell_mean * 1e6).round(1).tolist())))
+    print(snap.transition_matrix)
+    print(snap.edges_frame())
+    print(f'p90 RUN {snap.quantile("RUN", 0.9) * 1e6:.0f} us')
+    assert snap.edge_counts.sum() == snap.visits.sum()
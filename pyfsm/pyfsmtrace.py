@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pyfsmtrace.py
+
+Module for recording every transition of finite state machines as pyfsm module
+part. Transitions are packed as fixed-size binary records into a preallocated
+buffer, flushed to memory-mapped rotating files and read back as NumPy
+structured arrays.
+
+Author: Raul Alvarez
+Email: ralvarezb78@gmail.com
+Version: 1.0.0
+Date: 2025-06-15
+License: MIT
+
+Copyright (c) 2025 Raul Alvarez
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+__author__    = "Raul ALvarez"
+__email__     = "ralvarezb78@gmail.com"
+__version__   = "1.0.0"
+__license__   = "MIT"
+__date__      = "2025-06-15"
+
+import logging
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    logger.addHandler(logging.NullHandler())
+try:
+    import os
+    import re
+    import mmap
+    import struct
+    import numpy as np
+    import pandas as pd
+    from typing import Any
+    from typing import List
+    from typing import Optional
+    from typing import Sequence
+    from typing import Union
+    from pyfsm import fsm
+    from pyfsm import FSMException
+except Exception as e:
+    logger.error(e)
+    raise e
+
+
+# Record layout: timestamp (clock.monotonic()), step number, origin state,
+# destination state, transition id (see fsm.transition_ids)
+TRACE_DTYPE = np.dtype([('timestamp', '<f8'), ('step', '<u8'), ('origin', '<u2'),
+                        ('dest', '<u2'), ('transition', '<u4')])
+_RECORD = struct.Struct('<dQHHI')
+assert _RECORD.size == TRACE_DTYPE.itemsize
+
+# File header: magic, version, record size, number of valid records
+TRACE_MAGIC = b'PYFSMTRC'
+TRACE_VERSION = 1
+_HEADER = struct.Struct('<8sIIQ8x')
+
+
+class FSMTraceError(FSMException):
+    pass
+
+
+class fsm_trace_recorder:
+    """
+    Records transitions of attached machines as fixed-size binary records
+    (see TRACE_DTYPE). Records are packed into a preallocated buffer of
+    buffer_records and copied to a memory-mapped file when it is full or on
+    flush(). Each file holds file_records records; when full, recording goes
+    on with the next file path.0, path.1, ... keeping the last max_files.
+
+    Example:
+
+        with fsm_trace_recorder('run.trace') as rec:
+            rec.attach(f)
+            for _ in range(1000000):
+                f.step()
+        trace = read_trace('run.trace')      # all files in order
+        names = np.array(f.states)[trace['dest']]
+
+    """
+
+    def __init__(self, path:str, buffer_records:int = 4096, file_records:int = 1 << 20,
+                 max_files:Optional[int] = 4) -> None:
+        """
+        Constructor:
+
+        :param path: Base path of trace files, numbered path.0, path.1, ...
+        :type path: str
+        :param buffer_records: Records kept in memory before copying to file.
+        :type buffer_records: int
+        :param file_records: Capacity of every file in records.
+        :type file_records: int
+        :param max_files: Files kept on disk, older ones are removed. All if None.
+        :type max_files: None or int
+
+        """
+        if file_records < buffer_records:
+            raise FSMTraceError('file_records must be greater or equal than buffer_records')
+        self.path = path
+        self.buffer_records = buffer_records
+        self.file_records = file_records
+        self.max_files = max_files
+        self.files : List[str] = []
+        self.records = 0
+        self._buffer = bytearray(buffer_records * _RECORD.size)
+        self._buffer_bytes = len(self._buffer)
+        self._offset = 0
+        self._pack = _RECORD.pack_into
+        self._index = 0
+        self._fd : Optional[Any] = None
+        self._map : Optional[mmap.mmap] = None
+        self._count = 0
+        self._machines : List[fsm] = []
+
+    def attach(self, f:fsm) -> None:
+        """
+        Starts recording transitions of machine f.
+
+        :param f: Machine to record.
+        :type f: fsm
+        :return: None
+        :rtype: None
+
+        """
+        f.add_transition_listener(self.record)
+        self._machines.append(f)
+
+    def detach(self, f:fsm) -> None:
+        """
+        Stops recording transitions of machine f.
+
+        :param f: Recorded machine.
+        :type f: fsm
+        :return: None
+        :rtype: None
+
+        """
+        f.del_transition_listener(self.record)
+        self._machines.remove(f)
+
+    def record(self, f:fsm, origin:int, dest:int, tid:int, timestamp:float) -> None:
+        """
+        Transition listener: appends one record to buffer.
+
+        """
+        self._pack(self._buffer, self._offset, timestamp, f.step_count, origin, dest, tid)
+        self._offset += _RECORD.size
+        if self._offset == self._buffer_bytes:
+            self.flush()
+
+    def _open(self) -> None:
+        name = f'{self.path}.{self._index}'
+        size = _HEADER.size + self.file_records * _RECORD.size
+        self._fd = open(name, 'w+b')
+        self._fd.truncate(size)
+        self._map = mmap.mmap(self._fd.fileno(), size)
+        self._count = 0
+        _HEADER.pack_into(self._map, 0, TRACE_MAGIC, TRACE_VERSION, _RECORD.size, 0)
+        self.files.append(name)
+        self._index += 1
+        if self.max_files is not None:
+            while len(self.files) > self.max_files:
+                os.remove(self.files.pop(0))
+
+    def _close_file(self) -> None:
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._fd.close()
+            self._map = None
+            self._fd = None
+
+    def flush(self) -> None:
+        """
+        Copies buffered records to the trace file, rotating it when full.
+
+        :return: None
+        :rtype: None
+
+        """
+        data = memoryview(self._buffer)[:self._offset]
+        while len(data) > 0:
+            if self._map is None or self._count == self.file_records:
+                self._close_file()
+                self._open()
+            n = min(len(data) // _RECORD.size, self.file_records - self._count)
+            start = _HEADER.size + self._count * _RECORD.size
+            self._map[start:start + n * _RECORD.size] = data[:n * _RECORD.size]
+            self._count += n
+            self.records += n
+            data = data[n * _RECORD.size:]
+            # Count is updated after data, so readers never see partial records
+            _HEADER.pack_into(self._map, 0, TRACE_MAGIC, TRACE_VERSION, _RECORD.size, self._count)
+        self._offset = 0
+
+    def close(self) -> None:
+        """
+        Flushes pending records, closes current file and detaches all machines.
+
+        :return: None
+        :rtype: None
+
+        """
+        for f in list(self._machines):
+            self.detach(f)
+        self.flush()
+        self._close_file()
+
+    def __enter__(self) -> 'fsm_trace_recorder':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def trace_files(path:str) -> List[str]:
+    """
+    Gets trace files of base path in recording order.
+
+    :param path: Base path given to fsm_trace_recorder.
+    :type path: str
+    :return: List of file names.
+    :rtype: List[str]
+
+    """
+    folder = os.path.dirname(path) or '.'
+    pattern = re.compile(re.escape(os.path.basename(path)) + r'\.(\d+)$')
+    found = [(int(m.group(1)), os.path.join(os.path.dirname(path), name))
+             for name in os.listdir(folder) if (m := pattern.match(name))]
+    return [name for _, name in sorted(found)]
+
+
+def read_trace(path:Union[str, List[str]]) -> np.ndarray:
+    """
+    Reads recorded transitions.
+
+    :param path: Trace file, list of trace files or base path given to fsm_trace_recorder.
+    :type path: str or List[str]
+    :return: Structured array of TRACE_DTYPE with fields timestamp, step, origin, dest, transition.
+    :rtype: np.ndarray
+
+    """
+    if isinstance(path, str):
+        files = [path] if os.path.isfile(path) else trace_files(path)
+    else:
+        files = list(path)
+    chunks = []
+    for name in files:
+        with open(name, 'rb') as fd:
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, size, count = _HEADER.unpack_from(mm, 0)
+                if magic != TRACE_MAGIC or version != TRACE_VERSION or size != _RECORD.size:
+                    raise FSMTraceError(f'{name} is not a valid trace file')
+                chunks.append(np.frombuffer(mm, dtype=TRACE_DTYPE, count=count,
+                                            offset=_HEADER.size).copy())
+    if not chunks:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.concatenate(chunks)
+
+
+def trace_frame(trace:np.ndarray, states:Sequence[str], transitions:Sequence[str]) -> pd.DataFrame:
+    """
+    Converts a trace to a DataFrame. Numeric fields are taken from the
+    structured array as columns; origin, dest and transition become
+    categoricals over the given names, sharing the recorded integer codes.
+
+    :param trace: Trace as returned by read_trace().
+    :type trace: np.ndarray
+    :param states: State names of the recording machine (fsm.states).
+    :type states: Sequence[str]
+    :param transitions: Transition names by id of the recording machine.
+    :type transitions: Sequence[str]
+    :return: Columns timestamp, step, origin, dest, transition.
+    :rtype: pd.DataFrame
+
+    Example:
+
+        df = trace_frame(read_trace('run.trace'), f.states,
+                         sorted(f.transition_ids, key=f.transition_ids.get))
+        df.groupby('transition', observed=False).size()
+
+    """
+    return pd.DataFrame({
+        'timestamp': trace['timestamp'],
+        'step': trace['step'],
+        'origin': pd.Categorical.from_codes(trace['origin'].astype(np.int32), categories=list(states)),
+        'dest': pd.Categorical.from_codes(trace['dest'].astype(np.int32), categories=list(states)),
+        'transition': pd.Categorical.from_codes(trace['transition'].astype(np.int32),
+                                                categories=list(transitions)),
+    })
+
+
+if __name__ == '__main__':
+    import time
+    import tempfile
+
+    f = fsm()
+    f.add_transition('A => B : t0')
+    f.add_transition('B => C : t1')
+    f.add_transition('C => A : t2')
+    f.add_condition('t0', 'True')
+    f.add_condition('t1', 'True')
+    f.add_condition('t2', 'True')
+    f.compile()
+
+    base = os.path.join(tempfile.mkdtemp(), 'demo.trace')
+    N = 300000
+    with fsm_trace_recorder(base, file_records=100000, max_files=None) as rec:
+        rec.attach(f)
+        t0 = time.perf_counter()
+        for _ in range(N):
+            f.step()
+        t1 = time.perf_counter()
+    trace = read_trace(base)
+    print(f'{N} steps in {t1-t0:.2f} s, {len(trace)} records in {len(trace_files(base))} files')
+    print(np.array(f.states)[trace['dest'][:6]])
+    df = trace_frame(trace, f.states, sorted(f.transition_ids, key=f.transition_ids.get))
+    print(df['transition'].value_counts())
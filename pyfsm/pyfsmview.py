@@ -59,7 +59,13 @@ try:
     from queue import Queue 
     from pyfsm import fsm
     from pyfsm import fsm_bindings
+    from pyfsm import fixed_rate_scheduler
+    from pyfsm import virtual_clock
+    from pyfsmasync import async_fsm
     from pyfsmgraph import dynamic_graph
+    from pyfsmmetrics import fsm_metrics
+    from pyfsmmetrics import latency_histogram
+    from pyfsmmetrics import CONTENT_TYPE
     import time 
     import json 
 except Exception as e: 
@@ -68,7 +74,8 @@ except Exception as e:
 
 class pyfsm_http_visualizer: 
     def __init__(self, http_port:int=8000, ws_port:int=8765, ws_host : str = 'localhost',
-                 html_template : str ='./template/index.html', mode : str = 'ligth')->None:
+                 html_template : str ='./template/index.html', mode : str = 'ligth',
+                 metrics_latency : bool = False)->None:
         """ 
         Constructor: 
         
@@ -84,6 +91,9 @@ class pyfsm_http_visualizer:
         :param mode: Color theme 'ligth' or 'dark'
         :type mode: str
 
+        :param metrics_latency: If True /metrics includes guard and action latency histograms (profiles the FSM).
+        :type metrics_latency: bool
+
         :return: None
         :rtype: None
 
@@ -100,7 +110,11 @@ class pyfsm_http_visualizer:
         self.fsmbind : fsm_bindings = fsm_bindings() 
         self.tasks : List[Callable[...,Awaitable[Any]]] = []
         self.dgraph : Optional[dynamic_graph] = None 
+        self.scheduler : Optional[fixed_rate_scheduler] = None
         self._mode : str = mode 
+        self.metrics_latency : bool = metrics_latency
+        self.metrics : Optional[fsm_metrics] = None
+        self.render_latency : Optional[latency_histogram] = None
 
     def bind(self, f: fsm)->None:
         """ Binds http visualizer to Finite State machine 
@@ -113,37 +127,203 @@ class pyfsm_http_visualizer:
         self.fsm_instance = f
         self.fsm_instance.binding = self.fsmbind
         self.dgraph = dynamic_graph(f, mode = self._mode)
+        f.swap_listeners.append(self._on_swap)
+        self.metrics = fsm_metrics(f, latency=self.metrics_latency)
+        self.metrics.add_gauge('pyfsm_websocket_clients', 'Connected websocket clients.', 
+                               lambda: len(self.clients))
+        self.render_latency = self.metrics.add_histogram('pyfsm_render_duration_seconds', 
+                                                         'SVG render time.')
+
+    def _on_swap(self, f: fsm)->None:
+        """
+        Swap listener: rebuilds the graph after fsm.hot_swap() and notifies clients.
+
+        """
+        self.dgraph = dynamic_graph(f, mode = self._mode)
+        self.fsmbind.q_output.put(True)
 
     
     def _run(self): 
         """
         Internal method called by run_fsm(): Runs FSM inside a thread on two possible fashions:
-        - Free running with sleep 
+        - Free running at fixed rate of fsmbind.sleep_time (see self.scheduler for jitter and overruns)
         - Step by step throug event
 
+        The thread blocks on fsmbind.wait_command() and wakes up as soon as a
+        command is sent with fsmbind.send() (see fsm_bindings CMD_*).
+
         :return: None 
         :rtype: None 
 
         """
         logger.info("_run() method started...")
+        bind = self.fsmbind
+        clock = self.fsm_instance.clock
+        self.scheduler = fixed_rate_scheduler(bind.sleep_time, clock=clock,
+                                              policy=bind.overrun_policy)
         # main running loop: while ev_running is set. 
-        while self.fsmbind.ev_running.is_set():
-            if self.fsmbind.ev_async_flag.is_set: 
-                if self.fsmbind.ev_loop_flag.is_set():
-                    self.fsm_instance.step()
-                    if len(self.fsm_instance.true_transitions_name) > 0:
-                        self.fsmbind.q_output.put(True)
-                        # print("Transition to queue")
-                time.sleep(self.fsmbind.sleep_time)
+        while bind.ev_running.is_set():
+            for _ in range(self._process_commands()):
+                self._step()
+            if not bind.ev_running.is_set():
+                break
+            if bind.ev_async_flag.is_set(): 
+                if self.scheduler.period != bind.sleep_time:
+                    self.scheduler.restart(bind.sleep_time)
+                if (remaining := self.scheduler.remaining()) > 0:
+                    if isinstance(clock, virtual_clock):
+                        clock.sleep(remaining)
+                    elif bind.wait_command(remaining) or self.scheduler.remaining() > 0:
+                        # command or wakeup arrived before deadline, process it first
+                        continue
+                if (dropped := self.scheduler.tick()) > 0:
+                    logger.warning(f"FSM step overrun, {dropped} tick(s) skipped")
+                if bind.ev_loop_flag.is_set():
+                    self._step()
             else:
                 #otherwise if no free running option is set, 
                 # we check if loop flag is set, then executes one step
-                # finally clears the flag and waits for some amount of time
-                if self.fsmbind.ev_loop_flag.is_set():
-                    self.fsm_instance.step()
-                    self.fsmbind.ev_loop_flag.clear()
-                time.sleep(self.fsmbind.sleep_async)
+                # and clears the flag, or waits for a command. 
+                # Timeout only bounds the time to notice ev_running cleared.
+                if bind.ev_loop_flag.is_set():
+                    self._step()
+                    bind.ev_loop_flag.clear()
+                else:
+                    bind.wait_command(bind.sleep_async, loop_flag=True)
+
+    def _step(self):
+        """
+        Executes one step on FSM and notifies transitions to transmit().
 
+        """
+        self.fsm_instance.step()
+        if len(self.fsm_instance.true_transitions_name) > 0:
+            self.fsmbind.q_output.put(True)
+
+    def _process_commands(self):
+        """
+        Processes pending fsm_bindings commands:
+
+        - CMD_START / CMD_STOP : allow / stop running steps (ev_loop_flag)
+        - CMD_STEP : requests one step
+        - CMD_RESET : resets FSM
+        - CMD_QUIT : exits from running thread
+        - CMD_TIME_TRIGGER / CMD_EVENT_TRIGGER : fixed rate or step by step mode
+        - CMD_GET_TRIGGER : replies MSG_TRIGGER_TIME or MSG_TRIGGER_EVENT on q_reply
+        - CMD_SET_SLEEP / CMD_GET_SLEEP : sets / replies period of fixed rate mode
+        - CMD_SWAP : applies definition scheduled by fsm.hot_swap()
+
+        :return: Number of steps requested, executed by caller.
+        :rtype: int
+
+        """
+        bind = self.fsmbind
+        steps = 0
+        while not bind.q_command.empty():
+            cmd, value = bind.q_command.get()
+            logger.info(f"Command {cmd} {value if value is not None else ''}")
+            if cmd == bind.CMD_START:
+                bind.ev_loop_flag.set()
+            elif cmd == bind.CMD_STOP:
+                bind.ev_loop_flag.clear()
+            elif cmd == bind.CMD_STEP:
+                steps += 1
+            elif cmd == bind.CMD_RESET:
+                self.fsm_instance.reset()
+                bind.q_output.put(True)
+            elif cmd == bind.CMD_QUIT:
+                bind.ev_running.clear()
+            elif cmd == bind.CMD_TIME_TRIGGER:
+                bind.ev_async_flag.set()
+                if self.scheduler is not None:
+                    self.scheduler.restart()
+            elif cmd == bind.CMD_EVENT_TRIGGER:
+                bind.ev_async_flag.clear()
+            elif cmd == bind.CMD_GET_TRIGGER:
+                bind.q_reply.put(bind.MSG_TRIGGER_TIME if bind.ev_async_flag.is_set()
+                                 else bind.MSG_TRIGGER_EVENT)
+            elif cmd == bind.CMD_SET_SLEEP:
+                bind.sleep_time = float(value)
+                if self.scheduler is not None:
+                    self.scheduler.restart(bind.sleep_time)
+            elif cmd == bind.CMD_GET_SLEEP:
+                bind.q_reply.put(bind.sleep_time)
+            elif cmd == bind.CMD_SWAP:
+                self.fsm_instance.apply_swap()
+            else:
+                logger.warning(f"Unknown command {cmd}")
+        return steps
+
+    async def _run_async(self): 
+        """
+        Coroutine counterpart of _run() for async_fsm instances: runs FSM on 
+        the event loop instead of a thread. It waits on an asyncio.Event set
+        by fsmbind.wakeup() (commands and ev_loop_flag), from any thread.
+
+        :return: Coroutine object
+        :rtype: Coroutine
+
+        """
+        logger.info("_run_async() method started...")
+        bind = self.fsmbind
+        clock = self.fsm_instance.clock
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        notify = lambda: loop.call_soon_threadsafe(wake.set)
+        bind.wakeup_callbacks.append(notify)
+        self.scheduler = fixed_rate_scheduler(bind.sleep_time, clock=clock,
+                                              policy=bind.overrun_policy)
+        try:
+            while bind.ev_running.is_set():
+                # Cleared before checking commands and flags: later wakeups are not lost
+                wake.clear()
+                for _ in range(self._process_commands()):
+                    await self._astep()
+                if not bind.ev_running.is_set():
+                    break
+                if bind.ev_async_flag.is_set(): 
+                    if self.scheduler.period != bind.sleep_time:
+                        self.scheduler.restart(bind.sleep_time)
+                    if (remaining := self.scheduler.remaining()) > 0:
+                        if isinstance(clock, virtual_clock):
+                            clock.sleep(remaining)
+                        elif await self._wait_wakeup(wake, remaining):
+                            continue
+                    if (dropped := self.scheduler.tick()) > 0:
+                        logger.warning(f"FSM step overrun, {dropped} tick(s) skipped")
+                    if bind.ev_loop_flag.is_set():
+                        await self._astep()
+                elif bind.ev_loop_flag.is_set():
+                    await self._astep()
+                    bind.ev_loop_flag.clear()
+                else:
+                    await self._wait_wakeup(wake, bind.sleep_async)
+        finally:
+            bind.wakeup_callbacks.remove(notify)
+
+    async def _astep(self):
+        """
+        Coroutine counterpart of _step().
+
+        """
+        await self.fsm_instance.step()
+        if len(self.fsm_instance.true_transitions_name) > 0:
+            self.fsmbind.q_output.put(True)
+
+    @staticmethod
+    async def _wait_wakeup(wake:asyncio.Event, timeout:float)->bool:
+        """
+        Waits until wake is set or timeout expires.
+
+        :return: True if woken up before timeout.
+        :rtype: bool
+
+        """
+        try:
+            await asyncio.wait_for(wake.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
 
     async def run_fsm(self, run_method_async: bool = True):
         """
@@ -162,7 +342,10 @@ class pyfsm_http_visualizer:
             self.fsmbind.ev_async_flag.clear()
 
         self.fsmbind.ev_running.set()
-        _ = await asyncio.to_thread(self._run)
+        if isinstance(self.fsm_instance, async_fsm):
+            await self._run_async()
+        else:
+            _ = await asyncio.to_thread(self._run)
 
 
     async def http_startup(self, param): 
@@ -176,9 +359,20 @@ class pyfsm_http_visualizer:
             html = await fd.read()
         return web.Response(text=html, content_type='text/html')
 
+    async def metrics_handle(self, request):
+        """
+        Serves FSM metrics in Prometheus text format, read from runtime counters.
+
+        """
+        if self.metrics is None:
+            raise web.HTTPNotFound(text='No FSM bound')
+        return web.Response(body=self.metrics.render().encode(), 
+                            headers={'Content-Type': CONTENT_TYPE})
+
     async def start_http_server(self):
         self.app = web.Application()
         self.app.router.add_get('/', self.http_handle)
+        self.app.router.add_get('/metrics', self.metrics_handle)
         css_path = os.path.abspath('./template/css')
         js_path = os.path.abspath('./template/js')
         print(css_path)
@@ -212,6 +406,13 @@ class pyfsm_http_visualizer:
         try:
             async for msg in websocket:
                 logger.info(f"Message from client {msg}")
+                # Commands from client: {"cmd": "<CMD_*>", "value": ...}
+                try:
+                    dd = json.loads(msg)
+                    if isinstance(dd, dict) and 'cmd' in dd:
+                        self.fsmbind.send(dd['cmd'], dd.get('value'))
+                except json.JSONDecodeError:
+                    pass
                 await asyncio.sleep(0)
         except websockets.exceptions.ConnectionClosedOK:
             logger.error(websockets.exceptions.ConnectionClosedOK)
@@ -238,6 +439,7 @@ class pyfsm_http_visualizer:
             except asyncio.exceptions.CancelledError: 
                 logger.error(asyncio.exceptions.CancelledError)
                 self.fsmbind.ev_running.clear()
+                self.fsmbind.send(self.fsmbind.CMD_QUIT)
 
     async def transmit(self):
         while self.fsmbind.ev_running.is_set():
@@ -252,7 +454,10 @@ class pyfsm_http_visualizer:
             if not self.fsmbind.q_output.empty():
                 _ = self.fsmbind.q_output.get()
                 if self.dgraph is not None:
+                    t0 = time.perf_counter()
                     msg = self.dgraph.build_svg()
+                    if self.render_latency is not None:
+                        self.render_latency.observe(time.perf_counter() - t0)
                     dd['svg'] = msg
                     # esto hay que mejorar
                     # if not self.fsmbind.q_input.empty(): 
@@ -277,7 +482,10 @@ class pyfsm_http_visualizer:
         else:
             self.fsmbind.ev_async_flag.clear()
         self.fsmbind.ev_running.set()
-        asyncio.create_task(asyncio.to_thread(self._run))
+        if isinstance(self.fsm_instance, async_fsm):
+            asyncio.create_task(self._run_async())
+        else:
+            asyncio.create_task(asyncio.to_thread(self._run))
 
         await asyncio.gather(
             self.start_http_server(),